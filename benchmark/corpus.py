@@ -0,0 +1,167 @@
+"""
+Synthetic corpus for the offline benchmarks: txt / md / pdf / docx / png files with
+random (seeded) content, written without network access or model weights.
+
+pdf and png files are written by hand (no extra libraries), docx needs python-docx
+(already used by the docx extractor) and is skipped without it.
+
+usage:
+    python -m benchmark.corpus --root /tmp/corpus --files 2000
+"""
+import argparse
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+WORDS = (
+    "search index vector query image text model embedding cluster graph report invoice "
+    "holiday beach mountain dog cat meeting notes budget design draft project summary "
+    "research paper network latency memory storage photo sunset city river forest car "
+    "train flight hotel recipe kitchen garden music concert ticket contract review"
+).split()
+
+# share of each file type in the corpus
+DEFAULT_MIX = {"txt": 0.3, "md": 0.2, "pdf": 0.15, "docx": 0.15, "png": 0.2}
+
+
+def sentence(rng, words: int) -> str:
+    return " ".join(rng.choice(WORDS, size=words)).capitalize() + "."
+
+
+def paragraphs(rng, count: int) -> list:
+    return [" ".join(sentence(rng, int(rng.integers(6, 16))) for _ in range(int(rng.integers(2, 6))))
+            for _ in range(count)]
+
+
+def write_txt(path: str, rng):
+    with open(path, "w") as file:
+        file.write("\n\n".join(paragraphs(rng, int(rng.integers(2, 8)))))
+
+
+def write_md(path: str, rng):
+    lines = [f"# {sentence(rng, 4)}"]
+    for para in paragraphs(rng, int(rng.integers(2, 6))):
+        lines += ["", f"## {sentence(rng, 3)}", "", para, "", f"- {sentence(rng, 5)}", f"- {sentence(rng, 5)}"]
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines))
+
+
+def write_pdf(path: str, rng):
+    """
+    Single page PDF with one text line per sentence (Helvetica , no compression)
+    """
+    text = " ".join(paragraphs(rng, 2)).split(". ")[:30]
+    stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(
+        "({}) '".format(line.replace("\\", "").replace("(", "").replace(")", "")) for line in text) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as file:
+        file.write(out)
+
+
+def write_docx(path: str, rng):
+    from docx import Document
+
+    document = Document()
+    document.add_heading(sentence(rng, 4), level=1)
+    for para in paragraphs(rng, int(rng.integers(2, 6))):
+        document.add_paragraph(para)
+    document.save(path)
+
+
+def write_png(path: str, rng, size: int = 256):
+    """
+    RGB PNG of smooth random colour blobs plus a little noise
+    """
+    y, x = np.mgrid[0:size, 0:size] / size
+    image = np.zeros((size, size, 3))
+    for _ in range(4):
+        cx, cy, radius = rng.random(3)
+        blob = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (0.05 + radius * 0.2))
+        image += blob[..., None] * rng.random(3)
+    image = 247 * image / image.max() + rng.integers(0, 8, size=image.shape)
+    image = image.astype("uint8")
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    # filter byte 0 in front of every row
+    raw = np.concatenate([np.zeros((size, 1), dtype="uint8"), image.reshape(size, -1)], axis=1).tobytes()
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)))
+        file.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        file.write(chunk(b"IEND", b""))
+
+
+WRITERS = {"txt": write_txt, "md": write_md, "pdf": write_pdf, "docx": write_docx, "png": write_png}
+
+
+def make_corpus(root: str, files: int, mix: dict = None, seed: int = 0, per_dir: int = 200) -> dict:
+    """
+    Function to write a synthetic corpus under root
+    args:
+        root:str = directory to write to (created)
+        files:int = number of files
+        mix:dict = extension -> share of the files (DEFAULT_MIX)
+        per_dir:int = files per sub directory
+    return:
+        dict(files = written paths , skipped = extension -> reason)
+    """
+    mix = mix or DEFAULT_MIX
+    rng = np.random.default_rng(seed)
+    skipped = {}
+    if "docx" in mix:
+        try:
+            import docx
+        except ImportError:
+            skipped["docx"] = "python-docx not installed"
+
+    exts = [ext for ext in mix if ext not in skipped]
+    shares = np.array([mix[ext] for ext in exts], dtype="float64")
+    choices = rng.choice(exts, size=files, p=shares / shares.sum())
+
+    written = []
+    for n, ext in enumerate(choices):
+        folder = os.path.join(root, f"dir_{n // per_dir:04d}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"file_{n:06d}.{ext}")
+        WRITERS[ext](path, rng)
+        written.append(path)
+    return {"files": written, "skipped": skipped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic benchmark corpus")
+    parser.add_argument("--root", type=str, required=True)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--mix", type=str, help='JSON extension -> share , e.g. \'{"txt": 1, "png": 1}\'')
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.root, args.files, json.loads(args.mix) if args.mix else None, args.seed)
+    print(f"{len(corpus['files'])} files written to {args.root}")
+    for ext, reason in corpus["skipped"].items():
+        print(f"skipped {ext}: {reason}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark of the fast (reduced resolution) image decode path against full decoding.
+
+Reports per image decode+preprocess time for both paths and how close the
+MobileCLIP embeddings of the two paths are (cosine similarity).
+
+usage:
+    python -m benchmark.decode_bench --dir ~/Pictures --limit 200
+    python -m benchmark.decode_bench --synthetic 20      # generated 24MP jpegs + pngs
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+import encoder.config as config
+import encoder.embedding as embedding
+
+
+def make_synthetic_images(out_dir: str, count: int, size=(6000, 4000)) -> list[str]:
+    """
+    Function to write camera sized test images (half jpeg , half png)
+    args:
+        out_dir:str = directory to write to
+        count:int = number of images
+        size:tuple = (width , height)
+    return:
+        list of image paths
+    """
+    rng = np.random.default_rng(0)
+    width, height = size
+    # smooth gradients plus a bit of noise , compresses like a photo rather than pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    paths = []
+    for i in range(count):
+        phase = rng.uniform(0, 1, size=3)
+        channels = [(x * (1 - p) + y * p) for p in phase]
+        pixels = np.stack(channels, axis=-1) + rng.normal(0, 8, size=(height, width, 3))
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+        ext = "jpg" if i % 2 == 0 else "png"
+        path = os.path.join(out_dir, f"synthetic_{i}.{ext}")
+        if ext == "jpg":
+            img.save(path, quality=90)
+        else:
+            img.save(path, compress_level=1)
+        paths.append(path)
+    return paths
+
+
+def collect_images(search_dir: str, limit: int) -> list[str]:
+    paths = []
+    for dirpath, _, filenames in os.walk(search_dir):
+        for filename in filenames:
+            if filename.split('.')[-1].lower() in config.SUPPORTED_EXT_IMG:
+                paths.append(os.path.join(dirpath, filename))
+                if len(paths) >= limit:
+                    return paths
+    return paths
+
+
+def time_decode(paths: list[str], fast_decode: bool) -> tuple[list[float], torch.Tensor]:
+    """
+    Decodes and preprocesses every image , returns per image seconds and the stacked model inputs
+    """
+    _, preprocess, _ = embedding.get_model()
+    timings = []
+    inputs = []
+    for path in paths:
+        start = time.perf_counter()
+        inputs.append(preprocess(embedding.load_image(path, fast_decode=fast_decode)))
+        timings.append(time.perf_counter() - start)
+    return timings, torch.stack(inputs)
+
+
+def encode(inputs: torch.Tensor) -> np.ndarray:
+    with torch.no_grad():
+        features = embedding.get_model()[0].encode_image(inputs)
+        features /= features.norm(dim=-1, keepdim=True)
+    return features.cpu().numpy()
+
+
+def summarize(timings: list[float]) -> dict:
+    return {
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast vs full image decode benchmark")
+    parser.add_argument("--dir", type=str, help="Directory with images to benchmark on")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate this many 24MP test images instead")
+    parser.add_argument("--limit", type=int, default=200, help="Max images taken from --dir")
+    parser.add_argument("--no-embed", action="store_true", help="Only time decoding , skip the embedding comparison")
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.synthetic:
+            paths = make_synthetic_images(tmp_dir, args.synthetic)
+        elif args.dir:
+            paths = collect_images(os.path.expanduser(args.dir), args.limit)
+        else:
+            parser.error("pass --dir or --synthetic")
+
+        if not paths:
+            parser.error("no images found")
+
+        full_times, full_inputs = time_decode(paths, fast_decode=False)
+        fast_times, fast_inputs = time_decode(paths, fast_decode=True)
+
+        report = {
+            "images": len(paths),
+            "model_input_size": embedding.model_input_size(),
+            "decode_size": embedding.decode_size(),
+            "full_decode": summarize(full_times),
+            "fast_decode": summarize(fast_times),
+            "speedup": sum(full_times) / sum(fast_times),
+        }
+
+        if not args.no_embed:
+            cosine = np.sum(encode(full_inputs) * encode(fast_inputs), axis=1)
+            report["embedding_cosine"] = {
+                "mean": float(cosine.mean()),
+                "min": float(cosine.min()),
+            }
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
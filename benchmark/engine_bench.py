@@ -0,0 +1,374 @@
+"""
+End to end benchmark of indexing and search , runs offline.
+
+Indexing is timed per stage over a corpus (a synthetic one from benchmark.corpus or
+any directory):
+    scan     -> encoder.scanner.scan_files
+    extract  -> the text extractors of encoder.utils / image decode
+    embed    -> random vectors , vectors from a saved .npy file or MobileCLIP
+    add      -> FAISSManagerHNSW.store_batch + train_add
+    save / load -> save_state , load_state (read and memory mapped)
+then search latency (p50 / p95 / p99 of single queries) and recall@k against an
+exact (flat) search are measured for FAISSManagerHNSW and FAISSManagerIVF (IVF-PQ ,
+trained on a sample of the first vectors , the rest streamed in) , --ondisk adds
+FAISSManagerOnDisk (the same with the inverted lists in a memory mapped file). Random / saved embeddings need no model weights , queries are
+stored vectors with noise added. --storage flat,sq8,pq repeats the HNSW part for each
+vector storage (stages and results of the compressed ones are suffixed , e.g. add_sq8).
+
+usage:
+    python -m benchmark.engine_bench --files 2000 --out run.json                 # synthetic corpus , random embeddings
+    python -m benchmark.engine_bench --corpus ~/Documents --embeddings model     # real files , MobileCLIP
+    python -m benchmark.engine_bench --vectors 200000 --embeddings vectors.npy   # FAISS only , no files
+    python -m benchmark.engine_bench --vectors 100000 --storage flat,sq8,pq       # memory / recall per storage
+    python -m benchmark.engine_bench --vectors 200000 --ondisk --out run.json     # IVF-PQ lists in RAM vs on disk
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from benchmark.corpus import make_corpus
+
+IMAGE_EXTS = {"png", "jpg", "jpeg"}
+
+
+def stage(seconds: float, items: int) -> dict:
+    return {"seconds": seconds, "items": items, "items_per_s": items / seconds if seconds > 0 else None}
+
+
+def percentiles(timings: list) -> dict:
+    timings = np.array(timings) * 1000
+    return {f"p{q}_ms": float(np.percentile(timings, q)) for q in (50, 95, 99)}
+
+
+def quiet(func, *args, **kwargs):
+    # the managers print progress ("saved") , keep stdout for the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+# --- indexing stages ---
+
+def scan_stage(root: str) -> tuple:
+    from encoder import config, utils
+    from encoder.scanner import scan_files
+
+    extensions = set(config.SUPPORTED_EXT_IMG) | set(utils.content_extractor_func)
+    start = time.perf_counter()
+    scanned = list(scan_files(root, extensions))
+    return scanned, stage(time.perf_counter() - start, len(scanned))
+
+
+def extract_stage(scanned: list) -> tuple:
+    """
+    returns:
+        tuple(items: list of (type , scanned file , text or None) , stage report)
+    """
+    from PIL import Image
+    from encoder import utils
+
+    items, failed = [], 0
+    start = time.perf_counter()
+    for file in scanned:
+        try:
+            if file.ext in IMAGE_EXTS:
+                with Image.open(file.path) as image:
+                    image.convert("RGB").load()
+                items.append(("image", file, None))
+            else:
+                text = utils.content_extractor_func[file.ext](file.path)
+                if text:
+                    items.append(("text", file, text))
+                else:
+                    failed += 1
+        except Exception:
+            failed += 1
+    report = stage(time.perf_counter() - start, len(items))
+    report["failed"] = failed
+    return items, report
+
+
+class Embedder:
+    """
+    Embeddings for the benchmark , kind:
+        "random" -> unit vectors seeded by the file path (same file , same vector)
+        "model"  -> MobileCLIP (encoder.embedding)
+        path.npy -> rows of a saved (n , dim) matrix , reused cyclically
+    """
+
+    def __init__(self, kind: str, dim: int = 512):
+        self.kind = kind
+        self.dim = dim
+        self.saved = None
+        self.next_row = 0
+        if kind not in ("random", "model"):
+            self.saved = np.load(kind, mmap_mode="r")
+            self.dim = self.saved.shape[1]
+
+    def _rows(self, count: int) -> np.ndarray:
+        rows = np.arange(self.next_row, self.next_row + count) % len(self.saved)
+        self.next_row += count
+        return normalized(self.saved[np.sort(rows)])
+
+    def embed(self, type: str, paths: list, texts: list = None) -> np.ndarray:
+        if self.kind == "random":
+            return normalized(np.stack([np.random.default_rng(zlib.crc32(path.encode())).standard_normal(self.dim)
+                                        for path in paths]))
+        if self.saved is not None:
+            return self._rows(len(paths))
+
+        from encoder import config, embedding
+        if type == "text":
+            return embedding.encode_texts(texts, batch_size=config.TEXT_BATCH_SIZE)
+        vectors, encoded = embedding.encode_images(paths, batch_size=config.IMAGE_BATCH_SIZE,
+                                                   num_workers=config.IMAGE_DECODE_WORKERS)
+        if len(encoded) != len(paths):
+            raise RuntimeError(f"{len(paths) - len(encoded)} images could not be decoded")
+        return vectors
+
+    def synthetic(self, count: int, seed: int = 0) -> np.ndarray:
+        """
+        count vectors without files (--vectors)
+        """
+        if self.saved is not None:
+            return self._rows(count)
+        if self.kind == "model":
+            raise ValueError("--vectors needs random or saved embeddings")
+        return normalized(np.random.default_rng(seed).standard_normal((count, self.dim)))
+
+
+def embed_stage(items: list, embedder: Embedder, batch_size: int = 256) -> tuple:
+    """
+    returns:
+        tuple(type -> (vectors , metadatas) , stage report)
+    """
+    from encoder.utils import get_meta
+
+    by_type = {}
+    start = time.perf_counter()
+    for type in ("text", "image"):
+        group = [item for item in items if item[0] == type]
+        chunks = []
+        for begin in range(0, len(group), batch_size):
+            batch = group[begin:begin + batch_size]
+            chunks.append(embedder.embed(type, [file.path for _, file, _ in batch], [text for _, _, text in batch]))
+        if chunks:
+            by_type[type] = (np.vstack(chunks).astype("float32"),
+                             [get_meta(file.path, create_time=file.create_time) for _, file, _ in group])
+    return by_type, stage(time.perf_counter() - start, len(items))
+
+
+def synthetic_vectors(count: int, embedder: Embedder) -> dict:
+    """
+    type -> (vectors , metadatas) for --vectors , split 3:1 between text and image
+    """
+    by_type = {}
+    for type, n in (("text", count - count // 4), ("image", count // 4)):
+        if n:
+            by_type[type] = (embedder.synthetic(n, seed=len(by_type)),
+                             [{"file_name": f"{type}_{i}", "file_type": ".bin", "file_path": f"/synthetic/{type}_{i}",
+                               "creation_date": 0} for i in range(n)])
+    return by_type
+
+
+def add_stage(manager, by_type: dict, chunk: int = 10000) -> dict:
+    total = 0
+    start = time.perf_counter()
+    for type, (vectors, metadatas) in by_type.items():
+        for begin in range(0, len(vectors), chunk):
+            manager.store_batch(type, vectors[begin:begin + chunk], metadatas[begin:begin + chunk])
+            manager.train_add()
+        total += len(vectors)
+    # compressed indexes retrain in the background as they grow
+    manager.wait_for_compaction()
+    return stage(time.perf_counter() - start, total)
+
+
+# --- search ---
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    return normalized(picked + noise * rng.standard_normal(picked.shape) / np.sqrt(vectors.shape[1]))
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    import faiss
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    return flat.search(queries, k)[1]
+
+
+def recall(found: list, exact: np.ndarray, k: int) -> float:
+    return float(np.mean([len(set(hits) & set(truth)) / k for hits, truth in zip(found, exact)]))
+
+
+def hnsw_search_stage(manager, type: str, vectors: np.ndarray, metadatas: list, queries: np.ndarray,
+                      exact: np.ndarray, k: int) -> dict:
+    search = manager.search_text if type == "text" else manager.search_image
+    positions = {meta["file_path"]: n for n, meta in enumerate(metadatas)}
+    timings, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, indices, metadata = search(query_embed=query, k=k)
+        timings.append(time.perf_counter() - start)
+        found.append([positions[metadata[str(i)]["file_path"]] for i in indices])
+    return {"recall_at_k": recall(found, exact, k), **percentiles(timings), "ef_search": manager.ef_search[type],
+            "storage": manager.storage, "rerank": manager.rerank if manager.storage != "flat" else None}
+
+
+def ivf_search_stage(type: str, vectors: np.ndarray, metadatas: list, queries: np.ndarray, exact: np.ndarray,
+                     k: int, nprobe: int, ondisk: bool = False) -> dict:
+    """
+    FAISSManagerIVF sized for this corpus (nlist from expected_size) , filled the way indexing
+    does: trained on a sample of the first train_size vectors , the rest streamed in.
+    ondisk uses FAISSManagerOnDisk instead , saved (shards merged into the lists file) and
+    loaded memory mapped before searching , like a query process.
+    Runs in the current directory (its files are written to index/)
+    """
+    from encoder.faiss_base import FAISSManagerIVF, FAISSManagerOnDisk
+
+    if len(vectors) < 256:
+        return {"skipped": "PQ training needs at least 256 vectors"}
+    manager_class = FAISSManagerOnDisk if ondisk else FAISSManagerIVF
+    manager = manager_class(embedding_dim=vectors.shape[1], expected_size=len(vectors))
+    build = add_stage(manager, {type: (vectors, metadatas)}, chunk=max(1000, manager.train_size))
+    files = {}
+    if ondisk:
+        start = time.perf_counter()
+        quiet(manager.save_state)
+        files["save_s"] = time.perf_counter() - start
+        manager = FAISSManagerOnDisk(embedding_dim=vectors.shape[1], expected_size=len(vectors))
+        quiet(manager.load_state, mmap=True)
+        # what a query process reads up front (quantizer , PQ , list offsets) and what it maps
+        files["header_mb"] = os.path.getsize(f"index/{type}_index.index") / (1 << 20)
+        files["lists_mb"] = sum(os.path.getsize(path) for path in glob.glob(f"index/{type}_lists.*.ivfdata")) / (1 << 20)
+
+    search = manager.search_text if type == "text" else manager.search_image
+    positions = {meta["file_path"]: n for n, meta in enumerate(metadatas)}
+    timings, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, indices, metadata = search(query_embed=query, k=k, nprobe=nprobe)
+        timings.append(time.perf_counter() - start)
+        found.append([positions[metadata[str(i)]["file_path"]] for i in indices])
+    return {"recall_at_k": recall(found, exact, k), **percentiles(timings), "build_s": build["seconds"], **files,
+            "nlist": manager.params()["nlist"][type], "train_size": manager.train_size, "nprobe": nprobe}
+
+
+def run(args) -> dict:
+    import faiss
+    from encoder.faiss_base import FAISSManagerHNSW
+
+    embedder = Embedder(args.embeddings)
+    report = {"faiss": faiss.__version__, "embeddings": args.embeddings, "k": args.k, "stages": {}}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.vectors:
+            by_type = synthetic_vectors(args.vectors, embedder)
+        else:
+            root = args.corpus
+            if root is None:
+                root = os.path.join(work_dir, "corpus")
+                start = time.perf_counter()
+                corpus = make_corpus(root, args.files, seed=args.seed)
+                report["corpus"] = {"files": len(corpus["files"]), "skipped": corpus["skipped"],
+                                    "generate_s": time.perf_counter() - start}
+            scanned, report["stages"]["scan"] = scan_stage(root)
+            items, report["stages"]["extract"] = extract_stage(scanned)
+            by_type, report["stages"]["embed"] = embed_stage(items, embedder)
+
+        report["search"] = {}
+        for type, (vectors, metadatas) in by_type.items():
+            queries = make_queries(vectors, args.queries, args.noise)
+            k = min(args.k, len(vectors))
+            exact = exact_neighbours(vectors, queries, k)
+            report["search"][type] = {"vectors": len(vectors), "queries": len(queries)}
+            by_type[type] = (vectors, metadatas, queries, exact, k)
+
+        cwd = os.getcwd()
+        for storage in args.storage.split(","):
+            suffix = "" if storage == "flat" else f"_{storage}"
+            os.chdir(tempfile.mkdtemp(dir=work_dir))
+            try:
+                manager = FAISSManagerHNSW(embedding_dim=embedder.dim, storage=storage, rerank=args.rerank)
+                report["stages"]["add" + suffix] = add_stage(manager, {type: values[:2] for type, values in by_type.items()})
+
+                start = time.perf_counter()
+                quiet(manager.save_state)
+                index_bytes = sum(os.path.getsize(f"index/{type}_index.index") for type in ("text", "image"))
+                report["stages"]["save_state" + suffix] = {
+                    "seconds": time.perf_counter() - start,
+                    "index_mb": sum(os.path.getsize(os.path.join("index", name)) for name in os.listdir("index")) / (1 << 20),
+                    # the FAISS files only (graph + codes + ids) , what a query process keeps in memory
+                    "index_bytes_per_vector": index_bytes / max(1, sum(len(values[0]) for values in by_type.values())),
+                }
+                for name, mmap in (("load_state", False), ("load_state_mmap", True)):
+                    manager = FAISSManagerHNSW(embedding_dim=embedder.dim, rerank=args.rerank)
+                    start = time.perf_counter()
+                    quiet(manager.load_state, mmap=mmap)
+                    report["stages"][name + suffix] = {"seconds": time.perf_counter() - start}
+
+                for type, (vectors, metadatas, queries, exact, k) in by_type.items():
+                    report["search"][type]["hnsw" + suffix] = hnsw_search_stage(manager, type, vectors, metadatas,
+                                                                               queries, exact, k)
+            finally:
+                os.chdir(cwd)
+
+        for type, (vectors, metadatas, queries, exact, k) in by_type.items():
+            os.chdir(tempfile.mkdtemp(dir=work_dir))
+            try:
+                report["search"][type]["ivf_pq"] = ivf_search_stage(type, vectors, metadatas, queries, exact, k,
+                                                                    args.nprobe)
+            finally:
+                os.chdir(cwd)
+            if args.ondisk:
+                os.chdir(tempfile.mkdtemp(dir=work_dir))
+                try:
+                    report["search"][type]["ivf_pq_ondisk"] = ivf_search_stage(type, vectors, metadatas, queries, exact,
+                                                                               k, args.nprobe, ondisk=True)
+                finally:
+                    os.chdir(cwd)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline indexing + search benchmark")
+    parser.add_argument("--files", type=int, default=1000, help="Size of the synthetic corpus")
+    parser.add_argument("--corpus", type=str, help="Benchmark this directory instead of a synthetic corpus")
+    parser.add_argument("--vectors", type=int, default=0, help="Skip files , index this many vectors (FAISS only)")
+    parser.add_argument("--embeddings", type=str, default="random", help="random , model or a saved (n , dim) .npy file")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.5, help="Noise added to the stored vectors used as queries")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16, help="Inverted lists visited by the IVF-PQ search")
+    parser.add_argument("--storage", type=str, default="flat", help="HNSW vector storages to compare , e.g. flat,sq8,pq")
+    parser.add_argument("--rerank", type=int, default=4, help="Candidates per result re-ranked by compressed indexes (0 = off)")
+    parser.add_argument("--ondisk", action="store_true",
+                        help="Also benchmark IVF-PQ with the lists on disk (faiss prints merge progress , use --out)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Import time benchmark and guard for the CLI entry points.
+
+Every module is imported in a fresh interpreter , which reports the wall time of the
+import and whether heavy libraries / models were loaded as a side effect. Models load
+on first use (encoder.embedding.get_model , query.utils.get_model) and the extractor
+libraries when the first file of their type is seen , importing must not pay for them.
+
+usage:
+    python -m benchmark.import_time
+    python -m benchmark.import_time --check              # exit 1 if a guard is violated
+    python -m benchmark.import_time --check --budget 3   # ... or an import takes > 3s
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+EXTRACTOR_LIBS = ["PyPDF2", "docx", "pptx", "pandas", "markdown", "bs4", "cv2"]
+
+# module -> libraries importing it must not load
+TARGETS = {
+    "encoder.utils": EXTRACTOR_LIBS + ["torch", "transformers", "mobileclip"],
+    "encoder.embedding": EXTRACTOR_LIBS + ["transformers", "mobileclip"],
+    "query.utils": ["transformers", "mobileclip"],
+    "query.query": EXTRACTOR_LIBS + ["transformers", "mobileclip"],
+    "encoder.main_seq": EXTRACTOR_LIBS + ["torch", "transformers", "mobileclip"],
+    "run": EXTRACTOR_LIBS + ["torch", "transformers", "mobileclip"],
+}
+
+# module -> attributes which hold a lazily loaded model , must still be None after import
+MODELS = {
+    "encoder.embedding": ["model"],
+    "query.utils": ["model"],
+}
+
+CHILD = """
+import importlib, json, sys, time
+start = time.perf_counter()
+module = importlib.import_module({module!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "loaded": [name for name in {forbidden!r} if name in sys.modules],
+    "models": [attr for attr in {models!r} if getattr(module, attr, None) is not None],
+}}))
+"""
+
+
+def measure(module: str) -> dict:
+    code = CHILD.format(module=module, forbidden=TARGETS[module], models=MODELS.get(module, []))
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    # the modules may print while importing , the report is the last line
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the entry points")
+    parser.add_argument("--check", action="store_true", help="Exit 1 when an import loads a model or a heavy library")
+    parser.add_argument("--budget", type=float, help="With --check , also fail imports slower than this (seconds)")
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = {module: measure(module) for module in TARGETS}
+
+    failures = []
+    for module, result in report.items():
+        if "error" in result:
+            failures.append(f"{module}: import failed ({result['error']})")
+            continue
+        if result["loaded"]:
+            failures.append(f"{module}: imports {', '.join(result['loaded'])}")
+        if result["models"]:
+            failures.append(f"{module}: loads a model at import ({', '.join(result['models'])})")
+        if args.budget is not None and result["seconds"] > args.budget:
+            failures.append(f"{module}: {result['seconds']:.2f}s > budget {args.budget:.2f}s")
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+    if args.check and failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark of query startup: FAISS index read into memory vs memory mapped.
+
+For every mode it starts --procs query processes at once (like several users / a
+server with workers on one box). Each loads the index from --root , runs one search
+and reports its load time , first query latency and memory:
+    rss_kb : resident pages , counts pages shared through the page cache in full
+    pss_kb : proportional share , shared pages are split between the processes mapping them
+The processes stay alive until all of them reported , so their mappings overlap.
+
+usage:
+    python -m benchmark.index_load_bench --root .                 # the index/ under the repo
+    python -m benchmark.index_load_bench --synthetic 200000 --procs 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def memory_kb() -> dict:
+    """
+    Function to read resident memory of this process (linux /proc)
+    return:
+        dict with rss_kb and pss_kb (None where unavailable)
+    """
+    report = {"rss_kb": None, "pss_kb": None}
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    report["rss_kb"] = int(line.split()[1])
+        with open("/proc/self/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    report["pss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return report
+
+
+def make_synthetic_index(root: str, count: int, dim: int = 512):
+    """
+    Function to build and save an index of random unit vectors under root/index
+    args:
+        root:str = directory to save to
+        count:int = vectors , split 3:1 between the text and image index
+        dim:int = embedding dim
+    """
+    from encoder.faiss_base import FAISSManagerHNSW
+
+    rng = np.random.default_rng(0)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        manager = FAISSManagerHNSW(embedding_dim=dim)
+        for type, n in (("text", count - count // 4), ("image", count // 4)):
+            for start in range(0, n, 10000):
+                vectors = rng.standard_normal((min(10000, n - start), dim)).astype("float32")
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                metadatas = [{"file_name": f"{type}_{start + i}", "file_type": ".bin",
+                              "file_path": f"/synthetic/{type}_{start + i}", "creation_date": 0}
+                             for i in range(len(vectors))]
+                manager.store_batch(type=type, embeddings=vectors, metadatas=metadatas)
+                manager.train_add()
+        manager.save_state()
+    finally:
+        os.chdir(cwd)
+
+
+def child(root: str, mmap: bool, dim: int):
+    """
+    Runs in a query process: load , search once , report , then wait for the parent
+    """
+    base = memory_kb()
+    start = time.perf_counter()
+    from encoder.faiss_base import FAISSManagerHNSW
+    import_s = time.perf_counter() - start
+
+    os.chdir(root)
+    manager = FAISSManagerHNSW(embedding_dim=dim)
+    start = time.perf_counter()
+    if not manager.load_state(mmap=mmap):
+        raise SystemExit(f"no index under {root}")
+    load_s = time.perf_counter() - start
+
+    query = np.random.default_rng(1).standard_normal(dim).astype("float32")
+    start = time.perf_counter()
+    manager.search_text(query)
+    first_query_s = time.perf_counter() - start
+
+    report = {"import_s": import_s, "load_s": load_s, "first_query_s": first_query_s,
+              "base_rss_kb": base["rss_kb"], **memory_kb()}
+    print(json.dumps(report), flush=True)
+    # hold the mappings until every process measured
+    sys.stdin.read()
+
+
+def run_mode(root: str, mmap: bool, procs: int, dim: int) -> dict:
+    cmd = [sys.executable, "-m", "benchmark.index_load_bench", "--child", "--root", root, "--dim", str(dim)]
+    if mmap:
+        cmd.append("--mmap")
+    workers = [subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for _ in range(procs)]
+    reports = []
+    for proc in workers:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("query process failed")
+        reports.append(json.loads(line))
+    for proc in workers:
+        proc.stdin.close()
+        proc.wait()
+
+    def mean(key):
+        values = [r[key] for r in reports if r[key] is not None]
+        return sum(values) / len(values) if values else None
+
+    def total(key):
+        values = [r[key] for r in reports if r[key] is not None]
+        return sum(values) if values else None
+
+    return {
+        "load_s": mean("load_s"),
+        "first_query_s": mean("first_query_s"),
+        "rss_kb_per_process": mean("rss_kb"),
+        "pss_kb_per_process": mean("pss_kb"),
+        "pss_kb_total": total("pss_kb"),
+        "processes": reports,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query startup benchmark: read vs memory mapped index")
+    parser.add_argument("--root", type=str, help="Directory containing the index/ folder")
+    parser.add_argument("--synthetic", type=int, default=0, help="Build an index of this many random vectors instead")
+    parser.add_argument("--procs", type=int, default=2, help="Query processes started at once per mode")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mmap", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.root, args.mmap, args.dim)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.synthetic:
+            root = tmp_dir
+            make_synthetic_index(root, args.synthetic, args.dim)
+        elif args.root:
+            root = os.path.abspath(args.root)
+        else:
+            parser.error("pass --root or --synthetic")
+
+        import faiss
+        index_bytes = sum(os.path.getsize(os.path.join(root, "index", name))
+                          for name in ("text_index.index", "image_index.index"))
+        report = {
+            "faiss": faiss.__version__,
+            # without it faiss maps inverted lists only , the HNSW storage is still copied
+            "zero_copy_flat_storage": hasattr(faiss, "IO_FLAG_MMAP_IFC"),
+            "index_mb": index_bytes / (1 << 20),
+            "procs": args.procs,
+        }
+        for name, mmap in (("read", False), ("mmap", True)):
+            report[name] = run_mode(root, mmap, args.procs, args.dim)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
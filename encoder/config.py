@@ -1,5 +1,98 @@
+import os
+
 SUPPORTED_EXT_TEXT = ["pdf" , "txt" , "docx" , "doc" , "md"]
 SUPPORTED_EXT_IMG = ["jpeg" , "jpg", "png"]
 
 
-RESTRICTED_DIRS_INTIAL = "."
\ No newline at end of file
+RESTRICTED_DIRS_INTIAL = "."
+
+# number of texts per MobileCLIP forward pass while indexing
+TEXT_BATCH_SIZE = 32
+# number of images per MobileCLIP forward pass and threads decoding them
+IMAGE_BATCH_SIZE = 32
+IMAGE_DECODE_WORKERS = min(8 , os.cpu_count() or 1)
+# decode JPEGs at reduced scale / thumbnail other images before preprocess
+FAST_IMAGE_DECODE = True
+
+# content addressed embedding cache (float16 , ~1KB per file)
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_DIR = "index/cache"
+EMBEDDING_CACHE_MAX_BYTES = 2 << 30
+
+# multi process pipeline (encoder/main.py) , 0 extract workers = sequential main_seq path
+EXTRACT_WORKERS = max(1 , (os.cpu_count() or 2) - 2)
+EMBED_WORKERS = 1
+PIPELINE_QUEUE_SIZE = 256
+# chunks (one batch each) of the shared memory ring between embedding workers and the writer
+RING_CHUNKS = 64
+
+# query processes map the saved index files read only instead of copying them into memory
+MMAP_INDEX = True
+
+# query -> (type token , embedding) LRU cache , saved to QUERY_CACHE_PATH for warm restarts (None: memory only)
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_MAX_BYTES = 16 << 20
+QUERY_CACHE_PATH = "index/query_cache.npz"
+
+# whole result lists of query.search_logic , dropped when the index changes or after the ttl (seconds)
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = 300
+# with filters search_logic searches k * FILTER_OVERFETCH hits and keeps the first k which pass
+FILTER_OVERFETCH = 4
+
+# TEXT / IMAGE query routing: "mobilebert" , "clip" (head over the MobileCLIP embedding ,
+# python -m query.clip_router) or "auto" (clip when a head for the loaded weights exists)
+QUERY_ROUTER = "auto"
+# MobileBERT router backend: "fp32" , or opt in to "int8" (dynamic quantization) / "onnx" (needs onnxruntime)
+# after checking their accuracy on the labelled CSV with python -m query.router_bench
+ROUTER_BACKEND = "fp32"
+
+# fused search (both indexes , merged by cosine score weighted with the router's p(IMAGE)):
+# always with FUSED_SEARCH , else only when the router's confidence is below FUSED_SEARCH_CONFIDENCE
+FUSED_SEARCH = False
+FUSED_SEARCH_CONFIDENCE = 0.75
+# fixed per index calibration of the fused cosine scores (score = cosine * scale) , text-image
+# similarities run lower than text-text ones , raise "image" to bring them onto the same scale
+FUSED_SCORE_SCALE = {"text" : 1.0 , "image" : 1.0}
+
+# HNSW graph of new indexes: M (links per node) , efConstruction / efSearch (candidate list sizes) ,
+# the ef values are saved per index and can be tuned with python -m encoder.tune_index
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 16
+# index type: "hnsw" , "ivf" (IVF-PQ , FAISSManagerIVF) for 10M+ vector corpora where building and holding
+# HNSW graphs takes too long / too much memory , or "ondisk" (FAISSManagerOnDisk , IVF-PQ with the inverted
+# lists on disk) for corpora whose codes do not fit in RAM , switching needs a full rebuild (--full)
+INDEX_BACKEND = "hnsw"
+# IVF-PQ: ~4 sqrt(IVF_EXPECTED_SIZE) lists , trained on a random sample of IVF_TRAIN_SAMPLE of the first
+# IVF_TRAIN_SIZE vectors (buffered until then) , codes of IVF_PQ_SUBVECTORS x IVF_PQ_NBIT bits ,
+# IVF_NPROBE lists visited per search (python -m encoder.tune_index picks it)
+IVF_EXPECTED_SIZE = 1_000_000
+IVF_TRAIN_SIZE = 250_000
+IVF_TRAIN_SAMPLE = 160_000
+IVF_PQ_SUBVECTORS = 64
+IVF_PQ_NBIT = 8
+IVF_NPROBE = 16
+# on disk IVF-PQ: new vectors go into in memory shards of ONDISK_SHARD_SIZE vectors (~72 MB of codes + ids
+# at 64 x 8 bit) which are written to index/shards/ when full , save_state merges them into the lists on disk
+ONDISK_SHARD_SIZE = 1_000_000
+
+# vector storage of new HNSW indexes: "flat" (float32 , 2 KB per 512 dim vector) , "sq8" (8 bit scalar
+# quantizer , 512 B) or "pq" (HNSW_PQ_SUBVECTORS codes of HNSW_PQ_NBIT bits , 64 B) , see the README
+HNSW_STORAGE = "flat"
+HNSW_PQ_SUBVECTORS = 64
+HNSW_PQ_NBIT = 8
+# compressed indexes search HNSW_RERANK * k candidates and re-rank them exactly with the float32 vectors
+# kept on disk next to the index (index/{type}_vectors.f32) , 0 = return the approximate distances
+HNSW_RERANK = 4
+# compressed indexes are trained once they buffered HNSW_TRAIN_SIZE vectors (or on an explicit train_add) ,
+# compaction retrains them on every live vector
+HNSW_TRAIN_SIZE = 20000
+# results per search when the caller does not ask for a number
+SEARCH_K = 5
+
+# indexing instrumentation (encoder/metrics.py): JSON + Prometheus text reports written to METRICS_DIR
+# at the end of a run and every METRICS_INTERVAL seconds while it runs (also enabled by --metrics)
+METRICS_ENABLED = False
+METRICS_DIR = "index/metrics"
+METRICS_INTERVAL = 30
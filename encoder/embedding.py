@@ -1,10 +1,67 @@
-
-import mobileclip
-import torch
 from PIL import Image
+import numpy as np
 import os
-model , _ , preprocess = mobileclip.create_model_and_transforms('mobileclip_s0' , pretrained=r"/home/aman/weights/mobileclip_s0.pt")
-tokenizer = mobileclip.get_tokenizer('mobileclip_s0')
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from encoder.utils import stored_file_hash
+
+MODEL_NAME = 'mobileclip_s0'
+WEIGHTS_PATH = os.environ.get("MOBILECLIP_WEIGHTS" , r"/home/aman/weights/mobileclip_s0.pt")
+# loaded on first use by get_model , importing this module stays cheap
+model = None
+preprocess = None
+tokenizer = None
+_model_lock = threading.Lock()
+
+EMBEDDING_DIM = 512
+
+# decode thread pool and preallocated input tensors, created on first use of encode_images
+_decode_pool = None
+_image_buffers = []
+_model_id = None
+
+
+def get_model():
+    """
+    Function to load MobileCLIP (once , on first use)
+    return:
+        tuple(model , preprocess , tokenizer)
+    """
+    global model , preprocess , tokenizer
+    if model is None:
+        with _model_lock:
+            if model is None:
+                import mobileclip
+                loaded , _ , transforms = mobileclip.create_model_and_transforms(MODEL_NAME , pretrained=WEIGHTS_PATH)
+                tokenizer = mobileclip.get_tokenizer(MODEL_NAME)
+                preprocess = transforms
+                model = loaded
+    return (model , preprocess , tokenizer)
+
+def warmup():
+    """
+    Function to load the model and run one text + one image through it , so the first
+    real request does not pay for loading / lazy initialisation inside torch
+    """
+    import torch
+    model , _ , tokenizer = get_model()
+    size = model_input_size()
+    with torch.no_grad():
+        model.encode_text(tokenizer(["warmup"]))
+        model.encode_image(torch.zeros((1 , 3 , size , size)))
+
+
+def model_id() -> str:
+    """
+    Function to identify the loaded weights , cached embeddings are only valid for the same id
+    return:
+        model_id:str = model name + hash of the weights file (stored next to it , see stored_file_hash)
+    """
+    global _model_id
+    if _model_id is None:
+        _model_id = f"{MODEL_NAME}-{stored_file_hash(WEIGHTS_PATH)}"
+    return _model_id
+
 def text_extract(text:str):
     """
     Function to generate text embeddings using mobileclip
@@ -14,8 +71,23 @@ def text_extract(text:str):
     return:
         text_features:torch.tensor = embeddings of text
     """
-    global model , tokenizer
-    inputs = tokenizer([text])
+    return encode_tokens(tokenize([text]))
+
+def tokenize(texts: list[str]):
+    """
+    Function to run the MobileCLIP tokenizer , the first half of text_extract (timed on its own by query tracing)
+    """
+    _ , _ , tokenizer = get_model()
+    return tokenizer(texts)
+
+def encode_tokens(inputs) -> np.ndarray:
+    """
+    Function to run the MobileCLIP text encoder on tokenize() output
+    return:
+        text_features:np.ndarray = (n , 512) L2 normalized embeddings
+    """
+    import torch
+    model , _ , _ = get_model()
     with torch.no_grad():
         text_features = model.encode_text(inputs)
         text_features /= text_features.norm(dim=-1, keepdim=True)
@@ -24,17 +96,46 @@ def text_extract(text:str):
     return text_features
 
 
-def image_extract(image_path: os.path):
+def encode_texts(texts: list[str] , batch_size:int = 32 , out:np.ndarray = None) -> np.ndarray:
+    """
+    Function to generate text embeddings for many texts at once
+    args:
+        texts:list[str] = text contents which needs to be embedded
+        batch_size:int = number of texts per forward pass
+        out:np.ndarray = optional (>= len(texts) , 512) float32 array to write into (e.g. shared memory)
+    return:
+        text_features:np.ndarray = (len(texts) , 512) float32 matrix , rows L2 normalized
+    """
+    import torch
+    model , _ , tokenizer = get_model()
+    if out is None:
+        out = np.empty((len(texts) , EMBEDDING_DIM) , dtype="float32")
+    out = out[:len(texts)]
+
+    with torch.no_grad():
+        for start in range(0 , len(texts) , batch_size):
+            chunk = texts[start : start + batch_size]
+            inputs = tokenizer(chunk)
+            text_features = model.encode_text(inputs)
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+            out[start : start + len(chunk)] = text_features.cpu().numpy()
+
+    return out
+
+
+def image_extract(image_path: os.path , fast_decode:bool = True):
     """
     Function to generate image embeddings using mobileCLIP
     args:
         image_path:str = path of the image
+        fast_decode:bool = decode at reduced resolution , see load_image
     return:
         image_feature:torch.tensor = embedding of image
     """
-    global model , preprocess
+    import torch
+    model , preprocess , _ = get_model()
 
-    image = preprocess(Image.open(image_path).convert('RGB')).unsqueeze(0)
+    image = preprocess(load_image(image_path , fast_decode=fast_decode)).unsqueeze(0)
 
     with torch.no_grad():
         image_features = model.encode_image(image)
@@ -44,3 +145,132 @@ def image_extract(image_path: os.path):
     return image_features
 
 
+
+def model_input_size() -> int:
+    """
+    Function to get the square input resolution the preprocess transform produces
+    return:
+        size:int = side of the model input in pixels
+    """
+    for transform in getattr(get_model()[1] , "transforms" , []):
+        size = getattr(transform , "size" , None)
+        if size is not None:
+            return size if isinstance(size , int) else max(size)
+    return 256
+
+
+def decode_size() -> int:
+    """
+    Smallest power of two >= the model input size , the resolution fast decoding aims for
+    """
+    return 1 << (model_input_size() - 1).bit_length()
+
+
+def load_image(image_path: os.path , fast_decode:bool = True) -> Image.Image:
+    """
+    Function to open an image as RGB for preprocess
+    args:
+        image_path:str = path of the image
+        fast_decode:bool = if True , JPEGs are decoded by libjpeg at a reduced scale (Image.draft)
+            and other formats are shrunk with a cheap thumbnail step , in both cases the
+            shorter side stays >= decode_size() so preprocess sees enough pixels
+    return:
+        image:PIL.Image = RGB image
+    """
+    img = Image.open(image_path)
+    if fast_decode:
+        target = decode_size()
+        if img.format == "JPEG":
+            # picks the largest 1/2 , 1/4 , 1/8 scale keeping both sides >= target
+            img.draft('RGB' , (target , target))
+        else:
+            width , height = img.size
+            scale = target / min(width , height)
+            if scale < 1:
+                img.thumbnail((int(width * scale) + 1 , int(height * scale) + 1) , resample=Image.BILINEAR , reducing_gap=2.0)
+    return img.convert('RGB')
+
+
+def _get_decode_pool(num_workers:int) -> ThreadPoolExecutor:
+    global _decode_pool
+    if _decode_pool is None or _decode_pool._max_workers != num_workers:
+        if _decode_pool is not None:
+            _decode_pool.shutdown(wait=True)
+        _decode_pool = ThreadPoolExecutor(max_workers=num_workers , thread_name_prefix="img-decode")
+    return _decode_pool
+
+
+def _get_image_buffers(batch_size:int) -> list:
+    """
+    Two (batch_size , 3 , H , W) tensors , one being filled by the decode threads
+    while the other one runs through the model. Reused across calls.
+    """
+    import torch
+    global _image_buffers
+    size = model_input_size()
+    if not _image_buffers or _image_buffers[0].shape[0] < batch_size:
+        _image_buffers = [torch.empty((batch_size , 3 , size , size)) for _ in range(2)]
+    return _image_buffers
+
+
+def _decode_into(buffer , slot:int , image_path:str , fast_decode:bool) -> bool:
+    """
+    Decodes and preprocesses one image straight into buffer[slot] , runs on a decode thread
+    """
+    try:
+        buffer[slot].copy_(get_model()[1](load_image(image_path , fast_decode=fast_decode)))
+        return True
+    except Exception:
+        return False
+
+
+def encode_images(image_paths: list[str] , batch_size:int = 32 , num_workers:int = 4 , fast_decode:bool = True , out:np.ndarray = None):
+    """
+    Function to generate image embeddings for many images at once.
+    Images are decoded on a thread pool into a preallocated tensor and every full batch
+    goes through model.encode_image in one call , the next batch decodes meanwhile.
+    args:
+        image_paths:list[str] = paths of the images
+        batch_size:int = number of images per forward pass
+        num_workers:int = number of decode threads
+        fast_decode:bool = decode at reduced resolution , see load_image
+        out:np.ndarray = optional (>= len(image_paths) , 512) float32 array to write into (e.g. shared memory)
+    return:
+        tuple(image_features:np.ndarray , encoded_paths:list[str])
+            (n , 512) float32 matrix , rows L2 normalized , and the paths they belong to.
+            Images which fail to decode are left out of both.
+    """
+    import torch
+    model , _ , _ = get_model()
+    pool = _get_decode_pool(num_workers)
+    buffers = _get_image_buffers(batch_size)
+
+    if out is None:
+        out = np.empty((len(image_paths) , EMBEDDING_DIM) , dtype="float32")
+    decoded = np.zeros(len(image_paths) , dtype=bool)
+
+    def submit(start:int , buffer):
+        chunk = image_paths[start : start + batch_size]
+        return [pool.submit(_decode_into , buffer , slot , path , fast_decode) for slot , path in enumerate(chunk)]
+
+    pending = submit(0 , buffers[0]) if image_paths else []
+    for n , start in enumerate(range(0 , len(image_paths) , batch_size)):
+        buffer = buffers[n % 2]
+        ok = np.array([future.result() for future in pending] , dtype=bool)
+        count = len(ok)
+
+        # start decoding the next batch while this one is in the model
+        next_start = start + batch_size
+        pending = submit(next_start , buffers[(n + 1) % 2]) if next_start < len(image_paths) else []
+
+        if ok.any():
+            with torch.no_grad():
+                image_features = model.encode_image(buffer[:count])
+                image_features /= image_features.norm(dim=-1, keepdim=True)
+            out[start : start + count] = image_features.cpu().numpy()
+        decoded[start : start + count] = ok
+
+    encoded_paths = [path for path , ok in zip(image_paths , decoded) if ok]
+    # move the rows of decoded images to the front , in place
+    out[:len(encoded_paths)] = out[:len(image_paths)][decoded]
+    return out[:len(encoded_paths)] , encoded_paths
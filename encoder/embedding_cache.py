@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    On disk cache of embeddings keyed by content hash + model id
+
+    Files in cache_dir:
+        embeddings.f16 -> append only (capacity , dim) float16 array , memory mapped
+        index.npz -> compact hash -> row index (keys , rows , last used tick)
+        meta.json -> model id , dim , rows used , LRU clock
+
+    Rows are never rewritten in place. When the data file grows past max_bytes the
+    least recently used entries are evicted by rewriting the file with the rest.
+    The whole cache is dropped when it was written by a different model id.
+    """
+
+    def __init__(self , cache_dir:str = "index/cache" , model_id:str = "" , dim:int = 512 , max_bytes:int = 2 << 30):
+        self.cache_dir = cache_dir
+        self.model_id = model_id
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self.row_bytes = dim * np.dtype("float16").itemsize
+
+        self.data_path = os.path.join(cache_dir , "embeddings.f16")
+        self.index_path = os.path.join(cache_dir , "index.npz")
+        self.meta_path = os.path.join(cache_dir , "meta.json")
+
+        # key (16 bytes) -> [row , last used tick]
+        self.rows = {}
+        self.used = 0
+        self.capacity = 0
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = None
+
+        os.makedirs(cache_dir , exist_ok=True)
+        self._open()
+
+
+    def _open(self):
+        if os.path.exists(self.meta_path) and os.path.exists(self.index_path) and os.path.exists(self.data_path):
+            with open(self.meta_path , "r") as file:
+                meta = json.load(file)
+
+            if meta["model_id"] != self.model_id or meta["dim"] != self.dim:
+                # model weights / decode settings changed , every cached vector is stale
+                self.invalidate()
+                return
+
+            index = np.load(self.index_path)
+            self.rows = {key.tobytes() : [int(row) , int(tick)] for key , row , tick in zip(index["keys"] , index["rows"] , index["ticks"])}
+            self.used = meta["used"]
+            self.clock = meta["clock"]
+            self.capacity = os.path.getsize(self.data_path) // self.row_bytes
+            if self.capacity:
+                self._data = np.memmap(self.data_path , dtype="float16" , mode="r+" , shape=(self.capacity , self.dim))
+        else:
+            self.invalidate()
+
+    def key(self , content_hash:str , modality:str) -> bytes:
+        """
+        Function to build the cache key of a file
+        args:
+            content_hash (str) : hash of the file bytes
+            modality (str) : "text" or "image"
+        returns:
+            16 byte key
+        """
+        material = f"{self.model_id}|{modality}|{content_hash}".encode()
+        return hashlib.blake2b(material , digest_size=16).digest()
+
+    def get(self , key:bytes):
+        """
+        Function to look up one embedding
+        returns:
+            (1 , dim) float32 array or None
+        """
+        entry = self.rows.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.clock += 1
+        entry[1] = self.clock
+        return np.asarray(self._data[entry[0]] , dtype="float32").reshape(1 , -1)
+
+    def put(self , key:bytes , embedding:np.ndarray):
+        """
+        Function to append one embedding to the cache
+        """
+        if key in self.rows:
+            return
+
+        if self.used == self.capacity:
+            self._grow()
+
+        self._data[self.used] = embedding.reshape(-1).astype("float16")
+        self.clock += 1
+        self.rows[key] = [self.used , self.clock]
+        self.used += 1
+
+        if self.used * self.row_bytes > self.max_bytes:
+            self.evict()
+
+    def _grow(self):
+        # double the file , keeps appends amortised O(1)
+        self.capacity = max(1024 , self.capacity * 2)
+        if self._data is not None:
+            self._data.flush()
+            del self._data
+        with open(self.data_path , "ab") as file:
+            file.truncate(self.capacity * self.row_bytes)
+        self._data = np.memmap(self.data_path , dtype="float16" , mode="r+" , shape=(self.capacity , self.dim))
+
+    def evict(self , target_fraction:float = 0.8):
+        """
+        Function to drop the least recently used entries until the cache holds
+        at most target_fraction of max_bytes , rewrites the data file
+        """
+        keep_count = int(self.max_bytes * target_fraction) // self.row_bytes
+        by_recency = sorted(self.rows.items() , key=lambda item : item[1][1] , reverse=True)[:keep_count]
+
+        kept = np.empty((len(by_recency) , self.dim) , dtype="float16")
+        for new_row , (_ , entry) in enumerate(by_recency):
+            kept[new_row] = self._data[entry[0]]
+
+        self.rows = {key : [new_row , entry[1]] for new_row , (key , entry) in enumerate(by_recency)}
+        self.used = len(kept)
+        self.capacity = max(1024 , self.used)
+
+        del self._data
+        temp_path = self.data_path + ".tmp"
+        data = np.memmap(temp_path , dtype="float16" , mode="w+" , shape=(self.capacity , self.dim))
+        data[:self.used] = kept
+        data.flush()
+        del data
+        os.replace(temp_path , self.data_path)
+        self._data = np.memmap(self.data_path , dtype="float16" , mode="r+" , shape=(self.capacity , self.dim))
+        self.save()
+
+    def invalidate(self):
+        """
+        Function to empty the cache (e.g. after the model weights changed)
+        """
+        self._data = None
+        self.rows = {}
+        self.used = 0
+        self.capacity = 0
+        self.clock = 0
+        if os.path.exists(self.data_path):
+            os.remove(self.data_path)
+        self.save()
+
+    def save(self):
+        """
+        Function to persist the index and meta , the vectors are already on disk
+        """
+        if self._data is not None:
+            self._data.flush()
+
+        # raw uint8 rows , fixed width bytes dtypes would strip trailing zero bytes
+        keys = np.frombuffer(b"".join(self.rows) , dtype="uint8").reshape(-1 , 16)
+        rows = np.array([entry[0] for entry in self.rows.values()] , dtype="int64")
+        ticks = np.array([entry[1] for entry in self.rows.values()] , dtype="int64")
+        with open(self.index_path + ".tmp" , "wb") as file:
+            np.savez(file , keys=keys , rows=rows , ticks=ticks)
+        os.replace(self.index_path + ".tmp" , self.index_path)
+
+        with open(self.meta_path , "w+") as file:
+            json.dump({"model_id" : self.model_id , "dim" : self.dim , "used" : self.used , "clock" : self.clock} , file)
@@ -2,105 +2,456 @@ import faiss
 import numpy as np
 import pickle
 import os
+import glob
 from typing import Dict , Any  , List
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-class FAISSManagerIVF:
-    """
-    Class for managing FAISS db for dynamic training and adding 
+from encoder.metadata_store import MetadataStore
+from encoder.vector_store import VectorStore
+import encoder.config as config
 
+class FAISSManager:
     """
+    Base of the FAISS managers , one index for text and one for images
 
-    def __init__(self, n_cluster:int , embedding_dim: int = 512 , sub_vector_count:int=16, verbose=False):
+    Vectors carry explicit 64 bit ids taken from a monotonic counter shared by both
+    indexes , so ids stay stable across saves and compactions. Removed ids become
+    tombstones which are filtered out at search time and dropped for real by compaction
+    once they make up more than compaction_threshold of an index.
 
-        self.verbose = verbose
+    The metadata of the vectors lives in a MetadataStore (SQLite) , a search only reads
+    the rows of the hits it returns.
 
-        self.subvector = sub_vector_count
-        self.n_cluster = n_cluster
+    load_state(mmap=True) maps the saved index files read only instead of copying them
+    into memory , for query processes: pages are faulted in on demand and shared through
+    the page cache by every process which maps the same files.
+
+    Subclasses build the indexes (_new_index) , search them (_search_matrix) and compact
+    them (_compact) , see FAISSManagerHNSW , FAISSManagerIVF and FAISSManagerOnDisk.
+    """
+
+    def __init__(self , embedding_dim:int = 512 , verbose=False , compaction_threshold:float = 0.2 , train_size:int = 0):
+
+        #emebdding dim
         self.embedding_dim = embedding_dim
+        # an untrained index buffers this many vectors before store_temp / store_batch add them
+        self.train_size = train_size
+        # vectors the quantizer of each index was trained on
+        self.trained_on = {"text" : 0 , "image" : 0}
+
+        self.text_index = self._new_index("text")
+        self.image_index = self._new_index("image")
+
+        # id -> metadata , also maps a file path to the (type , id) of its live vector
+        self.metadata = MetadataStore()
+        # ids removed from the metadata but still in the index
+        self.text_tombstones = set()
+        self.image_tombstones = set()
+        self.next_id = 0
 
-        self.text_index = faiss.index_factory(self.embedding_dim , f"IVF{n_cluster},PQ{sub_vector_count}")
-        self.image_index = faiss.index_factory(self.embedding_dim , f"IVF{n_cluster},PQ{sub_vector_count}")
-        self.metadata = {}
-        
         self.text_temp = []
-        self.image_temp = []
-        self.text_temp_metadata = []    
+        self.image_temp = [] 
+        self.text_temp_metadata = []
         self.image_temp_metadata = []
 
+        self.compaction_threshold = compaction_threshold
+        # guards the indexes / tombstones against the background compaction
+        self._lock = threading.RLock()
+        self._compaction_thread = None
+        # runs the text + image searches of search_fused side by side , created on first use
+        self._search_pool = None
+        # set by load_state(mmap=True) , the indexes are views of the files then
+        self.read_only = False
+        # bumped whenever search results may change (adds , removals , loads , compactions) ,
+        # caches of search results are only valid for the generation they were made in
+        self.generation = 0
+
+        self.verbose = verbose
+
+
+    def _new_index(self , type:str):
+        raise NotImplementedError
 
-    def store_temp(self ,type:str, embedding:np.array , metdata:Dict):
+    def _search_matrix(self , type:str , query_embed:np.array , k:int , param:int = None):
         """
-        Function to store the embedding temp in a list
+        One index.search for every row of query_embed
         args:
-            embedding (torch.tensor) => embeddings
-            type (str) => of 2 types
-                - image
-                - text
+            param (int) : search parameter of this call (efSearch / nprobe) , None = the one set for the index
+        returns:
+            tuple : (distances , indices) , (nq , k) each
         """
+        raise NotImplementedError
+
+    def _compact(self , type:str):
+        raise NotImplementedError
+
+    def _train(self , index , vectors:np.array):
+        index.train(vectors)
 
-        if len(self.text_temp) == 10000 or len(self.image_temp) == 10000:
-             self.train_add()
+    def _can_train(self , count:int) -> bool:
+        """
+        Whether an untrained index can be trained on count vectors
+        """
+        return True
 
+    def _train_index(self , type:str , vectors:np.array):
+        """
+        Trains the index of type on its first vectors
+        returns:
+            the trained index
+        """
+        index , _ = self._parts(type)
+        self._train(index , vectors)
+        self.trained_on[type] = len(vectors)
+        return index
+
+    def _add(self , type:str , index , vectors:np.array , ids:np.array):
+        index.add_with_ids(vectors , ids)
+
+    @staticmethod
+    def _pick(measurements:List[Dict] , target_recall:float = None , latency_budget_ms:float = None) -> Dict:
+        """
+        Picks one of the measurements (sorted by the parameter , ascending) for a recall target and / or a latency budget
+            target_recall only : smallest value reaching it (largest measured if none does)
+            latency_budget_ms only : largest value within the budget
+            both : smallest value reaching the recall within the budget , else the largest within it
+        returns:
+            the measurement or None
+        """
+        if target_recall is None and latency_budget_ms is None:
+            raise ValueError("give a target_recall and / or a latency_budget_ms")
+
+        within_budget = [m for m in measurements if latency_budget_ms is None or m["latency_ms"] <= latency_budget_ms]
+        chosen = None
+        if target_recall is not None:
+            chosen = next((m for m in within_budget if m["recall"] >= target_recall) , None)
+        if chosen is None and within_budget:
+            # target not reachable (in the budget) , the best recall it allows
+            chosen = within_budget[-1]
+        return chosen
+
+    def _parts(self , type:str) -> tuple:
+        """
+        return:
+            tuple(index , tombstones) of the "text" or "image" side
+        """
+        if type == "text":
+            return (self.text_index , self.text_tombstones)
+        elif type == "image":
+            return (self.image_index , self.image_tombstones)
         else:
-            if embedding.ndim == 1:
-                embedding = embedding.reshape(1 , -1)
-            
-            #smoll error handeling step 
-            if embedding.shape[1] != self.embedding_dim:
-                raise ValueError(f"Embedding must have dim {self.embedding_dim}")
-            
+            raise Exception("Incorrect embedding type")
+    def _check_writable(self):
+        if self.read_only:
+            raise Exception("Index was loaded memory mapped (read only) , load it with mmap=False to modify it")
+
+
+    def store_temp(self,  type:str , embedding:np.array  , metadata:Dict):
+        """
+        Funtion to store embedding in temporary list 
+        """
+
+        if embedding.ndim == 1:
+            embedding = embedding.reshape(1 , -1)
+        
+        #smoll error handeling step 
+        if embedding.shape[1] != self.embedding_dim:
+            raise ValueError(f"Embedding must have dim {self.embedding_dim}")
+        
+
+        self._check_writable()
+        # the writer thread of the pipeline adds while the scanner may remove
+        with self._lock:
             if type == "image":
                 self.image_temp.append(embedding.astype("float32"))
-                self.image_temp_metadata.append(metdata)
+                self.image_temp_metadata.append(metadata)
 
             elif type == "text":
                 self.text_temp.append(embedding.astype("float32"))
-                self.text_temp_metadata.append(metdata)
+                self.text_temp_metadata.append(metadata)
+
+            else:
+                raise Exception("Incorrect embedding type")
+
+            # flush after appending so the embedding which fills the buffer is not dropped
+            full = self._full_buffers()
+            if full:
+                self.train_add(types=full)
+
+    def store_batch(self , type:str , embeddings:np.array , metadatas:List[Dict]):
+        """
+        Function to store many embeddings (rows of a matrix) in the temporary list at once
+        The matrix is copied once , so it may be a view into a reused buffer.
+        """
+        if len(embeddings) != len(metadatas):
+            raise ValueError("One metadata per embedding row is needed")
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(f"Embedding must have dim {self.embedding_dim}")
+
+        self._check_writable()
+        with self._lock:
+            if type == "image":
+                self.image_temp.append(np.array(embeddings , dtype="float32"))
+                self.image_temp_metadata.extend(metadatas)
+
+            elif type == "text":
+                self.text_temp.append(np.array(embeddings , dtype="float32"))
+                self.text_temp_metadata.extend(metadatas)
 
             else:
                 raise Exception("Incorrect embedding type")
+
+            full = self._full_buffers()
+            if full:
+                self.train_add(types=full)
+
+    def _full_buffers(self) -> tuple:
+        """
+        returns:
+            types whose buffer is full: 1000 vectors , train_size for an untrained index
+        """
+        full = []
+        for type , temp_metadata in (("text" , self.text_temp_metadata) , ("image" , self.image_temp_metadata)):
+            index , _ = self._parts(type)
+            if len(temp_metadata) >= (1000 if index.is_trained else max(1000 , self.train_size)):
+                full.append(type)
+        return tuple(full)
             
     
-    def train_add(self):
+    def train_add(self , types:tuple = ("text" , "image")):
         """
-        Function to train on new embedding
+        Function to add the buffered vectors to their index (trained first if it is not , vectors
+        too few to train it on stay buffered)
+        args:
+            types (tuple) : which buffers to add , both by default
         """
+
         if self.verbose:
-                    print("training...")
+            print("training ....")
 
+        with self._lock:
+            for type , temp , temp_metadata in (("text" , self.text_temp , self.text_temp_metadata),
+                                                ("image" , self.image_temp , self.image_temp_metadata)):
+                if len(temp) == 0 or type not in types:
+                    continue
 
-        text_stack = np.vstack(self.text_temp)
+                index , _ = self._parts(type)
+                if not index.is_trained and not self._can_train(len(temp_metadata)):
+                    print(f"{type} index: too few vectors to train on , {len(temp_metadata)} stay buffered")
+                    continue
+                stack = np.vstack(temp)
+                ids = np.arange(self.next_id , self.next_id + len(stack) , dtype="int64")
+                self.next_id += len(stack)
 
-        if len(self.text_temp) < self.n_cluster:
-            print(f"Adjusting the clusters , current: {self.n_cluster}")
-            self.n_cluster = int(len(self.text_temp) ** 0.5)
+                # a path which is added again replaces its old vector
+                self._tombstone_paths([meta["file_path"] for meta in temp_metadata])
 
-        if not self.text_index.is_trained:
-            self.text_index.train(text_stack)
-        self.text_index.add(text_stack)
+                if not index.is_trained:
+                    index = self._train_index(type , stack)
+                self._add(type , index , stack , ids)
+                self.generation += 1
 
-        #to store metadata
-        for i , metadata in enumerate(self.text_temp_metadata):
-            faiss_id = self.text_index.ntotal - len(self.text_temp) + i
-            self.text_temp_metadata[faiss_id] = metadata
+                #storirng metadata
+                self.metadata.add(type , ids , temp_metadata)
 
-        image_stack = np.vstack(self.image_temp)
-        if not self.image_index.is_trained:
-            self.image_index.train(image_stack)
-        self.image_index.add(image_stack)
+                temp.clear()
+                temp_metadata.clear()
 
-        for i , metadata in enumerate(self.image_temp_metadata):
-            faiss_id = self.image_index.ntotal - len(self.image_temp) + i
-            self.image_temp_metadata[faiss_id] = metadata
+        self.maybe_compact()
 
 
-        if self.verbose:
-            print("finish training...")
+    def _tombstone_paths(self , file_paths) -> int:
+        with self._lock:
+            removed = self.metadata.pop_paths(file_paths)
+            for type , faiss_id in removed:
+                _ , tombstones = self._parts(type)
+                tombstones.add(faiss_id)
+            if removed:
+                self.generation += 1
+        return len(removed)
 
-        self._clear_temp()
-        
+    def path_id(self , file_path:str):
+        """
+        returns:
+            tuple(type , id) of the live vector of a file , or None when it is not indexed
+        """
+        return self.metadata.lookup(file_path)
+
+    def remove_paths(self , file_paths:List[str]) -> int:
+        """
+        Function to remove files from the index
+        Their ids are tombstoned (never returned by search again) and compaction is
+        started in the background once enough of an index is dead.
+        args:
+            file_paths (list) : paths of the files
+        returns:
+            int : number of vectors removed
+        """
+        self._check_writable()
+        with self._lock:
+            file_paths = set(file_paths)
+            removed = self._tombstone_paths(file_paths)
+
+            # not yet added embeddings of these files
+            for temp , temp_metadata in ((self.text_temp , self.text_temp_metadata),
+                                         (self.image_temp , self.image_temp_metadata)):
+                keep = [n for n , meta in enumerate(temp_metadata) if meta["file_path"] not in file_paths]
+                if len(keep) == len(temp_metadata):
+                    continue
+                stack = np.vstack(temp)
+                temp[:] = [stack[keep]] if keep else []
+                temp_metadata[:] = [temp_metadata[n] for n in keep]
+
+        if removed:
+            self.maybe_compact()
+        return removed
+
+    def update_path(self , file_path:str , type:str , embedding:np.array , metadata:Dict):
+        """
+        Function to replace the vector of a file (e.g. after it was modified or moved)
+        The old vector is removed right away , the new one is added with the next train_add.
+        args:
+            file_path (str) : path the file was indexed under
+            type (str) : "text" or "image"
+            embedding (np.array) : new embedding
+            metadata (dict) : new metadata , its file_path may differ for moved files
+        """
+        self.remove_paths([file_path])
+        self.store_temp(type=type , embedding=embedding , metadata=metadata)
+
+
+    def tombstone_ratio(self , type:str) -> float:
+        index , tombstones = self._parts(type)
+        return len(tombstones) / index.ntotal if index.ntotal else 0.0
+
+    def needs_retrain(self , type:str) -> bool:
+        """
+        Whether compaction should also rebuild an index without tombstones (to retrain it)
+        """
+        return False
+
+    def maybe_compact(self , background:bool = True):
+        """
+        Function to compact every index whose tombstone ratio crossed compaction_threshold
+        (or which needs_retrain)
+        """
+        for type in ("text" , "image"):
+            if self.tombstone_ratio(type) >= self.compaction_threshold or self.needs_retrain(type):
+                self.compact(type , background=background)
+
+    def compact(self , type:str , background:bool = True):
+        """
+        Function to drop the tombstoned vectors of one index (see _compact of the subclass)
+        args:
+            type (str) : "text" or "image"
+            background (bool) : run it on a daemon thread
+        """
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            if not background:
+                self._compaction_thread.join()
+            else:
+                return
+
+        if background:
+            self._compaction_thread = threading.Thread(target=self._compact , args=(type,) , daemon=True)
+            self._compaction_thread.start()
+        else:
+            self._compact(type)
+
+    def wait_for_compaction(self):
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+
+    def _search(self , type:str , query_embed:np.array , k:int , param:int = None , timings:Dict = None):
+        if timings is None:
+            dist , indices = self._search_matrix(type , query_embed , k , param)
+            return self._with_metadata(dist[0] , indices[0])
+
+        start = time.perf_counter()
+        dist , indices = self._search_matrix(type , query_embed , k , param)
+        searched = time.perf_counter()
+        result = self._with_metadata(dist[0] , indices[0])
+        timings["faiss_search"] = timings.get("faiss_search" , 0.0) + searched - start
+        timings["metadata"] = timings.get("metadata" , 0.0) + time.perf_counter() - searched
+        return result
+
+    def _search_batch(self , type:str , query_embeds:np.array , k:int , param:int = None , timings:Dict = None):
+        """
+        Searches many queries in one index with a single (nq , dim) search call
+        returns:
+            list : (distance , indices , metadatas) per query , like search_text / search_image
+        """
+        if timings is None:
+            timings = {}
+        start = time.perf_counter()
+        dist , indices = self._search_matrix(type , query_embeds , k , param)
+        searched = time.perf_counter()
+        # one metadata read for the hits of every query
+        metadata = self.metadata.get_many(i for i in np.unique(indices) if i >= 0)
+        results = [self._with_metadata(dist[n] , indices[n] , metadata) for n in range(len(indices))]
+        timings["faiss_search"] = timings.get("faiss_search" , 0.0) + searched - start
+        timings["metadata"] = timings.get("metadata" , 0.0) + time.perf_counter() - searched
+        return results
+
+    def _search_fused(self , query_embed: np.array , k:int , image_weight:float , param:int = None , timings:Dict = None):
+        """
+        Searches both indexes concurrently (faiss releases the GIL) and fuses the hits , see search_fused
+        """
+        if self._search_pool is None:
+            self._search_pool = ThreadPoolExecutor(max_workers=2 , thread_name_prefix="faiss-search")
+        type_timings = {type : ({} if timings is not None else None) for type in ("text" , "image")}
+        futures = {type : self._search_pool.submit(self._search , type , query_embed , k , param , type_timings[type])
+                   for type in ("text" , "image")}
+        results = {type : future.result() for type , future in futures.items()}
+        if timings is not None:
+            for stage in ("faiss_search" , "metadata"):
+                timings[stage] = timings.get(stage , 0.0) + max(t[stage] for t in type_timings.values())
+        return self.fuse(results , k , image_weight)
+
+    def fuse(self , results:Dict , k:int , image_weight:float):
+        """
+        Merges the results of one query in both indexes , the indexes return squared L2 distances ,
+        on unit vectors cosine = 1 - d / 2. Scores stay on a fixed scale , the cosine times the
+        constant calibration of its index (config.FUSED_SCORE_SCALE) , weighted with the router prior
+        (image_weight , the text index gets 1 - image_weight).
+        args:
+            results (dict) : type -> (distance , indices , metadatas)
+        returns:
+            tuple : (scores , indices , metadatas) , the metadatas are copies carrying their "type"
+        """
+        weights = {"text" : 1.0 - image_weight , "image" : image_weight}
+        hits = []
+        metadata = {}
+        for type , (dist , indices , meta_data) in results.items():
+            cosine = 1.0 - dist / 2.0
+            scores = cosine * config.FUSED_SCORE_SCALE[type] * weights[type]
+            for score , faiss_id in zip(scores , indices):
+                hits.append((float(score) , int(faiss_id)))
+                # new dicts , meta_data may be shared with a cached result
+                metadata[str(faiss_id)] = {**meta_data[str(faiss_id)] , "type" : type}
+
+        hits = sorted(hits , reverse=True)[:k]
+        scores = np.array([score for score , _ in hits] , dtype="float32")
+        indices = np.array([faiss_id for _ , faiss_id in hits] , dtype="int64")
+        return (scores , indices , {str(i) : metadata[str(i)] for i in indices})
+
+    def _with_metadata(self , dist:np.array , indices:np.array , metadata:Dict = None):
+        """
+        Drops hits which have no metadata (padding -1) and reads the metadata of the rest
+        (or takes it from metadata , id -> metadata , when already read)
+        """
+        if metadata is None:
+            metadata = self.metadata.get_many(i for i in indices if i >= 0)
+        keep = [n for n , i in enumerate(indices) if int(i) in metadata]
+        dist , indices = dist[keep] , indices[keep]
+        meta_data = {str(i) : metadata[int(i)] for i in indices}
+
+        return (dist , indices , meta_data)
+    
 
     def _clear_temp(self):
         self.text_temp = []
@@ -112,238 +463,1192 @@ class FAISSManagerIVF:
         """
         Function to reset index to null
         """
-        self.text_index.reset()
-        self.image_index.reset()
+        with self._lock:
+            self.text_index = self._new_index("text")
+            self.image_index = self._new_index("image")
+            self.metadata = MetadataStore()
+            self.read_only = False
+            self.generation += 1
+            self.text_tombstones = set()
+            self.image_tombstones = set()
+            self.next_id = 0
+            self.trained_on = {"text" : 0 , "image" : 0}
+            self._clear_temp()
 
     def current_size(self) -> tuple:
         """
-        Function to give current sizes of indexs
+        Function to give current sizes of indexs (live vectors , tombstones not counted)
         return:
             tuple(text index size , image index size)
         """
-        image_size = self.image_index.ntotal
-        text_size = self.text_index.ntotal
+        image_size = self.image_index.ntotal - len(self.image_tombstones)
+        text_size = self.text_index.ntotal - len(self.text_tombstones)
 
         return (text_size , image_size)
-    
+
     def save_state(self):
         """
         Function to save state
         """
-        faiss.write_index(self.text_index , "index/text_index.index")
-        faiss.write_index(self.image_index , "index/image_index.index")
+        self._check_writable()
+        os.makedirs("index" , exist_ok=True)
+        with self._lock:
+            faiss.write_index(self.text_index , "index/text_index.index")
+            faiss.write_index(self.image_index , "index/image_index.index")
+
+            self.metadata.save()
+            # metadata of indexes saved before the store existed was moved into it on load
+            for json_path in ("index/text_meta.json" , "index/image_meta.json"):
+                if os.path.exists(json_path):
+                    os.remove(json_path)
+
+            with open("index/id_state.json" , "w+") as file:
+                json.dump({
+                    "next_id" : self.next_id,
+                    "text_tombstones" : sorted(self.text_tombstones),
+                    "image_tombstones" : sorted(self.image_tombstones),
+                    "trained_on" : self.trained_on,
+                    **self._index_state()
+                } , file)
 
-        with open("index/file_meta.json" , "w+") as file:
-            json.dump(self.metadata , file)
 
         print("saved")
 
-    def load_state(self):
+    def _index_state(self) -> dict:
+        """
+        returns:
+            parameters of the indexes , saved in index/id_state.json
+        """
+        return {}
+
+    def _load_index_state(self , id_state:dict):
+        """
+        Restores what _index_state saved
+        """
+
+    def _accepts(self , index) -> bool:
+        """
+        Whether a saved index is of the kind this manager builds
+        """
+        return True
+
+    def _adopt(self , index , first_id:int = 0):
+        """
+        args:
+            first_id (int) : id of the first vector of an index which numbers its vectors by position
+        returns:
+            the loaded index as this manager keeps it
+        """
+        return index
+
+    def _positional(self , index) -> bool:
+        """
+        Whether a saved index numbers its vectors by position (saved before ids were explicit) ,
+        both indexes then count from 0
+        """
+        return False
+
+    def _stored_ids(self , index) -> np.array:
+        """
+        returns:
+            ids of every vector of index (indexes saved without id_state.json)
+        """
+        raise NotImplementedError
+
+    def _after_load(self , mmap:bool):
+        """
+        Called by load_state once the indexes , metadata and id state are loaded
+        """
+
+    @staticmethod
+    def _read_flags(mmap:bool) -> int:
+        """
+        faiss >= 1.10 maps the vector storage of flat indexes zero copy with IO_FLAG_MMAP_IFC ,
+        older versions only honour IO_FLAG_MMAP for inverted lists and still copy the HNSW storage
+        """
+        if not mmap:
+            return 0
+        return getattr(faiss , "IO_FLAG_MMAP_IFC" , faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+    def load_state(self , mmap:bool = False) -> bool:
         """
         Function to load state
+        args:
+            mmap (bool) : map the index files read only instead of reading them into memory ,
+                for processes which only search (adding / removing / saving raises then)
+        return:
+            True if a saved index was found
         """
-        self.text_index = faiss.read_index("index/text_index.index")
-        self.image_index = faiss.read_index("index/image_index.index")
 
-        with open("index/file_meta.json" , "w+") as file:
-            self.metadata = json.load(file)
+        text_index_path = "index/text_index.index"
+        image_index_path = "index/image_index.index"
+        if os.path.exists(text_index_path) and os.path.exists(image_index_path):
+            with self._lock:
+                flags = self._read_flags(mmap)
+                indexes = {}
+                for path in (text_index_path , image_index_path):
+                    indexes[path] = faiss.read_index(path , flags)
+                    if not self._accepts(indexes[path]):
+                        print(f"{path} was not built by {self.__class__.__name__} , index again with --full")
+                        return False
+                text_index , image_index = indexes[text_index_path] , indexes[image_index_path]
+                # positional ids of both indexes start at 0 , the image ids move past the text ones
+                image_offset = text_index.ntotal if self._positional(image_index) else 0
+                self.text_index = self._adopt(text_index)
+                self.image_index = self._adopt(image_index , first_id=image_offset)
+                self.read_only = mmap
+                self.generation += 1
+
+                self.metadata = MetadataStore()
+                if not self.metadata.load(read_only=mmap):
+                    # index saved with JSON sidecars
+                    self.metadata.import_json("text" , "index/text_meta.json")
+                    self.metadata.import_json("image" , "index/image_meta.json" , id_offset=image_offset)
+
+                if os.path.exists("index/id_state.json"):
+                    with open("index/id_state.json" , "r+") as file:
+                        id_state = json.load(file)
+                    self.next_id = id_state["next_id"]
+                    self.text_tombstones = set(id_state["text_tombstones"])
+                    self.image_tombstones = set(id_state["image_tombstones"])
+                    # indexes saved before it was recorded count as trained well enough
+                    self.trained_on = id_state.get("trained_on" , {"text" : self.train_size , "image" : self.train_size})
+                    self._load_index_state(id_state)
+                else:
+                    self.next_id = self.text_index.ntotal + self.image_index.ntotal
+                    self.text_tombstones = set(self._stored_ids(self.text_index).tolist()) - set(self.metadata.ids("text").tolist())
+                    self.image_tombstones = set(self._stored_ids(self.image_index).tolist()) - set(self.metadata.ids("image").tolist())
+
+                self._after_load(mmap)
+
+                self._clear_temp()
+            return True
+        else:
+            print("index not found")
+            return False
 
 
 
-class FAISSManagerHNSW:
+class FAISSManagerIVF(FAISSManager):
     """
-    Class to manage FASISS db with HNSW
+    Class to manage FAISS db with IVF-PQ , for corpora (10M+ vectors) where building and
+    holding HNSW graphs takes too long / too much memory
+
+    Each index is trained once , on a random sample (train_sample vectors) of the first
+    train_size vectors it gets , which are buffered until then. Every later batch is
+    encoded with the trained quantizers and appended to the inverted lists , nothing is
+    retrained. nlist comes from the expected corpus size (nlist_for) and is lowered at
+    training time so every centroid gets 39 training points.
+
+    nprobe (lists visited per query) is kept per index (set_params , tune_nprobe) and saved
+    with it , every search can also override it. Compaction removes the tombstoned ids
+    from the lists in place.
     """
 
-    def __init__(self , embedding_dim:int = 512 ,subvector_count:int = 16 , nbit:int = 4 , verbose=False):
+    def __init__(self, n_cluster:int = None , embedding_dim: int = 512 , sub_vector_count:int = config.IVF_PQ_SUBVECTORS , verbose=False,
+                 nbit:int = config.IVF_PQ_NBIT , expected_size:int = config.IVF_EXPECTED_SIZE , nprobe:int = config.IVF_NPROBE,
+                 train_size:int = config.IVF_TRAIN_SIZE , train_sample:int = config.IVF_TRAIN_SAMPLE , compaction_threshold:float = 0.2):
 
-        # HYPERPARAMS
-        #emebdding dim
-        self.embedding_dim = embedding_dim
+        if embedding_dim % sub_vector_count:
+            raise ValueError(f"Embedding dim {embedding_dim} is not divisible by {sub_vector_count} sub vectors")
         # for PQ
-        self.subvector_count = subvector_count
+        self.subvector = sub_vector_count
         self.nbit = nbit
-        #for HNSW
-        self.M = 32
+        # lists of new indexes , None = sized for expected_size
+        self.n_cluster = n_cluster or self.nlist_for(expected_size)
+        self.nprobe = {"text" : nprobe , "image" : nprobe}
+        # vectors the quantizers are trained on , sampled from the first train_size
+        self.train_sample = train_sample
+        self._rng = np.random.default_rng(0)
 
-        self.text_index = faiss.IndexHNSWFlat(embedding_dim, self.M)
-        self.image_index = faiss.IndexHNSWFlat(embedding_dim ,self.M)
+        super().__init__(embedding_dim=embedding_dim , verbose=verbose , compaction_threshold=compaction_threshold,
+                         train_size=train_size)
 
-        self.text_index.hnsw.efConstruction = 80
-        self.text_index.hnsw.efSearch = 16
-        self.image_index.hnsw.efConstruction = 80
-        self.image_index.hnsw.efSearch = 16
 
-        self.text_metadata = {}
-        self.image_metadata = {}
+    @staticmethod
+    def nlist_for(expected_size:int) -> int:
+        """
+        returns:
+            number of inverted lists for a corpus of expected_size vectors (~4 sqrt(n) , the low end
+            of what faiss suggests , keeps training small)
+        """
+        return int(min(65536 , max(1 , 4 * np.sqrt(expected_size))))
+
+    def _new_index(self , type:str , nlist:int = None):
+        index = faiss.index_factory(self.embedding_dim , f"IVF{nlist or self.n_cluster},PQ{self.subvector}x{self.nbit}")
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        ivf.nprobe = self.nprobe[type]
+        # the factory turns on polysemous training , a slow extra pass whose codes only pay off with a
+        # polysemous_ht at search time , which is never set here
+        ivf.do_polysemous_training = False
+        return index
+
+    def _can_train(self , count:int) -> bool:
+        # the PQ codebooks need 2^nbit points , repeating vectors to get there would train them on duplicates
+        return count >= 2 ** self.nbit
+
+    def _train_index(self , type:str , vectors:np.array):
+        # every vector stored before training is still buffered (vectors) , so the sample is
+        # picked by row instead of being copied aside while they arrive
+        sample = vectors
+        if len(vectors) > self.train_sample:
+            rows = np.sort(self._rng.choice(len(vectors) , self.train_sample , replace=False))
+            sample = vectors[rows]
+        # every centroid wants ~39 training points , the index is still empty so it can be rebuilt smaller
+        nlist = max(1 , min(self.n_cluster , len(sample) // 39))
+        index , _ = self._parts(type)
+        if faiss.extract_index_ivf(index).nlist != nlist:
+            index = self._new_index(type , nlist)
+            setattr(self , f"{type}_index" , index)
 
-        self.text_temp = []
-        self.image_temp = [] 
-        self.text_temp_metadata = []
-        self.image_temp_metadata = []
+        if self.verbose:
+            print(f"training {type} index: {nlist} lists on {len(sample)} of {len(vectors)} vectors")
+        index.train(sample)
+        self.trained_on[type] = len(sample)
+        return index
 
-        self.verbose = verbose
+    def set_params(self , type:str , nprobe:int = None):
+        """
+        Function to change the lists visited per search of one index , saved with it by save_state
+        """
+        self._parts(type)
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe[type] = int(nprobe)
+                self.generation += 1
+                index , _ = self._parts(type)
+                faiss.extract_index_ivf(index).nprobe = self.nprobe[type]
+
+    def params(self) -> dict:
+        return {
+            "nlist" : {type : faiss.extract_index_ivf(self._parts(type)[0]).nlist for type in ("text" , "image")},
+            "nprobe" : dict(self.nprobe),
+            "subvector_count" : self.subvector,
+            "nbit" : self.nbit
+        }
+
+    def measure_nprobe(self , type:str , nprobe_values:List[int] , k:int = 10 , sample:int = 200 , seed:int = 0,
+                       queries:np.array = None) -> List[Dict]:
+        """
+        Function to measure recall@k and latency of nprobe values
+        Recall is against a search of every list , so it is what nprobe loses , not what the
+        PQ codes lose. Without queries a sample of the stored vectors (decoded) is used , they
+        sit in their own list so the recall is optimistic , real query embeddings are better.
+        args:
+            queries (np.array) : (nq , dim) query embeddings , None = sample stored vectors
+        returns:
+            list : dict(nprobe , recall , latency_ms) per value , latency is per single query search
+        """
+        with self._lock:
+            index , _ = self._parts(type)
+            live = self.metadata.ids(type)
+            if len(live) == 0 or not index.is_trained:
+                return []
+            if queries is None:
+                # vectors of the index itself (FAISSManagerOnDisk keeps new ones in shards until they are merged)
+                stored = np.intersect1d(live , self._stored_ids(index))
+                picked = np.random.default_rng(seed).choice(stored , size=min(sample , len(stored)) , replace=False)
+                # reconstructing by id needs an id -> list map (a hash table , the ids are not 0..n) , built for the moment
+                index.set_direct_map_type(faiss.DirectMap.Hashtable)
+                try:
+                    queries = np.vstack([index.reconstruct(int(faiss_id)) for faiss_id in picked])
+                finally:
+                    index.set_direct_map_type(faiss.DirectMap.NoMap)
+            queries = np.asarray(queries , dtype="float32").reshape(-1 , self.embedding_dim)
+
+            k = min(k , len(live))
+            nlist = faiss.extract_index_ivf(index).nlist
+            exact = self._search_matrix(type , queries , k , nlist)[1]
+
+        results = []
+        for nprobe in nprobe_values:
+            found = []
+            start = time.perf_counter()
+            for query in queries:
+                found.append(self._search_matrix(type , query , k , nprobe)[1][0])
+            latency = (time.perf_counter() - start) / len(queries)
+            recall = np.mean([len(np.intersect1d(hits , truth)) / k for hits , truth in zip(found , exact)])
+            results.append({"nprobe" : int(nprobe) , "recall" : float(recall) , "latency_ms" : latency * 1000})
+        return results
+
+    def tune_nprobe(self , type:str , target_recall:float = None , latency_budget_ms:float = None , k:int = 10,
+                    nprobe_values:List[int] = (1 , 2 , 4 , 8 , 16 , 32 , 64 , 128 , 256) , sample:int = 200,
+                    queries:np.array = None) -> Dict:
+        """
+        Function to pick nprobe of one index for a recall target and / or a latency budget ,
+        see measure_nprobe and FAISSManagerHNSW.tune_ef_search
+        returns:
+            dict(nprobe , recall , latency_ms , measurements) , nprobe None if nothing was chosen
+        """
+        if target_recall is None and latency_budget_ms is None:
+            raise ValueError("give a target_recall and / or a latency_budget_ms")
 
+        index , _ = self._parts(type)
+        nlist = faiss.extract_index_ivf(index).nlist
+        measurements = self.measure_nprobe(type , sorted(n for n in nprobe_values if n <= nlist) , k=k , sample=sample , queries=queries)
+        chosen = self._pick(measurements , target_recall , latency_budget_ms)
 
-    def store_temp(self,  type:str , embedding:np.array  , metadata:Dict):
+        if chosen is not None:
+            self.set_params(type , nprobe=chosen["nprobe"])
+        if self.verbose:
+            print(f"{type} index: nprobe {chosen['nprobe'] if chosen else None} from {measurements}")
+        return {**(chosen or {"nprobe" : None , "recall" : None , "latency_ms" : None}) , "measurements" : measurements}
+
+    def _compact(self , type:str):
+        with self._lock:
+            index , tombstones = self._parts(type)
+            dead = np.fromiter(tombstones , dtype="int64" , count=len(tombstones))
+            if self.verbose:
+                print(f"compacting {type} index , dropping {len(dead)} of {index.ntotal} vectors")
+            # inverted lists drop vectors in place , nothing is rebuilt
+            index.remove_ids(faiss.IDSelectorBatch(dead))
+            tombstones.clear()
+            self.generation += 1
+
+
+    def _search_matrix(self , type:str , query_embed:np.array , k:int , nprobe:int = None):
         """
-        Funtion to store embedding in temporary list 
+        One index.search for every row of query_embed
+        args:
+            nprobe (int) : lists visited by this call , None = the number set for the index
+        returns:
+            tuple : (distances , indices) , (nq , k) each
         """
+        if query_embed.ndim == 1:
+            query_embed = query_embed.reshape(1 , -1)
 
-        if len(self.text_temp) >= 1000 or len(self.image_temp) >= 1000:
-            self.train_add()
+        index , _ = self._parts(type)
+        # the selectors are held in a local so they outlive the search call
+        params , selectors = self._search_params(type , nprobe)
+        return index.search(query_embed.astype("float32") , k , params=params)
 
-        else:
+    def _search_params(self , type:str , nprobe:int = None) -> tuple:
+        """
+        returns:
+            tuple(SearchParametersIVF , the selectors it points to) , the selectors have to be
+            kept alive until the search returns
+        """
+        _ , tombstones = self._parts(type)
+        params = faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe[type])
+        selectors = ()
+        if tombstones:
+            dead = np.fromiter(tombstones , dtype="int64" , count=len(tombstones))
+            dead_selector = faiss.IDSelectorBatch(dead)
+            live_selector = faiss.IDSelectorNot(dead_selector)
+            params.sel = live_selector
+            selectors = (dead_selector , live_selector)
+        return params , selectors
+
+    def search_batch(self , type:str , query_embeds:np.array , k:int = config.SEARCH_K , nprobe:int = None , timings:Dict = None):
+        """
+        function to search many queries in one index with a single (nq , dim) search call
+        args:
+            type (str) : "text" or "image"
+            query_embeds (np.array) : (nq , dim) query embeddings
+            k (int) : number of results per query
+            nprobe (int) : lists visited by this call , None = the number set for the index
+            timings (dict) : if given , seconds spent in "faiss_search" / "metadata" (for the whole batch) are added to it
+        returns:
+            list : (distance , indices , metadatas) per query , like search_text / search_image
+        """
+        return self._search_batch(type , query_embeds , k , nprobe , timings)
 
-            if embedding.ndim == 1:
-                embedding = embedding.reshape(1 , -1)
-            
-            #smoll error handeling step 
-            if embedding.shape[1] != self.embedding_dim:
-                raise ValueError(f"Embedding must have dim {self.embedding_dim}")
-            
+    def search_image(self , query_embed: np.array , k:int = config.SEARCH_K , nprobe:int = None , timings:Dict = None):
+        """
+        function to search in image index
+        args:
+            query_embed (np.array) : query embedding vector
+            k (int) : number of results
+            nprobe (int) : lists visited by this call , None = the number set for the index
+            timings (dict) : if given , seconds spent in "faiss_search" / "metadata" are added to it
+        returns:
+            tuple : (distance , indices , metadatas)
+        """
+        return self._search("image" , query_embed , k , nprobe , timings)
 
-            if type == "image":
-                self.image_temp.append(embedding.astype("float32"))
-                self.image_temp_metadata.append(metadata)
+    def search_text(self , query_embed: np.array , k:int = config.SEARCH_K , nprobe:int = None , timings:Dict = None):
+        """
+        function to search in text index
+        args:
+            query_embed (np.array) : query embedding vector
+            k (int) : number of results
+            nprobe (int) : lists visited by this call , None = the number set for the index
+            timings (dict) : if given , seconds spent in "faiss_search" / "metadata" are added to it
+        returns:
+            tuple : (distance , indices , metadatas)
+        """
+        return self._search("text" , query_embed , k , nprobe , timings)
 
-            elif type == "text":
-                self.text_temp.append(embedding.astype("float32"))
-                self.text_temp_metadata.append(metadata)
+    def search_fused(self , query_embed: np.array , k:int = config.SEARCH_K , image_weight:float = 0.5 , nprobe:int = None , timings:Dict = None):
+        """
+        function to search both indexes at once and merge the hits into one top k list , see fuse
+        args:
+            query_embed (np.array) : query embedding vector
+            k (int) : number of results
+            image_weight (float) : prior of the image index (e.g. p(IMAGE) of the router)
+            nprobe (int) : lists visited by this call , None = the number set for each index
+            timings (dict) : like search_text , the slower of the two concurrent searches is added
+        returns:
+            tuple : (scores , indices , metadatas) , every metadata carries its "type"
+        """
+        return self._search_fused(query_embed , k , image_weight , nprobe , timings)
 
-            else:
-                raise Exception("Incorrect embedding type")
-            
-    
-    def train_add(self):
+    def _index_state(self) -> dict:
+        return {"ivf" : self.params()}
 
-        if self.verbose:
-            print("training ....")
+    def _load_index_state(self , id_state:dict):
+        self.nprobe.update(id_state.get("ivf" , {}).get("nprobe" , {}))
 
-        if len(self.text_temp) != 0:
-            text_stack = np.vstack(self.text_temp)
-            self.text_index.train(text_stack)
+    @staticmethod
+    def _on_disk(index) -> bool:
+        """
+        Whether the lists of an IVF index live in a file of their own (FAISSManagerOnDisk) , lists
+        of an index file mapped with IO_FLAG_MMAP are OnDiskInvertedLists too , without a file name
+        """
+        lists = faiss.downcast_InvertedLists(faiss.extract_index_ivf(index).invlists)
+        return isinstance(lists , faiss.OnDiskInvertedLists) and bool(lists.filename)
+
+    def _accepts(self , index) -> bool:
+        # adding to lists on disk here would write into the file query processes map
+        return isinstance(index , faiss.IndexIVF) and not self._on_disk(index)
+
+    def _stored_ids(self , index) -> np.array:
+        invlists = index.invlists
+        ids = [faiss.rev_swig_ptr(invlists.get_ids(n) , invlists.list_size(n)).copy()
+               for n in range(index.nlist) if invlists.list_size(n)]
+        return np.concatenate(ids) if ids else np.zeros(0 , dtype="int64")
 
-            self.text_index.add(text_stack)
+    def _after_load(self , mmap:bool):
+        # indexes rebuilt by reset keep the PQ of the saved ones
+        pq = faiss.downcast_index(self.text_index).pq
+        self.subvector , self.nbit = pq.M , pq.nbits
+        for type in ("text" , "image"):
+            index , _ = self._parts(type)
+            index.nprobe = self.nprobe[type]
 
-            #storirng metadata
 
-            for i , meta in enumerate(self.text_temp_metadata):
-                faiss_id = self.text_index.ntotal - len(self.text_temp) + i
-                self.text_metadata[faiss_id] = meta
 
-        if len(self.image_temp) != 0:
-            image_stack = np.vstack(self.image_temp)
-            self.image_index.train(image_stack)
-            self.image_index.add(image_stack)
+class FAISSManagerOnDisk(FAISSManagerIVF):
+    """
+    Class to manage FAISS db with IVF-PQ whose inverted lists live on disk (OnDiskInvertedLists) ,
+    for corpora whose codes do not fit in memory
+
+    Training is the one of FAISSManagerIVF. After it vectors go into shards , IVF indexes with
+    the trained quantizer built independently of the lists on disk. The open shard is kept in
+    memory until it holds shard_size vectors , then it is written to index/shards/ and mapped.
+    save_state merges the lists on disk and every shard into a new index/{type}_lists.{n}.ivfdata ,
+    drops the tombstoned vectors from it and writes the header (quantizer , PQ , list offsets)
+    to index/{type}_index.index. Files nothing points to any more are deleted after that ,
+    processes which still map them keep reading them until they load again.
+
+    Searches visit the lists on disk and the shards not merged yet. load_state only reads the
+    header , the lists file is memory mapped , so a query pages in the nprobe lists it visits.
+    """
 
+    def __init__(self, n_cluster:int = None , embedding_dim: int = 512 , sub_vector_count:int = config.IVF_PQ_SUBVECTORS , verbose=False,
+                 nbit:int = config.IVF_PQ_NBIT , expected_size:int = config.IVF_EXPECTED_SIZE , nprobe:int = config.IVF_NPROBE,
+                 train_size:int = config.IVF_TRAIN_SIZE , train_sample:int = config.IVF_TRAIN_SAMPLE , compaction_threshold:float = 0.2,
+                 shard_size:int = config.ONDISK_SHARD_SIZE):
 
-            for i , meta in enumerate(self.image_temp_metadata):
-                faiss_id = self.image_index.ntotal - len(self.image_temp) + i
-                self.image_metadata[faiss_id] = meta
+        self.shard_size = shard_size
+        # type -> [(shard index , its file or None while it is open)] , not merged yet
+        self.shards = {"text" : [] , "image" : []}
+        # number of the current lists file of each index , every merge writes the next one
+        self.merges = {"text" : 0 , "image" : 0}
+        self._shard_seq = 0
 
-        
-        self._clear_temp()
+        super().__init__(n_cluster=n_cluster , embedding_dim=embedding_dim , sub_vector_count=sub_vector_count , verbose=verbose,
+                         nbit=nbit , expected_size=expected_size , nprobe=nprobe , train_size=train_size,
+                         train_sample=train_sample , compaction_threshold=compaction_threshold)
 
 
-    def search_image(self , query_embed: np.array):
+    @staticmethod
+    def _read_flags(mmap:bool) -> int:
+        """
+        OnDiskInvertedLists maps the lists file itself , read only (merges write new files). IO_FLAG_MMAP
+        is for lists stored inside the index file , faiss 1.9 crashes searching lists on disk read with it
+        """
+        return faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY
+
+    @staticmethod
+    def _empty_like(index):
         """
-        function to search in image index
-        args:
-            query_embed (np.array) : query embedding vector
         returns:
-            tuple : (distance , indices , metadatas)
+            an empty copy of a trained IVF index (same quantizer and PQ) with its lists in memory
         """
-        k = 3 
-        if query_embed.ndim == 1:
-            query_embed = query_embed.reshape(1 , -1)
+        if not FAISSManagerIVF._on_disk(index):
+            empty = faiss.clone_index(index)
+            empty.reset()
+            return empty
+        # lists on disk cannot be cloned , the serialized header only holds their offsets
+        empty = faiss.deserialize_index(faiss.serialize_index(index) , faiss.IO_FLAG_SKIP_IVF_DATA)
+        ivf = faiss.extract_index_ivf(empty)
+        lists = faiss.ArrayInvertedLists(ivf.nlist , ivf.code_size)
+        ivf.replace_invlists(lists , True)
+        # owned by the index now
+        lists.this.disown()
+        ivf.ntotal = 0
+        return empty
+
+    def _add(self , type:str , index , vectors:np.array , ids:np.array):
+        shards = self.shards[type]
+        if not shards or shards[-1][1] is not None:
+            shards.append((self._empty_like(index) , None))
+        shard , _ = shards[-1]
+        shard.add_with_ids(vectors , ids)
+        if shard.ntotal >= self.shard_size:
+            self._write_shard(type)
+
+    def _write_shard(self , type:str):
+        """
+        Function to write the open shard to index/shards/ and map it instead of holding it in memory
+        """
+        shard , _ = self.shards[type][-1]
+        os.makedirs("index/shards" , exist_ok=True)
+        self._shard_seq += 1
+        path = f"index/shards/{type}_{self._shard_seq}.index"
+        faiss.write_index(shard , path)
+        self.shards[type][-1] = (faiss.read_index(path , faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY) , path)
+        if self.verbose:
+            print(f"{type} shard of {shard.ntotal} vectors written to {path}")
 
-        dist , indices = self.image_index.search(query_embed.astype("float32") , k)
-        meta_data = {}
-        for i in indices[0]:
-            meta_data[str(i)] = self.image_metadata[str(i)]
+    def _merge(self , type:str , force:bool = False) -> bool:
+        """
+        Function to merge the lists on disk and the shards of one index into a new lists file ,
+        without the tombstoned vectors. Runs when there are shards , when the lists are not on disk
+        yet or when tombstones passed compaction_threshold (any tombstone with force).
+        The header pointing to the new file is written by save_state.
+        returns:
+            True if a new lists file was written
+        """
+        with self._lock:
+            index , tombstones = self._parts(type)
+            if not index.is_trained:
+                return False
+            if not (self.shards[type] or (index.ntotal and not self._on_disk(index))
+                    or (force and tombstones) or self.tombstone_ratio(type) >= self.compaction_threshold):
+                return False
+
+            self.merges[type] += 1
+            path = f"index/{type}_lists.{self.merges[type]}.ivfdata"
+            os.makedirs("index" , exist_ok=True)
+            ivf = faiss.extract_index_ivf(index)
+            lists = faiss.OnDiskInvertedLists(ivf.nlist , ivf.code_size , path)
+            sources = faiss.InvertedListsPtrVector()
+            parts = [part for part in [index] + [shard for shard , _ in self.shards[type]] if part.ntotal]
+            for part in parts:
+                sources.push_back(faiss.extract_index_ivf(part).invlists)
+            ntotal = lists.merge_from_multiple(sources.data() , sources.size())
+
+            merged = self._empty_like(index)
+            merged_ivf = faiss.extract_index_ivf(merged)
+            merged_ivf.replace_invlists(lists , True)
+            lists.this.disown()
+            merged_ivf.ntotal = ntotal
+            if tombstones:
+                merged.remove_ids(faiss.IDSelectorBatch(np.fromiter(tombstones , dtype="int64" , count=len(tombstones))))
+                tombstones.clear()
+            merged_ivf.nprobe = self.nprobe[type]
+            if self.verbose:
+                print(f"merged {len(parts)} parts of the {type} index into {path} , {merged.ntotal} vectors")
+
+            setattr(self , f"{type}_index" , merged)
+            self.shards[type] = []
+            self.generation += 1
+            return True
+
+    def _remove_stale_files(self):
+        """
+        Function to delete the lists files and shards nothing points to any more (merged , or
+        left behind by a run which did not save)
+        """
+        keep = set()
+        for type in ("text" , "image"):
+            index , _ = self._parts(type)
+            if self._on_disk(index):
+                keep.add(os.path.abspath(faiss.downcast_InvertedLists(faiss.extract_index_ivf(index).invlists).filename))
+            keep.update(os.path.abspath(path) for _ , path in self.shards[type] if path)
+        for path in glob.glob("index/*_lists.*.ivfdata") + glob.glob("index/shards/*.index"):
+            if os.path.abspath(path) not in keep:
+                os.remove(path)
+
+    def _ntotal(self , type:str) -> int:
+        index , _ = self._parts(type)
+        return index.ntotal + sum(shard.ntotal for shard , _ in self.shards[type])
+
+    def tombstone_ratio(self , type:str) -> float:
+        _ , tombstones = self._parts(type)
+        ntotal = self._ntotal(type)
+        return len(tombstones) / ntotal if ntotal else 0.0
+
+    def maybe_compact(self , background:bool = True):
+        """
+        Tombstones are dropped by the merges of save_state (see _merge) , nothing runs in between
+        """
 
-        return (dist[0] , indices[0] , meta_data)
+    def _compact(self , type:str):
+        self._merge(type , force=True)
 
-    def search_text(self , query_embed: np.array):
+    def current_size(self) -> tuple:
         """
-        function to search in text index
+        Function to give current sizes of indexs (live vectors , tombstones not counted)
+        return:
+            tuple(text index size , image index size)
+        """
+        return (self._ntotal("text") - len(self.text_tombstones) , self._ntotal("image") - len(self.image_tombstones))
+
+
+    def _search_matrix(self , type:str , query_embed:np.array , k:int , nprobe:int = None):
+        """
+        Searches the lists on disk and every shard , keeps the k best hits of each query
         args:
-            query_embed (np.array) : query embedding vector
+            nprobe (int) : lists visited by this call , None = the number set for the index
         returns:
-            tuple : (distance , indices , metadatas)
+            tuple : (distances , indices) , (nq , k) each , padded with inf / -1
         """
-        k = 1
         if query_embed.ndim == 1:
             query_embed = query_embed.reshape(1 , -1)
-        
-        dist , indices = self.text_index.search(query_embed.astype("float32") , k)
-        print("\n")
-        print(indices)
-        print("\n")
-        meta_data = {}
-        for i in indices[0]:
-            print(i)
-            meta_data[str(i)] = self.text_metadata[str(i)]
-
-        return (dist[0] , indices[0] , meta_data)
-    
+        queries = query_embed.astype("float32")
 
-    def _clear_temp(self):
-        self.text_temp = []
-        self.image_temp = []
-        self.text_temp_metadata = []
-        self.image_temp_metadata = []
+        index , _ = self._parts(type)
+        parts = [part for part in [index] + [shard for shard , _ in self.shards[type]] if part.ntotal]
+        if not parts:
+            return (np.full((len(queries) , k) , np.inf , dtype="float32") , np.full((len(queries) , k) , -1 , dtype="int64"))
+        params , selectors = self._search_params(type , nprobe)
+        results = [part.search(queries , k , params=params) for part in parts]
+        if len(results) == 1:
+            return results[0]
+
+        dist = np.hstack([part_dist for part_dist , _ in results])
+        indices = np.hstack([part_indices for _ , part_indices in results])
+        best = np.argsort(dist , axis=1 , kind="stable")[: , :k]
+        return (np.take_along_axis(dist , best , axis=1) , np.take_along_axis(indices , best , axis=1))
+
+
+    def save_state(self):
+        """
+        Function to save state , merges the shards into the lists on disk first
+        """
+        self._check_writable()
+        with self._lock:
+            for type in ("text" , "image"):
+                self._merge(type)
+            super().save_state()
+            self._remove_stale_files()
 
     def reset_index(self):
         """
-        Function to reset index to null
+        Function to reset index to null (the files of the old one go with the next save_state)
         """
-        self.text_index.reset()
-        self.image_index.reset()
+        with self._lock:
+            super().reset_index()
+            self.shards = {"text" : [] , "image" : []}
 
-    def current_size(self) -> tuple:
+    def _index_state(self) -> dict:
+        return {**super()._index_state() , "ondisk" : {"merges" : dict(self.merges)}}
+
+    def _load_index_state(self , id_state:dict):
+        super()._load_index_state(id_state)
+        self.merges.update(id_state.get("ondisk" , {}).get("merges" , {}))
+
+    def _accepts(self , index) -> bool:
+        # indexes of FAISSManagerIVF too , their lists move to disk with the next save_state
+        return isinstance(index , faiss.IndexIVF)
+
+    def _after_load(self , mmap:bool):
+        super()._after_load(mmap)
+        self.shards = {"text" : [] , "image" : []}
+        if not mmap:
+            self._remove_stale_files()
+
+
+
+class FAISSManagerHNSW(FAISSManager):
+    """
+    Class to manage FASISS db with HNSW
+
+    The graphs sit in an IndexIDMap2 for the explicit ids. HNSW cannot remove vectors ,
+    compaction rebuilds the graph without the tombstoned ones.
+
+    efSearch / efConstruction are kept per index (set_params , tune_ef_search) and saved
+    with it , every search can also override efSearch for itself.
+
+    storage picks how the graph stores its vectors: "flat" (float32) , "sq8" (IndexHNSWSQ ,
+    8 bit per dimension) or "pq" (IndexHNSWPQ , subvector_count codes of nbit bits). The
+    compressed ones are trained on the first HNSW_TRAIN_SIZE vectors , keep float32 copies
+    on disk (VectorStore) and re-rank rerank * k candidates of every search exactly with them.
+    load_state keeps the storage of the saved index.
+    """
+
+    def __init__(self , embedding_dim:int = 512 ,subvector_count:int = config.HNSW_PQ_SUBVECTORS , nbit:int = config.HNSW_PQ_NBIT , verbose=False , compaction_threshold:float = 0.2,
+                 M:int = config.HNSW_M , ef_construction:int = config.HNSW_EF_CONSTRUCTION , ef_search:int = config.HNSW_EF_SEARCH,
+                 storage:str = config.HNSW_STORAGE , rerank:int = config.HNSW_RERANK):
+
+        # HYPERPARAMS
+        # "flat" , "sq8" or "pq"
+        if storage not in self.STORAGES:
+            raise ValueError(f"storage must be one of {self.STORAGES}")
+        if storage == "pq" and embedding_dim % subvector_count:
+            raise ValueError(f"Embedding dim {embedding_dim} is not divisible by {subvector_count} sub vectors")
+        self.storage = storage
+        # for PQ
+        self.subvector_count = subvector_count
+        self.nbit = nbit
+        # candidates per result re-ranked with the float32 vectors , compressed storage only (0 = off)
+        self.rerank = rerank
+        self.vector_store = {type : VectorStore(f"index/{type}_vectors.f32" , embedding_dim) for type in ("text" , "image")}
+        # whether the vector store holds exactly the vectors of the index (False after a crash between adds and save)
+        self.rerank_ready = {"text" : True , "image" : True}
+        # type -> (index , its id map as an array) , maps hit ids to vector store rows
+        self._id_arrays = {}
+        #for HNSW , M is fixed per graph , the ef values per index ("text" / "image")
+        self.M = M
+        self.ef_construction = {"text" : ef_construction , "image" : ef_construction}
+        self.ef_search = {"text" : ef_search , "image" : ef_search}
+
+        super().__init__(embedding_dim=embedding_dim , verbose=verbose , compaction_threshold=compaction_threshold,
+                         train_size=config.HNSW_TRAIN_SIZE)
+
+
+    STORAGES = ("flat" , "sq8" , "pq")
+
+    def _new_index(self , type:str) -> faiss.IndexIDMap2:
+        if self.storage == "sq8":
+            hnsw = faiss.IndexHNSWSQ(self.embedding_dim , faiss.ScalarQuantizer.QT_8bit , self.M)
+        elif self.storage == "pq":
+            hnsw = faiss.IndexHNSWPQ(self.embedding_dim , self.subvector_count , self.M , self.nbit)
+        else:
+            hnsw = faiss.IndexHNSWFlat(self.embedding_dim , self.M)
+        hnsw.hnsw.efConstruction = self.ef_construction[type]
+        hnsw.hnsw.efSearch = self.ef_search[type]
+        return faiss.IndexIDMap2(hnsw)
+
+    @staticmethod
+    def _storage_of(index) -> tuple:
         """
-        Function to give current sizes of indexs
-        return:
-            tuple(text index size , image index size)
+        returns:
+            tuple(storage , subvector_count , nbit) of a (saved) HNSW index , the PQ values are None unless "pq"
+        """
+        if isinstance(index , faiss.IndexIDMap2):
+            index = index.index
+        hnsw = faiss.downcast_index(index)
+        if isinstance(hnsw , faiss.IndexHNSWSQ):
+            return ("sq8" , None , None)
+        if isinstance(hnsw , faiss.IndexHNSWPQ):
+            pq = faiss.downcast_index(hnsw.storage).pq
+            return ("pq" , pq.M , pq.nbits)
+        return ("flat" , None , None)
+
+    def _train(self , index , vectors:np.array):
+        """
+        Trains the quantizer of a compressed index , PQ needs 2^nbit points per codebook
+        so smaller sets are repeated (tiny corpora , compaction retrains on more data)
         """
-        image_size = self.image_index.ntotal
-        text_size = self.text_index.ntotal
+        if index.is_trained:
+            return
+        need = 2 ** self.nbit if self.storage == "pq" else 1
+        if len(vectors) < need:
+            vectors = np.resize(vectors , (need , self.embedding_dim))
+        index.train(vectors)
 
-        return (text_size , image_size)
+    def _reranks(self , type:str) -> bool:
+        return self.storage != "flat" and self.rerank > 0 and self.rerank_ready[type]
 
-    def save_state(self):
+    def _id_array(self , type:str , index) -> np.array:
         """
-        Function to save state
+        returns:
+            the ids of index by position (ascending , ids come from a monotonic counter) , cached per index
         """
-        faiss.write_index(self.text_index , "index/text_index.index")
-        faiss.write_index(self.image_index , "index/image_index.index")
+        cached = self._id_arrays.get(type)
+        if cached is None or cached[0] is not index or len(cached[1]) != index.ntotal:
+            cached = (index , faiss.vector_to_array(index.id_map))
+            self._id_arrays[type] = cached
+        return cached[1]
 
-        with open("index/text_meta.json" , "w+") as file:
-            json.dump(self.text_metadata , file)
+    def _full_vectors(self , type:str , index , positions:np.array) -> np.array:
+        """
+        returns:
+            float32 vectors at these index positions , from the vector store of compressed
+            indexes (their own reconstruction is lossy) , from the graph storage otherwise
+        """
+        if self.storage != "flat" and self.rerank_ready[type]:
+            return self.vector_store[type].rows(positions)
+        return faiss.downcast_index(index.index).storage.reconstruct_batch(positions.astype("int64"))
 
-        with open("index/image_meta.json" , "w+") as file:
-            json.dump(self.image_metadata , file)
+    def _apply_params(self , type:str):
+        index , _ = self._parts(type)
+        hnsw = faiss.downcast_index(index.index).hnsw
+        hnsw.efConstruction = self.ef_construction[type]
+        hnsw.efSearch = self.ef_search[type]
 
+    def set_params(self , type:str , ef_search:int = None , ef_construction:int = None):
+        """
+        Function to change the HNSW parameters of one index , saved with it by save_state
+        args:
+            type (str) : "text" or "image"
+            ef_search (int) : candidates kept while searching , higher = better recall , slower
+            ef_construction (int) : candidates kept while inserting , applies to vectors added from now on
+        """
+        self._parts(type)
+        with self._lock:
+            if ef_search is not None:
+                self.ef_search[type] = int(ef_search)
+                # results of the same query may change
+                self.generation += 1
+            if ef_construction is not None:
+                self.ef_construction[type] = int(ef_construction)
+            self._apply_params(type)
+
+    def params(self) -> dict:
+        return {
+            "storage" : self.storage,
+            "subvector_count" : self.subvector_count if self.storage == "pq" else None,
+            "nbit" : self.nbit if self.storage == "pq" else None,
+            "rerank" : self.rerank if self.storage != "flat" else None,
+            "M" : self.M,
+            "ef_construction" : dict(self.ef_construction),
+            "ef_search" : dict(self.ef_search)
+        }
+
+    def measure_ef_search(self , type:str , ef_values:List[int] , k:int = 10 , sample:int = 200 , seed:int = 0) -> List[Dict]:
+        """
+        Function to measure recall@k and latency of efSearch values against brute force
+        Stored live vectors are used as queries , the exact neighbours come from a flat
+        search over the graph's own storage (no copy of the vectors) , or over the float32
+        vector store of compressed indexes. Searches re-rank like every other search.
+        args:
+            type (str) : "text" or "image"
+            ef_values (list) : efSearch values to measure
+            k (int) : neighbours per query
+            sample (int) : number of query vectors
+        returns:
+            list : dict(ef_search , recall , latency_ms) per value , latency is per single query search
+        """
+        with self._lock:
+            index , tombstones = self._parts(type)
+            ids = faiss.vector_to_array(index.id_map)
+            live = np.flatnonzero(~np.isin(ids , np.fromiter(tombstones , dtype="int64" , count=len(tombstones))))
+            if len(live) == 0:
+                return []
+            positions = np.random.default_rng(seed).choice(live , size=min(sample , len(live)) , replace=False)
+            queries = self._full_vectors(type , index , positions)
+
+            k = min(k , len(live))
+            if self.storage != "flat" and self.rerank_ready[type]:
+                exact = self._exact_search(type , queries , k , live , len(ids))
+            else:
+                # brute force over the live vectors , the selector works on storage positions
+                storage = faiss.downcast_index(index.index).storage
+                params = None
+                if tombstones:
+                    dead_selector = faiss.IDSelectorBatch(np.setdiff1d(np.arange(len(ids)) , live).astype("int64"))
+                    live_selector = faiss.IDSelectorNot(dead_selector)
+                    params = faiss.SearchParameters(sel=live_selector)
+                _ , exact = storage.search(queries , k , params=params)
+            exact_ids = ids[exact]
+
+        results = []
+        for ef_search in ef_values:
+            found = []
+            start = time.perf_counter()
+            for query in queries:
+                found.append(self._search_matrix(type , query , k , ef_search)[1][0])
+            latency = (time.perf_counter() - start) / len(queries)
+            recall = np.mean([len(np.intersect1d(hits , truth)) / k for hits , truth in zip(found , exact_ids)])
+            results.append({"ef_search" : int(ef_search) , "recall" : float(recall) , "latency_ms" : latency * 1000})
+        return results
+
+    def _exact_search(self , type:str , queries:np.array , k:int , live:np.array , count:int) -> np.array:
+        """
+        Brute force k nearest live positions over the vector store , read in chunks
+        returns:
+            (nq , k) positions
+        """
+        dead = np.ones(count , dtype=bool)
+        dead[live] = False
+        query_norms = (queries ** 2).sum(axis=1)[: , None]
+        best_dist = np.full((len(queries) , k) , np.inf , dtype="float32")
+        best_pos = np.full((len(queries) , k) , -1 , dtype="int64")
+        for start , rows in self.vector_store[type].chunks(count):
+            dist = query_norms - 2 * queries @ rows.T + (rows ** 2).sum(axis=1)[None , :]
+            dist[: , dead[start:start + len(rows)]] = np.inf
+            dist = np.hstack([best_dist , dist])
+            pos = np.hstack([best_pos , np.broadcast_to(np.arange(start , start + len(rows)) , (len(queries) , len(rows)))])
+            top = np.argpartition(dist , k - 1 , axis=1)[: , :k]
+            best_dist = np.take_along_axis(dist , top , axis=1)
+            best_pos = np.take_along_axis(pos , top , axis=1)
+        return best_pos
+
+    def tune_ef_search(self , type:str , target_recall:float = None , latency_budget_ms:float = None , k:int = 10,
+                       ef_values:List[int] = (16 , 24 , 32 , 48 , 64 , 96 , 128 , 192 , 256 , 384 , 512) , sample:int = 200) -> Dict:
+        """
+        Function to pick efSearch of one index for a recall target and / or a latency budget ,
+        see measure_ef_search. The choice is set on the index (set_params) and saved with it.
+            target_recall only : smallest efSearch reaching it (largest measured if none does)
+            latency_budget_ms only : largest efSearch within the budget
+            both : smallest efSearch reaching the recall within the budget , else the largest within it
+        returns:
+            dict(ef_search , recall , latency_ms , measurements) , ef_search None if nothing was chosen
+        """
+        if target_recall is None and latency_budget_ms is None:
+            raise ValueError("give a target_recall and / or a latency_budget_ms")
 
-        print("saved")
+        measurements = self.measure_ef_search(type , sorted(ef_values) , k=k , sample=sample)
+        chosen = self._pick(measurements , target_recall , latency_budget_ms)
+
+        if chosen is not None:
+            self.set_params(type , ef_search=chosen["ef_search"])
+        if self.verbose:
+            print(f"{type} index: efSearch {chosen['ef_search'] if chosen else None} from {measurements}")
+        return {**(chosen or {"ef_search" : None , "recall" : None , "latency_ms" : None}) , "measurements" : measurements}
 
-    def load_state(self):
+    def needs_retrain(self , type:str) -> bool:
         """
-        Function to load state
+        Whether a compressed index was trained on fewer than HNSW_TRAIN_SIZE vectors and
+        has since doubled , compaction retrains it on every live vector
         """
+        if self.storage == "flat" or not self.rerank_ready[type]:
+            return False
+        index , _ = self._parts(type)
+        trained_on = self.trained_on[type]
+        return 0 < trained_on < config.HNSW_TRAIN_SIZE and index.ntotal >= 2 * trained_on
+
+    def _compact(self , type:str):
+        with self._lock:
+            index , tombstones = self._parts(type)
+            dead = set(tombstones)
+            ids = faiss.vector_to_array(index.id_map)
+            vectors = self._full_vectors(type , index , np.arange(index.ntotal))
 
-        text_index_path = "index/text_index.index"
-        image_index_path = "index/image_index.index"
-        if os.path.exists(text_index_path) and os.path.exists(image_index_path):
-            self.text_index = faiss.read_index(text_index_path)
-            self.image_index = faiss.read_index(image_index_path)
+        if self.verbose:
+            print(f"compacting {type} index , dropping {len(dead)} of {len(ids)} vectors")
+
+        # the expensive part runs without the lock (faiss releases the GIL)
+        keep = ~np.isin(ids , np.fromiter(dead , dtype="int64" , count=len(dead)))
+        vectors = vectors[keep]
+        new_index = self._new_index(type)
+        if not new_index.is_trained:
+            self._train(new_index , vectors)
+        new_index.add_with_ids(vectors , ids[keep])
+
+        with self._lock:
+            current , tombstones = self._parts(type)
+            if current is not index:
+                # reset / reloaded meanwhile , the rebuild is stale
+                return
+
+            # vectors added while the graph was being rebuilt
+            if current.ntotal > len(ids):
+                added_ids = faiss.vector_to_array(current.id_map)[len(ids):]
+                added = self._full_vectors(type , current , np.arange(len(ids) , current.ntotal))
+                new_index.add_with_ids(added , added_ids)
+                vectors = np.vstack([vectors , added])
+
+            if self.storage != "flat" and self.rerank_ready[type]:
+                self.vector_store[type].replace(vectors)
+                self.trained_on[type] = int(keep.sum())
+            setattr(self , f"{type}_index" , new_index)
+            # tombstones added meanwhile are still in the new graph
+            tombstones -= dead
+            # a rebuilt graph can order near ties differently
+            self.generation += 1
+
+
+    def _search_matrix(self , type:str , query_embed:np.array , k:int , ef_search:int = None):
+        """
+        One index.search for every row of query_embed , compressed indexes fetch rerank * k
+        candidates and return them re-ranked by their exact distance
+        args:
+            ef_search (int) : efSearch of this call , None = the one set for the index
+        returns:
+            tuple : (distances , indices) , (nq , k) each
+        """
+        if query_embed.ndim == 1:
+            query_embed = query_embed.reshape(1 , -1)
+        query_embed = query_embed.astype("float32")
+
+        index , tombstones = self._parts(type)
+        # HNSW keeps at least k candidates , efSearch below k is raised to k
+        params = faiss.SearchParametersHNSW(efSearch=ef_search or self.ef_search[type])
+        if tombstones:
+            # the selectors are held in locals so they outlive the search call
+            dead = np.fromiter(tombstones , dtype="int64" , count=len(tombstones))
+            dead_selector = faiss.IDSelectorBatch(dead)
+            live_selector = faiss.IDSelectorNot(dead_selector)
+            params.sel = live_selector
+
+        if not self._reranks(type):
+            return index.search(query_embed , k , params=params)
+        _ , candidates = index.search(query_embed , k * self.rerank , params=params)
+        return self._rerank(type , index , query_embed , candidates , k)
+
+    def _rerank(self , type:str , index , query_embed:np.array , candidates:np.array , k:int):
+        """
+        Exact squared L2 distances of the candidates from their float32 vectors , only
+        the candidate rows of the vector store are read
+        returns:
+            tuple : (distances , indices) of the k best , padded with (inf , -1) like faiss
+        """
+        found = candidates >= 0
+        positions = np.searchsorted(self._id_array(type , index) , candidates[found])
+        dist = np.full(candidates.shape , np.inf , dtype="float32")
+        # sorted rows read the file front to back
+        order = np.argsort(positions)
+        vectors = np.empty((len(positions) , self.embedding_dim) , dtype="float32")
+        vectors[order] = self.vector_store[type].rows(positions[order])
+        dist[found] = ((vectors - query_embed[np.nonzero(found)[0]]) ** 2).sum(axis=1)
+
+        best = np.argsort(dist , axis=1 , kind="stable")[: , :k]
+        return np.take_along_axis(dist , best , axis=1) , np.take_along_axis(candidates , best , axis=1)
+
+    def search_batch(self , type:str , query_embeds:np.array , k:int = config.SEARCH_K , ef_search:int = None , timings:Dict = None):
+        """
+        function to search many queries in one index with a single (nq , dim) search call
+        args:
+            type (str) : "text" or "image"
+            query_embeds (np.array) : (nq , dim) query embeddings
+            k (int) : number of results per query
+            ef_search (int) : efSearch of this call , None = the one set for the index
+            timings (dict) : if given , seconds spent in "faiss_search" / "metadata" (for the whole batch) are added to it
+        returns:
+            list : (distance , indices , metadatas) per query , like search_text / search_image
+        """
+        return self._search_batch(type , query_embeds , k , ef_search , timings)
 
-            with open("index/text_meta.json" , "r+") as file:
-                self.text_metadata = json.load(file)
+    def search_image(self , query_embed: np.array , k:int = config.SEARCH_K , ef_search:int = None , timings:Dict = None):
+        """
+        function to search in image index
+        args:
+            query_embed (np.array) : query embedding vector
+            k (int) : number of results
+            ef_search (int) : efSearch of this call , None = the one set for the index
+            timings (dict) : if given , seconds spent in "faiss_search" / "metadata" are added to it
+        returns:
+            tuple : (distance , indices , metadatas)
+        """
+        return self._search("image" , query_embed , k , ef_search , timings)
 
-            with open("index/image_meta.json" , "r+") as file:
-                self.image_metadata = json.load(file)
-        else:
-            print("index not found")
\ No newline at end of file
+    def search_text(self , query_embed: np.array , k:int = config.SEARCH_K , ef_search:int = None , timings:Dict = None):
+        """
+        function to search in text index
+        args:
+            query_embed (np.array) : query embedding vector
+            k (int) : number of results
+            ef_search (int) : efSearch of this call , None = the one set for the index
+            timings (dict) : if given , seconds spent in "faiss_search" / "metadata" are added to it
+        returns:
+            tuple : (distance , indices , metadatas)
+        """
+        return self._search("text" , query_embed , k , ef_search , timings)
+
+    def search_fused(self , query_embed: np.array , k:int = config.SEARCH_K , image_weight:float = 0.5 , ef_search:int = None , timings:Dict = None):
+        """
+        function to search both indexes at once and merge the hits into one top k list
+        The two searches run concurrently , see fuse. Distances of compressed indexes are
+        approximate unless they are re-ranked.
+        args:
+            query_embed (np.array) : query embedding vector
+            k (int) : number of results
+            image_weight (float) : prior of the image index (e.g. p(IMAGE) of the router) ,
+                the text index gets 1 - image_weight
+            ef_search (int) : efSearch of this call , None = the one set for each index
+            timings (dict) : like search_text , the slower of the two concurrent searches is added
+        returns:
+            tuple : (scores , indices , metadatas) , every metadata carries its "type"
+        """
+        return self._search_fused(query_embed , k , image_weight , ef_search , timings)
+
+    def _add(self , type:str , index , vectors:np.array , ids:np.array):
+        if self.storage != "flat" and self.rerank_ready[type]:
+            # before the index , so the store never holds fewer rows than it
+            if index.ntotal == 0:
+                # rows of an index this one replaces
+                self.vector_store[type].replace(vectors)
+            else:
+                self.vector_store[type].append(vectors)
+        index.add_with_ids(vectors , ids)
+
+    def reset_index(self):
+        """
+        Function to reset index to null
+        """
+        with self._lock:
+            super().reset_index()
+            # the stores are emptied by the first train_add , the saved index keeps its rows until then
+            self.rerank_ready = {"text" : True , "image" : True}
+
+    def _index_state(self) -> dict:
+        return {"hnsw" : self.params()}
+
+    def _load_index_state(self , id_state:dict):
+        # indexes saved before the parameters were saved keep the configured ones
+        hnsw_params = id_state.get("hnsw" , {})
+        self.ef_construction.update(hnsw_params.get("ef_construction" , {}))
+        self.ef_search.update(hnsw_params.get("ef_search" , {}))
+
+    def _accepts(self , index) -> bool:
+        if isinstance(index , faiss.IndexIDMap2):
+            index = index.index
+        return isinstance(faiss.downcast_index(index) , faiss.IndexHNSW)
+
+    def _adopt(self , index , first_id:int = 0) -> faiss.IndexIDMap2:
+        # compaction / reset build graphs with the storage of the saved ones
+        storage , subvector_count , nbit = self._storage_of(index)
+        self.storage = storage
+        if storage == "pq":
+            self.subvector_count , self.nbit = subvector_count , nbit
+        return self._as_id_map(index , first_id)
+
+    def _positional(self , index) -> bool:
+        return not isinstance(index , faiss.IndexIDMap2)
+
+    def _as_id_map(self , index , first_id:int = 0) -> faiss.IndexIDMap2:
+        """
+        Indexes saved before ids were explicit are plain HNSW graphs whose ids are
+        their positions , they are rebuilt once under an IDMap with ids first_id + position
+        """
+        if isinstance(index , faiss.IndexIDMap2):
+            return index
+        id_index = self._new_index("text")
+        if index.ntotal:
+            vectors = index.reconstruct_n(0 , index.ntotal)
+            self._train(id_index , vectors)
+            id_index.add_with_ids(vectors , np.arange(first_id , first_id + index.ntotal , dtype="int64"))
+        return id_index
+
+    def _stored_ids(self , index) -> np.array:
+        return faiss.vector_to_array(index.id_map)
+
+    def _load_vector_store(self , type:str , mmap:bool):
+        """
+        Matches the vector store of a compressed index to the loaded index: rows added after
+        the save are dropped , with rows missing re-ranking is off until the index is rebuilt (reset_index)
+        """
+        if self.storage == "flat":
+            return
+        index , _ = self._parts(type)
+        store = self.vector_store[type]
+        if not mmap:
+            store.truncate(index.ntotal)
+        self.rerank_ready[type] = len(store) >= index.ntotal
+        if not self.rerank_ready[type]:
+            print(f"{store.path} holds {len(store)} of {index.ntotal} vectors , {type} results are not re-ranked")
+
+    def _after_load(self , mmap:bool):
+        # graphs rebuilt by compaction / reset keep the M of the saved ones
+        self.M = faiss.downcast_index(self.text_index.index).hnsw.nb_neighbors(1)
+        for type in ("text" , "image"):
+            self._apply_params(type)
+            self._load_vector_store(type , mmap)
+
+
+def make_faiss_manager(**kwargs) -> FAISSManager:
+    """
+    returns:
+        the manager of config.INDEX_BACKEND ("hnsw" , "ivf" or "ondisk") , kwargs go to its constructor
+    """
+    if config.INDEX_BACKEND == "ivf":
+        return FAISSManagerIVF(**kwargs)
+    if config.INDEX_BACKEND == "ondisk":
+        return FAISSManagerOnDisk(**kwargs)
+    return FAISSManagerHNSW(**kwargs)
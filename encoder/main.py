@@ -1,319 +1,507 @@
+"""
+Multi process indexing pipeline
+
+    scanner + manifest (main process)
+        -> FILE_QUEUE -> extraction workers (processes , PDF / DOCX parsing is GIL bound)
+        -> CONTENT_QUEUE -> embedding workers (processes , batched MobileCLIP)
+        -> EmbeddingRing (shared memory) -> writer (thread in the main process , feeds the FAISS manager)
+
+Every queue is bounded (and the ring has a fixed number of chunks) so a slow stage
+makes the ones before it wait instead of piling work up in memory. Used by main_seq.dir_traversal when extract_workers > 0.
+
+With metrics enabled (encoder/metrics.py) every worker sends the snapshot of its own
+metrics to the main process before it exits , which merges them into its report.
+"""
 import os
-import psutil
-from multiprocessing import Process , Queue , Manager
-import faiss
-import numpy as np
-import traceback 
+import time
+import queue
+import signal
+import threading
+import traceback
+import multiprocessing as mp
 import argparse
-import torch
-from tqdm import tqdm
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 #util files
 import encoder.config as config
-import encoder.utils as utils
-import encoder.embedding as embedding
+from encoder.shm_ring import EmbeddingRing
 
 
-parser = argparse.ArgumentParser(description="arg parser for cli")
-parser.add_argument("--verbose" , action="store_true" , help="too see which directory its currently at")
-args = parser.parse_args()
+STAGES = ("extract" , "embed" , "write")
+# per stage counters in StageStats
+ITEMS , BUSY , ERRORS = 0 , 1 , 2
 
 
-#temp
-search_dir = "/home/aman/code/searchsp/test/tempsearchdir"
-content_extractor_func = {
-    "pdf" : utils.pdf_extractor,
-    "txt" : utils.text_extractor,
-    "docx" : utils.docs_extractor,
-    "ppt" : utils.ppt_extractor,
-    "excel" : utils.excel_extractor,
-    "md" : utils.markdown_extractor
-}
+class StageStats:
+    """
+    Per stage counters shared between processes (items done , busy seconds , errors)
+    """
 
+    def __init__(self , ctx):
+        self.values = ctx.Array("d" , len(STAGES) * 3)
+        self.start_time = time.time()
+
+    def add(self , stage:str , items:int = 0 , busy:float = 0.0 , errors:int = 0):
+        offset = STAGES.index(stage) * 3
+        with self.values.get_lock():
+            self.values[offset + ITEMS] += items
+            self.values[offset + BUSY] += busy
+            self.values[offset + ERRORS] += errors
+
+    def snapshot(self) -> dict:
+        """
+        returns:
+            {stage : {"items" , "busy_s" , "errors" , "items_per_s" (wall clock)}}
+        """
+        wall = max(time.time() - self.start_time , 1e-9)
+        with self.values.get_lock():
+            values = list(self.values)
+        report = {}
+        for n , stage in enumerate(STAGES):
+            items , busy , errors = values[n * 3 : n * 3 + 3]
+            report[stage] = {
+                "items" : int(items),
+                "busy_s" : busy,
+                "errors" : int(errors),
+                "items_per_s" : items / wall
+            }
+        return report
+
+
+def _ignore_sigint():
+    # Ctrl-C is handled by the main process , which stops the workers itself
+    signal.signal(signal.SIGINT , signal.SIG_IGN)
+
+
+# returned by _get when no item arrived within idle_timeout
+IDLE = object()
+
+
+def _get(q , stop_event , idle_timeout:float = None):
+    """
+    Blocking get which gives up (returns None) when stop_event is set ,
+    or returns IDLE when idle_timeout is given and nothing arrived in time
+    """
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=idle_timeout or 0.5)
+        except queue.Empty:
+            if idle_timeout is not None:
+                return IDLE
+    return None
 
 
+def _put(q , item , stop_event) -> bool:
+    """
+    Blocking put which gives up when stop_event is set
+    """
+    while not stop_event.is_set():
+        try:
+            q.put(item , timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
 
 
-def traverse_all_drives():
+def _worker_metrics(metrics_queue):
     """
-    Function to traverse all dirs in a system
-    *always start from C:
-    
+    Metrics of a worker process , enabled when the main process passed a queue for them
+    (no periodic dumps , the main process writes the reports)
     """
-    partitions = psutil.disk_partitions()
-    #list down the partitions of the drive
-    for partition in partitions:
-        # get specific partition
-        drive = partition.mountpoint 
-        # for debugging...
-        print(f"Traversing {drive}...")
-        for dirpath, dirnames, filenames in os.walk(drive):
-            
-            if config.RESTRICTED_DIRS_INTIAL in [folder_name[0] for folder_name in dirpath]:
-                continue
-            for filename in filenames:
-                file_path = os.path.join(dirpath, filename)
-
-
-def main():
-    with Manager() as manager:
-        FILE_QUEUE = Queue()
-        CONTENT_QUEUE = Queue()
-        EMBEDDING_QUEUE = Queue()
-        METADATA_MAP = manager.dict() # in shared memory
-        
-
-        def test_traversal():
-            try:
-                for dirpath , dirnames , filenames  in tqdm(os.walk(search_dir)):
-                    for filename in filenames:
-                        file_path = os.path.join(dirpath , filename)
-
-                        #verbose
-                        if args.verbose:
-                            print(f"Traversing directory : {dirpath}")
-                            print(f"current file : {filename}")
-
-                        file_ext = file_path.split('.')[-1]
-                        if file_ext in config.SUPPORTED_EXT_IMG or file_ext in config.SUPPORTED_EXT_TEXT:
-                            FILE_QUEUE.put(file_path)
-                FILE_QUEUE.put(None)
-
-            except Exception as e:
-                print(f"error in test traversal : {e}")
-                traceback.print_exc()
-
-
-
-        def content_extract():
-            """
-            Function to extract contents from the files in queue
-
-            """
-            try:
-                file_processed = 0
-                while True:
-                    try:
-                        file_path = FILE_QUEUE.get(timeout=60)
-                        if file_path is None:
-                            CONTENT_QUEUE.put(None)
-                            break
-                        #verbose
-                        if args.verbose:
-                            print(f"current file getting extracted : {file_path}")
-
-                        file_meta_data = utils.get_meta(file_path=file_path)
-                        file_ext = file_path.split('.')[-1]
-                        # if text based files
-                        if file_ext in config.SUPPORTED_EXT_TEXT:
-
-                            try:
-                                content = content_extractor_func[file_ext](file_path=file_path)
-                                content_dic = {"content" : content , "metadata" : file_meta_data}
-                                CONTENT_QUEUE.put(content_dic)
-                                file_processed += 1
-
-                                if args.verbose:
-                                    print(f"extracted file {file_path}")
-
-                            except Exception as e:
-                                print(f"Error extracting content from {file_path}")
-                                continue
-
-                        #if image
-                        if file_ext in config.SUPPORTED_EXT_IMG:
-                            content_dic = {"content" : file_path + "~" , "metadata" : file_meta_data}
-                            CONTENT_QUEUE.put(content_dic)
-                            file_processed += 1
-
-                            if args.verbose:
-                                print(f"Successfully processed img {file_path}")
-
-                    except Queue.empty:
-                        print("content extraction timed out - no new files")
-                        CONTENT_QUEUE.put(None)
-                        break
-            
-            except Exception as e:
-                print(f"error in content extraction phase : {e}")
-                traceback.print_exc()
-                CONTENT_QUEUE.put(None)
-
-
-        def generate_embedding():
-            """
-            Generates embedding of contents and store it into FIASS db
-            
-            """
-            try:
-                while True:
-                    try:
-                        content_data = CONTENT_QUEUE.get(timeout=60)
-                        if content_data is None:
-                            break
-
-                        content = content_data["content"]
-                        metadata = content_data["metadata"]
-                        generated_embedding = None
-
-                        #handle the case of images
-                        if content[-1] == "~":
-                            img_content = content[:-1]
-                            #double check to avoid edge cases
-                            if os.path.exists(img_content):
-                                '''handel images'''
-                                generated_embedding = embedding.image_extract(img_content)
-
-                        else:
-                            '''handle texts'''
-                            generated_embedding = embedding.text_extract(content)
-
-                        if generated_embedding is not None:
-                            #ensuring its a numpy array
-                            if isinstance(generated_embedding ,torch.Tensor):
-                                generated_embedding = generated_embedding.cpu().numpy()
-                            # store(embedding=generated_embedding , metadata=metadata)
-                            EMBEDDING_QUEUE.put((generated_embedding , metadata))
-                    
-                    except Queue.empty:
-                        print("embedding generation timed out")
-                        EMBEDDING_QUEUE.put(None)
-                        break
-
-            except Exception as e:
-                print(f"error while generating and storing embedding : {e}")
-                traceback.print_exc()
-                EMBEDDING_QUEUE.put(None)
-
-        def store_embedding():
-            """
-            Function to add the embedding and metadata 
-            Args:
-                embedding (torch.tensor) : embedding vector of any content
-                metadata (dict) : metadata regarding the file
-            """
-
-            try:
-                while True:
-                    data = EMBEDDING_QUEUE.get()
-
-                    if data is None:
-                        break
-                        
-                    embedding_vec , metadata = data
-
-                    if embedding_vec.ndim == 1:
-                        embedding_np = embedding_vec.reshape(1 , -1)
-                    else:
-                        embedding_np = embedding_vec
-
-                embedding_np = embedding_np.astype('float32')
-                faiss_id = INDEX.ntotal
-                INDEX.add(embedding_np)
-                METADATA_MAP[faiss_id] = metadata
-
-
-                if args.verbose:
-                    print(f"Added Embedding {faiss_id} to index")
-
-            except Exception as e:
-                print(f"Error which storing embedding : {e}")
-                traceback.print_exc()
-
-        def terminate_process(process: Process):
-            """
-            function to terminate all the processes
-
-            """
-
-            for proc in process:
-                if proc.is_alive:
-                    proc.terminate()
-                    proc.join()
-            
-            print("all process bye bye...")
-
- 
-
-        process = [
-            Process(target=test_traversal),
-            Process(target=content_extract),
-            Process(target=generate_embedding),
-            Process(target=store_embedding)
-        ]
+    from encoder.metrics import configure
+    return configure(enabled=metrics_queue is not None , interval=0)
+
 
+def _collect_metrics(metrics_queue , procs:list , metrics , stop_event):
+    """
+    Merges the metrics snapshot every process of procs sends before it exits
+    """
+    pending = len(procs)
+    while pending and not stop_event.is_set():
+        try:
+            metrics.merge(metrics_queue.get(timeout=0.5))
+            pending -= 1
+        except queue.Empty:
+            if not any(proc.is_alive() for proc in procs):
+                break
+    # snapshots sent right before the last check
+    while pending:
         try:
+            metrics.merge(metrics_queue.get_nowait())
+            pending -= 1
+        except queue.Empty:
+            break
 
-            for proc in process:
-                proc.start()
-
-            if args.verbose:
-                iter_ = 0
-                while any(p.is_alive() for p in process):
-                    print(f"\niter : {iter_},"
-                        f"File queue size -> {FILE_QUEUE.qsize()},"
-                        f"Content -> {CONTENT_QUEUE.qsize()},"
-                        f"Embedding -> {EMBEDDING_QUEUE.qsize()}," 
-                        f"db size -> {INDEX.ntotal}" ,end="")
-                    
-                    time.sleep(1)
-                    iter_ += 1
-
-            
-            for proc in process:
-                proc.join(timeout=60)
-
-            print(f"Final index size: {INDEX.ntotal}")
-            print(f"Final metadata map size: {len(METADATA_MAP)}")
-            
-            return INDEX, dict(METADATA_MAP)
-        
-        except Exception as e:
-            print(f"exception in main process {e}")
 
-            traceback.print_exc()
-            terminate_process(process)
-            #index reset 
-            print(f"index before reset : {INDEX.ntotal}")
-            INDEX.reset()
-            print(f"index after reset : {INDEX.ntotal} ")
+def extraction_worker(file_queue , content_queue , stats:StageStats , stop_event , metrics_queue = None):
+    """
+    Function run by the extraction processes
+    Takes (file_path , modality , create_time , cache_key) , puts content dicts
+    ({"content" , "metadata" , "type" , "cache_key"}) , images are passed on as paths.
+    """
+    _ignore_sigint()
+    import encoder.utils as utils
+    metrics = _worker_metrics(metrics_queue)
 
-        except KeyboardInterrupt:
-            print(f"keyboard interrupt")
-            terminate_process(process)
-            
-            print(f"index before reset : {INDEX.ntotal}")
-            INDEX.reset()
-            print(f"index after reset : {INDEX.ntotal} ")
-            
+    while True:
+        item = _get(file_queue , stop_event)
+        if item is None:
+            break
 
+        file_path , modality , create_time , cache_key = item
+        start = time.perf_counter()
+        try:
+            with metrics.timer("get_meta"):
+                metadata = utils.get_meta(file_path=file_path , create_time=create_time)
+            if modality == "text":
+                file_ext = file_path.split('.')[-1].lower()
+                with metrics.timer("extract") as timer:
+                    content = utils.content_extractor_func[file_ext](file_path=file_path)
+                if metrics.enabled:
+                    metrics.observe_file(file_path , file_ext , time.perf_counter() - timer.start , os.path.getsize(file_path))
+                if not content or not content.strip():
+                    # nothing to embed , counted as an error so progress still adds up
+                    stats.add("extract" , errors=1 , busy=time.perf_counter() - start)
+                    continue
+            else:
+                if metrics.enabled:
+                    # read by the image decode in the embedding stage
+                    metrics.observe_read("image" , os.path.getsize(file_path))
+                content = file_path
+
+            content_dic = {"content" : content , "metadata" : metadata , "type" : modality , "cache_key" : cache_key}
+            stats.add("extract" , items=1 , busy=time.perf_counter() - start)
+        except Exception:
+            stats.add("extract" , errors=1 , busy=time.perf_counter() - start)
+            continue
+
+        if not _put(content_queue , content_dic , stop_event):
+            break
+
+    if metrics.enabled:
+        metrics_queue.put(metrics.snapshot())
+
+
+def embedding_worker(content_queue , ring , stats:StageStats , stop_event , metrics_queue = None):
+    """
+    Function run by the embedding processes
+    Collects text / image batches , a partial batch is flushed when no new content
+    arrived for a moment. Every batch is encoded straight into a chunk of the shared
+    memory ring , only (type , file_path , create_time , cache_key) tuples are pickled.
+    """
+    _ignore_sigint()
+    import encoder.embedding as embedding
+    metrics = _worker_metrics(metrics_queue)
+    # load the model while the extractors produce the first batch
+    with metrics.timer("load_model"):
+        embedding.get_model()
+
+    batches = {"text" : [] , "image" : []}
+
+    def flush(modality:str):
+        batch = batches[modality]
+        if not batch:
+            return True
+        chunk_id = ring.acquire(stop_event)
+        if chunk_id is None:
+            return False
+
+        start = time.perf_counter()
+        out = ring.chunk(chunk_id)
+        try:
+            with metrics.timer(f"embed_{modality}" , items=len(batch)):
+                done = encode(modality , batch , out)
+            stats.add("embed" , items=len(done) , errors=len(batch) - len(done) , busy=time.perf_counter() - start)
+        except Exception:
+            traceback.print_exc()
+            stats.add("embed" , errors=len(batch) , busy=time.perf_counter() - start)
+            done = []
+
+        batch.clear()
+        if not done:
+            ring.release(chunk_id)
+            return True
+        metadata = [(modality , c["metadata"]["file_path"] , c["metadata"]["creation_date"] , c["cache_key"]) for c in done]
+        return ring.publish(chunk_id , len(done) , metadata , stop_event)
+
+    def encode(modality:str , batch:list , out) -> list:
+        """
+        returns:
+            the content dicts of batch which were encoded , in the row order of out
+        """
+        if modality == "text":
+            embedding.encode_texts([c["content"] for c in batch] , batch_size=config.TEXT_BATCH_SIZE , out=out)
+            return list(batch)
+        by_path = {c["content"] : c for c in batch}
+        _ , encoded_paths = embedding.encode_images(
+            list(by_path),
+            batch_size=config.IMAGE_BATCH_SIZE,
+            num_workers=config.IMAGE_DECODE_WORKERS,
+            fast_decode=config.FAST_IMAGE_DECODE,
+            out=out
+        )
+        return [by_path[path] for path in encoded_paths]
+
+    # a batch has to fit into one chunk of the ring
+    limits = {"text" : min(config.TEXT_BATCH_SIZE , ring.chunk_size) , "image" : min(config.IMAGE_BATCH_SIZE , ring.chunk_size)}
+    while True:
+        item = _get(content_queue , stop_event , idle_timeout=0.2)
+        if item is IDLE:
+            # stage before us is slow , do not sit on a partial batch
+            if not (flush("text") and flush("image")):
+                break
+            continue
+        if item is None:
+            if not stop_event.is_set():
+                flush("text")
+                flush("image")
+            break
+
+        batches[item["type"]].append(item)
+        if len(batches[item["type"]]) >= limits[item["type"]]:
+            if not flush(item["type"]):
+                break
+
+    if metrics.enabled:
+        metrics_queue.put(metrics.snapshot())
+
+
+def writer_thread(ring , stats:StageStats , stop_event , cache_lock:threading.Lock , copies:dict):
+    """
+    Function run by the writer thread of the main process
+    Reads every published chunk of the ring as a numpy view , adds it to the FAISS
+    manager (one copy into its buffer) and the embedding cache , then frees the chunk.
+    copies (cache_key -> [(modality , file_path , create_time)]) are files with the content
+    of one in flight , they are added with its vector (both guarded by cache_lock).
+    """
+    import numpy as np
+    import encoder.main_seq as main_seq
 
-            
+    while True:
+        item = ring.receive(stop_event)
+        if item is None:
+            break
 
+        chunk_id , vectors , metadata = item
+        start = time.perf_counter()
+        try:
+            finite = np.isfinite(vectors).all(axis=1)
+            by_modality = {}
+            copied = 0
+            for row , (modality , file_path , create_time , cache_key) in enumerate(metadata):
+                if not finite[row]:
+                    continue
+                files = [(modality , file_path , create_time)]
+                if cache_key is not None:
+                    with cache_lock:
+                        main_seq.get_embedding_cache().put(cache_key , vectors[row])
+                        files += copies.pop(cache_key , [])
+                copied += len(files) - 1
+                for modality , file_path , create_time in files:
+                    rows , metas = by_modality.setdefault(modality , ([] , []))
+                    rows.append(row)
+                    metas.append(main_seq.utils.get_meta(file_path=file_path , create_time=create_time))
+
+            for modality , (rows , metas) in by_modality.items():
+                main_seq.faiss_manager.store_batch(type=modality , embeddings=vectors[rows] , metadatas=metas)
+        finally:
+            ring.release(chunk_id)
+
+        written = int(finite.sum())
+        stats.add("write" , items=written + copied , errors=len(metadata) - written , busy=time.perf_counter() - start)
+        main_seq.metrics.add("write" , time.perf_counter() - start , items=written + copied , errors=len(metadata) - written)
+
+
+def run_pipeline(search_dir:str , extract_workers:int = config.EXTRACT_WORKERS , embed_workers:int = config.EMBED_WORKERS ,
+                 queue_size:int = config.PIPELINE_QUEUE_SIZE , full_rebuild:bool = False , progress_callback = None) -> dict:
+    """
+    Function to index search_dir with the multi process pipeline
+    Same incremental behaviour as main_seq.dir_traversal , call main_seq.save_state() afterwards.
+    On KeyboardInterrupt the workers are stopped , what was already embedded is added
+    to the index and recorded in the manifest , then the interrupt is re-raised.
+    args:
+        search_dir (str) : directory to index
+        extract_workers (int) : number of extraction processes
+        embed_workers (int) : number of embedding processes (each loads MobileCLIP)
+        queue_size (int) : capacity of every queue between the stages
+        full_rebuild (bool) : ignore the previous index
+        progress_callback (callable) : called as (done , discovered , stats snapshot)
+    returns:
+        dict : {"discovered" , "unchanged" , "removed" , "stages" : per stage stats}
+    """
+    import encoder.main_seq as main_seq
+
+    # spawn : workers must not inherit torch / faiss thread pools from a fork
+    ctx = mp.get_context("spawn")
+    file_queue = ctx.Queue(maxsize=queue_size)
+    content_queue = ctx.Queue(maxsize=queue_size)
+    # embeddings travel through shared memory instead of a pickling queue
+    ring = EmbeddingRing(ctx , n_chunks=config.RING_CHUNKS , chunk_size=max(config.TEXT_BATCH_SIZE , config.IMAGE_BATCH_SIZE))
+    stop_event = ctx.Event()
+    stats = StageStats(ctx)
+    cache_lock = threading.Lock()
+    # cache_key of a file in flight -> files with the same content , added by the writer with its vector
+    copies = {}
+    metrics = main_seq.metrics
+    metrics_queue = ctx.Queue() if metrics.enabled else None
+
+    main_seq.load_previous_state(full_rebuild)
+
+    extractors = [ctx.Process(target=extraction_worker , args=(file_queue , content_queue , stats , stop_event , metrics_queue) , daemon=True)
+                  for _ in range(extract_workers)]
+    embedders = [ctx.Process(target=embedding_worker , args=(content_queue , ring , stats , stop_event , metrics_queue) , daemon=True)
+                 for _ in range(embed_workers)]
+    writer = threading.Thread(target=writer_thread , args=(ring , stats , stop_event , cache_lock , copies) , daemon=True)
+
+    for proc in extractors + embedders:
+        proc.start()
+    writer.start()
+
+    files_to_index = {}
+    seen = set()
+    unchanged = 0
+    removed = 0
+    # cache hits skip extraction and embedding , they are written to the ring in chunks
+    hits = []
+
+    def publish_hits():
+        if not hits:
+            return
+        chunk_id = ring.acquire(stop_event)
+        if chunk_id is None:
+            return
+        chunk = ring.chunk(chunk_id)
+        for row , (vector , _) in enumerate(hits):
+            chunk[row] = vector.reshape(-1)
+        ring.publish(chunk_id , len(hits) , [meta for _ , meta in hits] , stop_event)
+        hits.clear()
+
+    def done_count():
+        snapshot = stats.snapshot()
+        return unchanged + snapshot["write"]["items"] + sum(snapshot[stage]["errors"] for stage in STAGES)
+
+    try:
+        for scanned in main_seq.scan_supported(search_dir):
+            seen.add(scanned.path)
+            file_info = main_seq.check_file(scanned)
+            if file_info is None:
+                unchanged += 1
+                continue
+            files_to_index[scanned.path] = file_info
+
+            modality = main_seq.file_modality(scanned.path)
+            with cache_lock:
+                cache_key , cached = main_seq.cached_embedding(scanned.path , file_info["hash"])
+                copy = cached is None and cache_key in copies
+                if copy:
+                    copies[cache_key].append((modality , scanned.path , scanned.create_time))
+                elif cached is None and cache_key is not None:
+                    copies[cache_key] = []
+            if copy:
+                main_seq.metrics.count("copies")
+            elif cached is not None:
+                hits.append((cached , (modality , scanned.path , scanned.create_time , None)))
+                if len(hits) == ring.chunk_size:
+                    publish_hits()
+            else:
+                _put(file_queue , (scanned.path , modality , scanned.create_time , cache_key) , stop_event)
+
+            if progress_callback is not None:
+                progress_callback(done_count() , len(seen) , stats.snapshot())
+
+        publish_hits()
+        removed = main_seq.drop_missing(search_dir , seen)
+
+        # shut the stages down in order , each one drains its input before the next is told to stop
+        for _ in extractors:
+            _put(file_queue , None , stop_event)
+        if metrics_queue is not None:
+            _collect_metrics(metrics_queue , extractors , metrics , stop_event)
+        for proc in extractors:
+            proc.join()
+        for _ in embedders:
+            _put(content_queue , None , stop_event)
+        if metrics_queue is not None:
+            _collect_metrics(metrics_queue , embedders , metrics , stop_event)
+        for proc in embedders:
+            proc.join()
+        ring.finish()
+        writer.join()
+        # copies of files which failed (extraction , decode) are not indexed either
+        stats.add("write" , errors=sum(len(files) for files in copies.values()))
+
+    except BaseException:
+        # KeyboardInterrupt or a failure in the main process , stop every stage
+        stop_event.set()
+        for proc in extractors + embedders:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        writer.join()
+        raise
+
+    finally:
+        ring.close()
+        # whatever reached the writer is kept , also on interrupt / error
+        main_seq.train_add()
+        main_seq.record_indexed(files_to_index)
+        if progress_callback is not None:
+            progress_callback(done_count() , len(seen) , stats.snapshot())
+
+    return {"discovered" : len(seen) , "unchanged" : unchanged , "removed" : removed , "stages" : stats.snapshot()}
+
+
+def print_stage_report(report:dict , console=None):
+    """
+    Function to print the per stage throughput of a pipeline run
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    console = console or Console()
+    table = Table(title="Pipeline stages" , border_style="blue")
+    table.add_column("Stage" , style="bold")
+    table.add_column("Items" , justify="right")
+    table.add_column("Errors" , justify="right")
+    table.add_column("Busy (s)" , justify="right")
+    table.add_column("Items/s" , justify="right")
+    for stage , values in report["stages"].items():
+        table.add_row(stage , str(values["items"]) , str(values["errors"]) , f"{values['busy_s']:.2f}" , f"{values['items_per_s']:.1f}")
+    console.print(table)
+    console.print(f"Discovered: {report['discovered']} , unchanged: {report['unchanged']} , removed: {report['removed']}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi process embedding generation")
+    parser.add_argument("--dir" , type=str , required=True , help="Directory to scan and create embeddings for")
+    parser.add_argument("--extract-workers" , type=int , default=config.EXTRACT_WORKERS , help="Number of extraction processes")
+    parser.add_argument("--embed-workers" , type=int , default=config.EMBED_WORKERS , help="Number of embedding processes")
+    parser.add_argument("--queue-size" , type=int , default=config.PIPELINE_QUEUE_SIZE , help="Capacity of the queues between stages")
+    parser.add_argument("--full" , action="store_true" , help="Ignore the previous index and re-embed every file")
+    parser.add_argument("--metrics" , action="store_true" , help=f"Write per stage metrics (JSON + Prometheus) to {config.METRICS_DIR}")
+    args = parser.parse_args()
+
+    import encoder.utils as utils
+    import encoder.main_seq as main_seq
+    if args.metrics:
+        main_seq.configure_metrics(enabled=True)
 
-    import time
     start_time = time.time()
-
-    index, metadata_map  = main()
-
-    end_time = time.time() - start_time
-
-    print(f"Done, time taken: {end_time}")
-    print(f"Current items in FAISS: {index.ntotal}")
-
-    
-    
-
-    
-
-    
-
-
-
-    
-    
+    try:
+        report = run_pipeline(
+            utils.prep_dir(args.dir),
+            extract_workers=args.extract_workers,
+            embed_workers=args.embed_workers,
+            queue_size=args.queue_size,
+            full_rebuild=args.full
+        )
+        print_stage_report(report)
+    except KeyboardInterrupt:
+        print("keyboard interrupt , keeping what was indexed so far")
+
+    main_seq.save_state()
+    print(f"Done, time taken: {time.time() - start_time:.2f}s")
+    print(f"Current items in FAISS: {main_seq.faiss_manager.current_size()}")
@@ -6,7 +6,6 @@ import psutil
 import numpy as np
 import traceback 
 import argparse
-import torch
 # from tqdm import tqdm # Replacing tqdm with rich.progress
 import warnings
 import json
@@ -28,7 +27,11 @@ try:
     import encoder.config as config
     import encoder.utils as utils
     import encoder.embedding as embedding
-    from encoder.faiss_base import FAISSManagerHNSW , FAISSManagerIVF
+    from encoder.faiss_base import make_faiss_manager
+    from encoder.manifest import FileManifest
+    from encoder.embedding_cache import EmbeddingCache
+    from encoder.scanner import scan_files, ScannedFile
+    from encoder.metrics import get_metrics, configure as configure_metrics
 except ImportError as e:
     print(f"Error importing local modules in main_seq.py: {e}")
     exit(1)
@@ -41,125 +44,280 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 default_console = Console() 
 # Initialize FAISS Manager globally - verbosity controlled here
 # Let's make verbose=False default, rely on rich progress/prints
-faiss_manager = FAISSManagerHNSW(verbose=False) 
-# db_manager = FAISSManagerIVF(5)
+# HNSW or IVF-PQ, see config.INDEX_BACKEND
+faiss_manager = make_faiss_manager(verbose=False) 
+# What is in the index (path, size, mtime, hash, vector id), drives incremental re-indexing
+manifest = FileManifest()
+# Embeddings by content hash, opened on first use (hashing the weights for the model id)
+embedding_cache = None
+# per stage timers / extraction histograms, no-ops unless enabled (config.METRICS_ENABLED, --metrics)
+metrics = get_metrics()
 
-content_extractor_func = {
-    "pdf" : utils.pdf_extractor,
-    "txt" : utils.text_extractor,
-    "docx" : utils.docs_extractor,
-    "ppt" : utils.ppt_extractor, # Assuming these exist in utils
-    "xlsx" : utils.excel_extractor, # Corrected common excel extension
-    "xls" : utils.excel_extractor,
-    "md" : utils.markdown_extractor
-    # Add other mappings as needed based on utils implementation
-}
+# extension -> extractor, shared with the multi process pipeline (encoder/main.py)
+content_extractor_func = utils.content_extractor_func
+SUPPORTED_EXTENSIONS = set(config.SUPPORTED_EXT_IMG) | set(content_extractor_func)
 
 
+def scan_supported(search_dir: str):
+    """Streams the supported files under search_dir (ScannedFile) as the walk discovers them."""
+    return metrics.iterate("walk", scan_files(search_dir, SUPPORTED_EXTENSIONS))
+
 def get_files_to_process(search_dir: str) -> list[str]:
     """Scans directory and returns a list of file paths to process."""
-    file_list = []
-    for dirpath, dirnames, filenames in os.walk(search_dir):
-        # Simple exclusion example (can be made more robust)
-        # Skip hidden directories (like .git, .vscode etc.)
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')] 
-        # Skip specific restricted paths if needed (example from original code)
-        # if any(restricted in dirpath.split(os.sep) for restricted in config.RESTRICTED_DIRS_INITIAL):
-        #    continue 
-        
-        for filename in filenames:
-             # Skip hidden files
-            if filename.startswith('.'):
-                continue
-                
-            file_path = os.path.join(dirpath, filename)
-            file_ext = file_path.split('.')[-1].lower() # Use lower case for consistency
-            if file_ext in config.SUPPORTED_EXT_IMG or file_ext in content_extractor_func:
-                 file_list.append(file_path)
-    return file_list
+    return [scanned.path for scanned in scan_supported(search_dir)]
+
+def load_previous_state(full_rebuild: bool = False):
+    """
+    Loads the previous index + manifest so only changed files get embedded.
+    Falls back to an empty index when there is no previous state or full_rebuild is set.
+    """
+    if full_rebuild or not manifest.load() or not faiss_manager.load_state():
+        faiss_manager.reset_index()
+        manifest.clear()
 
-def process_directory_with_progress(search_dir: str, progress_callback: callable):
+def check_file(scanned: ScannedFile):
+    """
+    Compares a scanned file against the manifest.
+    Returns None when it is unchanged, else its file info ({"size", "mtime", "hash", "create_time"}).
+    The vector of an older version of the file is removed right away.
+    """
+    if metrics.enabled and manifest.needs_hash(scanned.path, scanned.size, scanned.mtime_ns):
+        metrics.observe_read("hash", scanned.size)
+    with metrics.timer("check"):
+        file_info, stale = manifest.check(scanned.path, scanned.size, scanned.mtime_ns)
+    if file_info is None:
+        metrics.count("unchanged")
+        return None
+
+    if stale:
+        faiss_manager.remove_paths([scanned.path])
+        manifest.remove(scanned.path)
+    file_info["create_time"] = scanned.create_time
+    return file_info
+
+def drop_missing(search_dir: str, seen: set) -> int:
+    """
+    Removes files under search_dir which are in the manifest but were not seen by this scan (deleted).
+    Returns how many were removed.
+    """
+    missing = manifest.missing(search_dir, seen)
+    with metrics.timer("remove_missing", items=len(missing)):
+        faiss_manager.remove_paths(missing)
+    for file_path in missing:
+        manifest.remove(file_path)
+    return len(missing)
+
+def record_indexed(files_to_index: dict):
+    """
+    Records the files of this run which made it into the index in the manifest (after train_add).
+    Files which failed are left out so the next run retries them.
+    """
+    for file_path, file_info in files_to_index.items():
+        live = faiss_manager.path_id(file_path)
+        if live is not None:
+            modality, faiss_id = live
+            manifest.record(file_path, file_info, faiss_id, modality)
+
+def save_state():
+    """Saves the FAISS index, the manifest describing it and the embedding cache, then the final metrics report."""
+    with metrics.timer("save_state"):
+        faiss_manager.save_state()
+        manifest.save()
+        if embedding_cache is not None:
+            embedding_cache.save()
+    metrics.dump()
+
+def train_add():
+    """Adds the stored embeddings to the FAISS index (timed)."""
+    with metrics.timer("train_add", items=sum(len(chunk) for temp in (faiss_manager.text_temp, faiss_manager.image_temp) for chunk in temp)):
+        faiss_manager.train_add()
+
+def get_embedding_cache() -> EmbeddingCache:
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache(
+            cache_dir=config.EMBEDDING_CACHE_DIR,
+            model_id=embedding.model_id(),
+            dim=embedding.EMBEDDING_DIM,
+            max_bytes=config.EMBEDDING_CACHE_MAX_BYTES
+        )
+    return embedding_cache
+
+def file_modality(file_path: str):
+    """Returns "text", "image" or None (unsupported) based on the extension."""
+    file_ext = file_path.split('.')[-1].lower()
+    if file_ext in content_extractor_func:
+        return "text"
+    if file_ext in config.SUPPORTED_EXT_IMG:
+        return "image"
+    return None
+
+def cached_embedding(file_path: str, file_hash: str = None):
+    """
+    Looks the file up in the embedding cache.
+    Returns (cache_key, embedding or None), cache_key is None when the cache is disabled.
+    """
+    modality = file_modality(file_path)
+    if not config.USE_EMBEDDING_CACHE or modality is None:
+        return None, None
+
+    cache = get_embedding_cache()
+    # image embeddings also depend on the decode mode
+    tag = f"{modality}:fast" if modality == "image" and config.FAST_IMAGE_DECODE else modality
+    if file_hash is None:
+        if metrics.enabled:
+            metrics.observe_read("hash", os.path.getsize(file_path))
+        file_hash = utils.file_hash(file_path)
+    cache_key = cache.key(file_hash, tag)
+    cached = cache.get(cache_key)
+    metrics.count("cache_hits" if cached is not None else "cache_misses")
+    return cache_key, cached
+
+def cache_embedding(content_data: dict, embedding_vec: np.ndarray):
+    """Adds a freshly computed embedding to the cache."""
+    if content_data.get("cache_key") is not None:
+        get_embedding_cache().put(content_data["cache_key"], embedding_vec)
+
+def process_directory_with_progress(search_dir: str, progress_callback: callable, full_rebuild: bool = False):
     """
     Processes directory and calls callback for progress updates.
+    Files are processed while the walk is still running, so the total passed to the
+    callback grows as files are discovered. Only new or modified files are embedded.
     NO PRINTING.
     """
-    faiss_manager.reset_index()
-    files = get_files_to_process(search_dir)
-    total_files = len(files)
+    quiet_console = Console(quiet=True)
+    load_previous_state(full_rebuild)
     processed_count = 0
     errors = 0
-
-    for file_path in files:
-        current_file_name = os.path.basename(file_path)
+    unchanged = 0
+    pending = new_pending()
+    files_to_index = {}
+    seen = set()
+
+    for scanned in scan_supported(search_dir):
+        seen.add(scanned.path)
+        current_file_name = os.path.basename(scanned.path)
         try:
-            # --- Call your existing extraction/embedding logic ---
-            # Replace prints within these functions or capture their output.
-            # meta = utils.get_meta(file_path)
-            # content = content_extract_logic(file_path) # Must not print
-            # embedding = generate_embedding_logic(content, meta) # Must not print
-            # store_embedding_logic(embedding, meta) # Must not print
-            # --- Example: simulate work ---
-            time.sleep(0.01)
-            # ------------------------------
+            file_info = check_file(scanned)
+            if file_info is None:
+                unchanged += 1
+            else:
+                files_to_index[scanned.path] = file_info
+                index_file(file_path=scanned.path, pending=pending, console=quiet_console, file_info=file_info)
             processed_count += 1
-            progress_callback(processed_count, total_files, current_file_name)
+            progress_callback(processed_count, len(seen), current_file_name)
         except Exception as e:
             errors += 1
             # Report error via callback
-            progress_callback(processed_count, total_files, current_file_name, message=f"[red]Error: {e}[/red]")
+            progress_callback(processed_count, len(seen), current_file_name, message=f"[red]Error: {e}[/red]")
 
     # After loop: train, add, save
-    faiss_manager.train_add()
-    faiss_manager.save_state()
+    flush_pending(pending, console=quiet_console)
+    dropped = drop_missing(search_dir, seen)
+    train_add()
+    record_indexed(files_to_index)
+    save_state()
     final_counts = faiss_manager.current_size()
 
     # Maybe return final status (could also be part of last callback)
-    return {"success": True, "processed": processed_count, "errors": errors, "final_counts": final_counts}
+    return {"success": True, "processed": processed_count, "errors": errors, "unchanged": unchanged,
+            "removed": dropped, "final_counts": final_counts}
 
-def dir_traversal(search_dir, console=default_console, external_progress=None):       
+def parallel_dir_traversal(search_dir, console=default_console, external_progress=None, full_rebuild=False,
+                           extract_workers=config.EXTRACT_WORKERS, embed_workers=config.EMBED_WORKERS):
+    """
+    dir_traversal on the multi process pipeline of encoder/main.py
+    (extraction processes -> embedding processes -> writer), same progress display.
+    """
+    from encoder import main as pipeline
+
+    console.print(f"[blue]🔍 Starting parallel traversal of:[/blue] [italic]{search_dir}[/italic] "
+                  f"([cyan]{extract_workers}[/cyan] extract / [cyan]{embed_workers}[/cyan] embed workers)")
+
+    if external_progress:
+        task_id = None
+        for task in external_progress.tasks:
+            if task.description == "Generating embeddings...":
+                task_id = task.id
+                break
+        if task_id is None:
+            task_id = external_progress.add_task("[yellow]Processing files...", total=None)
+
+        def on_progress(done, discovered, stages):
+            # Up to 80% as in generate_embeddings
+            external_progress.update(task_id, completed=done / max(discovered, 1) * 80)
+
+        report = pipeline.run_pipeline(search_dir, extract_workers=extract_workers, embed_workers=embed_workers,
+                                       full_rebuild=full_rebuild, progress_callback=on_progress)
+    else:
+        progress = Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeElapsedColumn(),
+            console=console
+        )
+        with progress:
+            task_id = progress.add_task("[yellow]Processing files...", total=None)
+
+            def on_progress(done, discovered, stages):
+                progress.update(task_id, completed=done, total=discovered,
+                                description=f"[yellow]extract {stages['extract']['items_per_s']:.1f}/s · "
+                                            f"embed {stages['embed']['items_per_s']:.1f}/s · "
+                                            f"write {stages['write']['items_per_s']:.1f}/s")
+
+            report = pipeline.run_pipeline(search_dir, extract_workers=extract_workers, embed_workers=embed_workers,
+                                           full_rebuild=full_rebuild, progress_callback=on_progress)
+
+    pipeline.print_stage_report(report, console=console)
+    console.print("[green]✅ Embeddings added to FAISS index.[/green]")
+
+def dir_traversal(search_dir, console=default_console, external_progress=None, full_rebuild=False):       
     """
     Traverses directory, extracts content, generates embeddings, and adds to FAISS.
-    Uses Rich progress bar.
+    Files are extracted as the walk discovers them, there is no upfront file list.
+    Only files which are new or modified since the last run are embedded, unchanged
+    files keep their vectors. Call save_state() afterwards.
+    Uses Rich progress bar, its total grows as the walk proceeds.
     
     Parameters:
     - search_dir: Directory to traverse
     - console: Rich console object for output
     - external_progress: Optional external progress object from the caller
+    - full_rebuild: Ignore the previous index and re-embed every file
     """
-    console.print("[yellow]Resetting FAISS index before traversal...[/yellow]")
-    faiss_manager.reset_index()
+    if full_rebuild:
+        console.print("[yellow]Resetting FAISS index before traversal...[/yellow]")
+    load_previous_state(full_rebuild)
     current_size = faiss_manager.current_size()
     console.print(f"   📊 Initial Text Index: [cyan]{current_size[0]}[/cyan] items")
     console.print(f"   🖼️ Initial Image Index: [cyan]{current_size[1]}[/cyan] items")
     
     console.print(f"[blue]🔍 Starting traversal of:[/blue] [italic]{search_dir}[/italic]")
 
-    # Collect all files first to get a total for the progress bar
-    file_list = []
-    for dirpath, dirnames, filenames in os.walk(search_dir):
-        # Simple exclusion example (can be made more robust)
-        # Skip hidden directories (like .git, .vscode etc.)
-        dirnames[:] = [d for d in dirnames if not d.startswith('.')] 
-        # Skip specific restricted paths if needed (example from original code)
-        # if any(restricted in dirpath.split(os.sep) for restricted in config.RESTRICTED_DIRS_INITIAL):
-        #    continue 
-        
-        for filename in filenames:
-             # Skip hidden files
-            if filename.startswith('.'):
-                continue
-                
-            file_path = os.path.join(dirpath, filename)
-            file_ext = file_path.split('.')[-1].lower() # Use lower case for consistency
-            if file_ext in config.SUPPORTED_EXT_IMG or file_ext in content_extractor_func:
-                 file_list.append(file_path)
-
-    if not file_list:
-        console.print("[yellow]⚠️ No supported files found in the specified directory.[/yellow]")
-        return # Nothing to process
-
     processed_files = 0
     errors = 0
+    unchanged = 0
+    # extracted texts / image paths waiting for a full MobileCLIP batch
+    pending = new_pending()
+    files_to_index = {}
+    seen = set()
+
+    def process(scanned: ScannedFile):
+        nonlocal processed_files, errors, unchanged
+        try:
+            file_info = check_file(scanned)
+            if file_info is None:
+                unchanged += 1
+                return
+            files_to_index[scanned.path] = file_info
+            index_file(file_path=scanned.path, pending=pending, console=console, file_info=file_info)
+            processed_files += 1
+        except Exception as e:
+            errors += 1
+            console.print(f"\n[bold red]Error processing file:[/bold red] [italic]{scanned.path}[/italic]")
+            console.print(f"[red]   {e}[/red]")
 
     try:
         # If we have an external progress bar, use it
@@ -172,22 +330,16 @@ def dir_traversal(search_dir, console=default_console, external_progress=None):
                     break
             
             if task_id is None:
-                task_id = external_progress.add_task("[yellow]Processing files...", total=len(file_list))
+                task_id = external_progress.add_task("[yellow]Processing files...", total=None)
             
             # Process files with external progress
-            for file_path in file_list:
-                external_progress.update(task_id, description=f"Processing: [cyan]{os.path.basename(file_path)}[/cyan]", refresh=True)
-                try:
-                    content_extract(file_path=file_path, console=console)
-                    processed_files += 1
-                except Exception as e:
-                    errors += 1
-                    console.print(f"\n[bold red]Error processing file:[/bold red] [italic]{file_path}[/italic]")
-                    console.print(f"[red]   {e}[/red]")
-                finally:
-                    # Update progress but don't advance (caller manages completion)
-                    completed = processed_files / len(file_list) * 80  # Up to 80% as in generate_embeddings
-                    external_progress.update(task_id, completed=completed)
+            for scanned in scan_supported(search_dir):
+                seen.add(scanned.path)
+                external_progress.update(task_id, description=f"Processing: [cyan]{os.path.basename(scanned.path)}[/cyan]", refresh=True)
+                process(scanned)
+                # Update progress but don't advance (caller manages completion)
+                completed = (processed_files + unchanged) / len(seen) * 80  # Up to 80% as in generate_embeddings
+                external_progress.update(task_id, completed=completed)
         else:
             # Create our own progress bar only if one wasn't provided
             # Setup Rich Progress Bar
@@ -202,23 +354,27 @@ def dir_traversal(search_dir, console=default_console, external_progress=None):
             )
             
             with progress:
-                task_id = progress.add_task("[yellow]Processing files...", total=len(file_list))
+                task_id = progress.add_task("[yellow]Processing files...", total=None)
                 
-                for file_path in file_list:
-                    progress.update(task_id, description=f"Processing: [cyan]{os.path.basename(file_path)}[/cyan]")
-                    try:
-                        content_extract(file_path=file_path, console=console)
-                        processed_files += 1
-                    except Exception as e:
-                        errors += 1
-                        console.print(f"\n[bold red]Error processing file:[/bold red] [italic]{file_path}[/italic]")
-                        console.print(f"[red]   {e}[/red]") 
-                    finally:
-                        # Advance progress bar regardless of success/failure for this file
-                        progress.advance(task_id)
+                for scanned in scan_supported(search_dir):
+                    seen.add(scanned.path)
+                    # the total grows as the walk discovers files
+                    progress.update(task_id, total=len(seen), description=f"Processing: [cyan]{os.path.basename(scanned.path)}[/cyan]")
+                    process(scanned)
+                    # Advance progress bar regardless of success/failure for this file
+                    progress.advance(task_id)
+
+        if not seen:
+            console.print("[yellow]⚠️ No supported files found in the specified directory.[/yellow]")
+
+        # embed whatever is left in the last partial batches
+        flush_pending(pending, console=console)
+
+        dropped = drop_missing(search_dir, seen)
 
         console.print(f"\n[blue]Traversal complete.[/blue]")
         console.print(f"  Processed: [green]{processed_files}[/green] files")
+        console.print(f"  Unchanged: [cyan]{unchanged}[/cyan] files, removed: [cyan]{dropped}[/cyan]")
         if errors > 0:
             console.print(f"  Skipped due to errors: [red]{errors}[/red] files")
 
@@ -236,7 +392,7 @@ def dir_traversal(search_dir, console=default_console, external_progress=None):
                     break
                     
             # Do the work without a new live display
-            faiss_manager.train_add()
+            train_add()
             
             # Update description back after completion if we found a task
             if task_id is not None:
@@ -244,8 +400,9 @@ def dir_traversal(search_dir, console=default_console, external_progress=None):
         else:
             # Use status display only if we're not already in an external progress
             with console.status("[bold yellow]Adding vectors to FAISS...[/bold yellow]", spinner="dots"):
-                faiss_manager.train_add()
+                train_add()
                 
+        record_indexed(files_to_index)
         console.print("[green]✅ Embeddings added to FAISS index.[/green]")
 
     except Exception as e:
@@ -253,14 +410,86 @@ def dir_traversal(search_dir, console=default_console, external_progress=None):
         console.print_exception(show_locals=False) # Rich traceback
         raise # Re-raise after logging
 
-def content_extract(file_path, console=default_console):
+def new_pending() -> dict:
+    """
+    The queue of index_file: a "text" and an "image" batch, and per modality the content
+    waiting in them by content key ("waiting"), so copies of a file are embedded once.
+    """
+    return {"text": [], "image": [], "waiting": {"text": {}, "image": {}}}
+
+def index_file(file_path, pending: dict, console=default_console, file_info: dict = None):
+    """
+    Extracts a single file and queues it for the embedding stage.
+    pending (new_pending) holds a "text" and an "image" list , each one is embedded in a single
+    MobileCLIP call once it reaches config.TEXT_BATCH_SIZE / config.IMAGE_BATCH_SIZE.
+    Files whose content is in the embedding cache skip extraction and MobileCLIP, so do
+    copies of content already waiting in a batch: they get the vector of that one.
+    file_info ({"hash", "create_time", ...} from check_file) saves re-reading / re-stating the file.
+    """
+    file_info = file_info or {}
+    cache_key, cached = cached_embedding(file_path, file_info.get("hash"))
+    if cached is not None:
+        metadata = utils.get_meta(file_path=file_path, create_time=file_info.get("create_time"))
+        store_embedding((file_modality(file_path), cached, metadata), console=console)
+        return
+
+    modality = file_modality(file_path)
+    # the cache key , or the content hash when the cache is off
+    content_key = cache_key or file_info.get("hash")
+    waiting = pending["waiting"][modality].get(content_key) if modality and content_key else None
+    if waiting is not None:
+        waiting["copies"].append(utils.get_meta(file_path=file_path, create_time=file_info.get("create_time")))
+        metrics.count("copies")
+        return
+
+    content_dic = content_extract(file_path=file_path, console=console, create_time=file_info.get("create_time"),
+                                  size=file_info.get("size"))
+    if content_dic is None:
+        return
+    content_dic["cache_key"] = cache_key
+    content_dic["copies"] = []
+    if content_key:
+        pending["waiting"][content_dic["type"]][content_key] = content_dic
+
+    batch = pending[content_dic["type"]]
+    batch.append(content_dic)
+    if content_dic["type"] == "text" and len(batch) >= config.TEXT_BATCH_SIZE:
+        flush_batch(pending, "text", console=console)
+    elif content_dic["type"] == "image" and len(batch) >= config.IMAGE_BATCH_SIZE:
+        flush_batch(pending, "image", console=console)
+
+
+def flush_batch(pending: dict, modality: str, console=default_console):
+    """
+    Embeds the "text" or "image" batch of pending and empties it.
+    """
+    if modality == "text":
+        generate_text_embeddings(pending["text"], console=console)
+    else:
+        generate_image_embeddings(pending["image"], console=console)
+    pending[modality].clear()
+    # later copies find the vector in the embedding cache
+    pending["waiting"][modality].clear()
+
+
+def flush_pending(pending: dict, console=default_console):
+    """
+    Embeds the partially filled batches left in pending.
+    """
+    flush_batch(pending, "text", console=console)
+    flush_batch(pending, "image", console=console)
+
+
+def content_extract(file_path, console=default_console, create_time=None, size=None):
     """
     Extracts content from a single file based on its extension.
-    (Minor logging changes if needed, primarily relies on generate_embedding)
+    Returns the content dict ({"content", "metadata", "type"}) or None for unsupported files.
+    size (bytes, from the scan) is only used for the metrics (bytes read).
     """
     try:
         file_ext = file_path.split('.')[-1].lower()
-        file_meta_data = utils.get_meta(file_path=file_path) # Assuming get_meta works
+        with metrics.timer("get_meta"):
+            file_meta_data = utils.get_meta(file_path=file_path, create_time=create_time)
 
         content = None
         content_type = "unknown"
@@ -269,21 +498,27 @@ def content_extract(file_path, console=default_console):
         if file_ext in content_extractor_func:
             extractor = content_extractor_func[file_ext]
             # console.print(f"  Extracting text from: {os.path.basename(file_path)}", style="dim") # Optional finer logs
-            content = extractor(file_path=file_path)
+            with metrics.timer("extract") as timer:
+                content = extractor(file_path=file_path)
+            if metrics.enabled:
+                metrics.observe_file(file_path, file_ext, time.perf_counter() - timer.start,
+                                     size if size is not None else os.path.getsize(file_path))
             content_type = "text"
             
         # --- Image files ---
         elif file_ext in config.SUPPORTED_EXT_IMG:
             # console.print(f"  Processing image: {os.path.basename(file_path)}", style="dim") # Optional finer logs
-            content = file_path + "~" # Signal for image processing in generate_embedding
+            content = file_path + "~" # Signal for image processing in the embedding stage
             content_type = "image"
+            if metrics.enabled:
+                # read by the image decode in the embedding stage
+                metrics.observe_read("image", size if size is not None else os.path.getsize(file_path))
             
-        # --- Generate Embedding ---
+        # --- Hand over to the embedding stage ---
         if content is not None:
-             content_dic = {"content": content, "metadata": file_meta_data, "type": content_type}
-             generate_embedding(content_dic, console=console) # Pass console
-        # else: # File type not supported or extractor failed silently
-             # console.print(f"  [dim]Skipping unsupported or empty file: {os.path.basename(file_path)}[/dim]")
+             return {"content": content, "metadata": file_meta_data, "type": content_type}
+        # File type not supported or extractor failed silently
+        return None
              
     except Exception as e:
         # Log error specifically for this file, but let dir_traversal handle overall flow
@@ -293,66 +528,68 @@ def content_extract(file_path, console=default_console):
         raise  
 
 
-def generate_embedding(content_data, console=default_console):
+def generate_text_embeddings(content_batch: list, console=default_console):
     """
-    Generates embedding for text or image content and queues it for FAISS.
+    Generates embeddings for a batch of extracted texts in one MobileCLIP call and stores them.
     """
-    try:  
-        content = content_data["content"]
-        metadata = content_data["metadata"]
-        embed_type = content_data["type"] # "text" or "image"
-        generated_embedding = None
-	 	
-        if embed_type == "image" and content.endswith("~"):
-            img_path = content[:-1]
-            if os.path.exists(img_path):
-                # console.print(f"    Generating image embedding...", style="dim") # Optional
-                generated_embedding = embedding.image_extract(img_path)
-            else:
-                console.print(f"[yellow]Warning: Image path not found after signal removal: {img_path}[/yellow]")
-                return # Skip if path invalid
+    # Skip empty texts
+    content_batch = [c for c in content_batch if c["content"] and c["content"].strip()]
+    if not content_batch:
+        return
 
-        elif embed_type == "text":
-            if content and content.strip(): # Ensure content is not empty
-                # console.print(f"    Generating text embedding...", style="dim") # Optional
-                generated_embedding = embedding.text_extract(content)
-            else:
-                 # console.print(f"    Skipping empty text content for {metadata.get('file_name', 'file')}", style="dim") # Optional
-                 return # Skip empty text
+    try:
+        with metrics.timer("embed_text", items=len(content_batch)):
+            text_features = embedding.encode_texts([c["content"] for c in content_batch], batch_size=config.TEXT_BATCH_SIZE)
+    except Exception as e:
+        console.print(f"\n[bold red]Error during batched text embedding of {len(content_batch)} files:[/bold red]")
+        console.print(f"[red]   {e}[/red]")
+        return
 
-        else:
-             console.print(f"[yellow]Warning: Unknown content type '{embed_type}' for {metadata.get('file_name', 'file')}[/yellow]")
-             return
+    for content_data, text_embedding in zip(content_batch, text_features):
+        metadata = content_data["metadata"]
+        if not np.isfinite(text_embedding).all():
+            console.print(f"[red]Warning: Embedding for {metadata.get('file_name', 'file')} contains NaN or Inf. Skipping.[/red]")
+            continue
+        cache_embedding(content_data, text_embedding)
+        for copy_metadata in [metadata] + content_data.get("copies", []):
+            store_embedding(("text", text_embedding.reshape(1, -1), copy_metadata), console=console)
 
-        # --- Store Embedding Temporarily ---
-        if generated_embedding is not None:
-            if isinstance(generated_embedding, torch.Tensor):
-                generated_embedding = generated_embedding.cpu().numpy()
-            
-            # Ensure it's a 2D array for FAISS
-            if generated_embedding.ndim == 1:
-                 generated_embedding = np.expand_dims(generated_embedding, axis=0)
-
-            # Basic check for NaN/Inf before storing (optional but good practice)
-            if not np.isfinite(generated_embedding).all():
-                 console.print(f"[red]Warning: Embedding for {metadata.get('file_name', 'file')} contains NaN or Inf. Skipping.[/red]")
-                 return
-                 
-            # Normalize embeddings? FAISS often works better with normalized vectors for cosine sim
-            # If your embedding models don't normalize, uncomment below:
-            # faiss.normalize_L2(generated_embedding) 
-            
-            # Debugging norm print - keep if useful, remove for cleaner output
-            # norm = np.linalg.norm(generated_embedding)
-            # console.print(f"    Embedding norm for {metadata.get('file_name', 'file')}: {norm:.4f}", style="dim")
 
-            data = (embed_type, generated_embedding, metadata)
-            store_embedding(data, console=console) # Pass console
-            
+def generate_image_embeddings(content_batch: list, console=default_console):
+    """
+    Generates embeddings for a batch of images (decoded in parallel) and stores them.
+    """
+    if not content_batch:
+        return
+
+    # content is the image path with the "~" image signal appended
+    content_by_path = {c["content"][:-1]: c for c in content_batch}
+    metadata_by_path = {img_path: c["metadata"] for img_path, c in content_by_path.items()}
+    try:
+        with metrics.timer("embed_image", items=len(metadata_by_path)):
+            image_features, encoded_paths = embedding.encode_images(
+                list(metadata_by_path),
+                batch_size=config.IMAGE_BATCH_SIZE,
+                num_workers=config.IMAGE_DECODE_WORKERS,
+                fast_decode=config.FAST_IMAGE_DECODE
+            )
     except Exception as e:
-        console.print(f"\n[bold red]Error during embedding generation for {metadata.get('file_name', 'file')}:[/bold red]")
+        console.print(f"\n[bold red]Error during batched image embedding of {len(content_batch)} files:[/bold red]")
         console.print(f"[red]   {e}[/red]")
-        # Don't raise here, allow main loop to continue with other files
+        return
+
+    if len(encoded_paths) < len(metadata_by_path):
+        for img_path in set(metadata_by_path) - set(encoded_paths):
+            console.print(f"[yellow]Warning: Could not decode image {img_path}. Skipping.[/yellow]")
+
+    for img_path, image_embedding in zip(encoded_paths, image_features):
+        metadata = metadata_by_path[img_path]
+        if not np.isfinite(image_embedding).all():
+            console.print(f"[red]Warning: Embedding for {metadata.get('file_name', 'file')} contains NaN or Inf. Skipping.[/red]")
+            continue
+        cache_embedding(content_by_path[img_path], image_embedding)
+        for copy_metadata in [metadata] + content_by_path[img_path].get("copies", []):
+            store_embedding(("image", image_embedding.reshape(1, -1), copy_metadata), console=console)
 
 
 def store_embedding(data: tuple, console=default_console):
@@ -376,6 +613,11 @@ def store_embedding(data: tuple, console=default_console):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Embedding Generation CLI")
     parser.add_argument("--dir", type=str, required=True, help="Directory to scan and create embeddings for")
+    parser.add_argument("--full", action="store_true", help="Ignore the previous index and re-embed every file")
+    parser.add_argument("--clear-cache", action="store_true", help="Empty the embedding cache before indexing")
+    parser.add_argument("--workers", type=int, default=0, help="Extraction processes for the parallel pipeline (0 = sequential)")
+    parser.add_argument("--embed-workers", type=int, default=config.EMBED_WORKERS, help="Embedding processes for the parallel pipeline")
+    parser.add_argument("--metrics", action="store_true", help=f"Write per stage metrics (JSON + Prometheus) to {config.METRICS_DIR}")
     # Keep verbose flag if you want detailed file-by-file console output during processing
     # parser.add_argument("--verbose", action="store_true", help="Detailed output during processing") 
     args = parser.parse_args()
@@ -392,13 +634,22 @@ if __name__ == "__main__":
         standalone_console.print(Panel(f"[bold green]Starting Standalone Embedding Generation[/bold green]\nDirectory: [cyan]{search_dir_arg}[/cyan]", border_style="blue"))
         
         start_time = time.time()
+
+        if args.clear_cache:
+            get_embedding_cache().invalidate()
+        if args.metrics:
+            configure_metrics(enabled=True)
         
         # Call the main traversal function, passing the console
-        dir_traversal(search_dir=search_dir_arg, console=standalone_console) 
+        if args.workers > 0:
+            parallel_dir_traversal(search_dir=search_dir_arg, console=standalone_console, full_rebuild=args.full,
+                                   extract_workers=args.workers, embed_workers=args.embed_workers)
+        else:
+            dir_traversal(search_dir=search_dir_arg, console=standalone_console, full_rebuild=args.full) 
         
         # Save the state after traversal completes
         standalone_console.print("[yellow]💾 Saving final FAISS index state...[/yellow]")
-        faiss_manager.save_state()
+        save_state()
         standalone_console.print("[green]✅ Index state saved.[/green]")
         
         end_time = time.time() - start_time
@@ -0,0 +1,106 @@
+import os
+import json
+from typing import Dict
+
+import encoder.utils as utils
+
+
+class FileManifest:
+    """
+    Record of every indexed file , persisted next to the FAISS index.
+    Used to re-embed only new or modified files on later runs.
+
+    entry per file path:
+        size , mtime (ns) , hash (content) , vector_id , modality ("text" / "image")
+    """
+
+    def __init__(self , path:str = "index/manifest.json"):
+        self.path = path
+        self.entries: Dict[str , dict] = {}
+
+
+    def load(self) -> bool:
+        """
+        Function to load the manifest from disk
+        return:
+            True if a manifest was found
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path , "r") as file:
+            self.entries = json.load(file)
+        return True
+
+    def save(self):
+        """
+        Function to save the manifest , written to a temp file first so a crash never leaves half a manifest
+        """
+        os.makedirs(os.path.dirname(self.path) or "." , exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path , "w+") as file:
+            json.dump(self.entries , file)
+        os.replace(temp_path , self.path)
+
+    def clear(self):
+        self.entries = {}
+
+    def needs_hash(self , file_path:str , size:int , mtime:int) -> bool:
+        """
+        Function to tell whether check has to hash (read) the file , i.e. it is new or its size / mtime changed
+        """
+        entry = self.entries.get(file_path)
+        return entry is None or entry["size"] != size or entry["mtime"] != mtime
+
+    def check(self , file_path:str , size:int , mtime:int):
+        """
+        Function to compare one scanned file against the manifest
+        Size and mtime are checked first , the content is only hashed when those changed.
+        args:
+            file_path (str) : path of the file
+            size (int) : size in bytes
+            mtime (int) : modification time in ns
+        returns:
+            tuple : (file_info , stale)
+                file_info -> None when the file is unchanged , else {"size" , "mtime" , "hash"}
+                stale -> True when an older version of the file is in the index
+        """
+        if not self.needs_hash(file_path , size , mtime):
+            return None , False
+
+        entry = self.entries.get(file_path)
+
+        file_hash = utils.file_hash(file_path)
+        if entry is not None and entry["hash"] == file_hash:
+            # touched but same bytes , keep the vector and remember the new mtime
+            entry["size"] , entry["mtime"] = size , mtime
+            return None , False
+
+        return {"size" : size , "mtime" : mtime , "hash" : file_hash} , entry is not None
+
+    def missing(self , search_dir:str , seen:set) -> list:
+        """
+        Function to list files under search_dir which are in the manifest but were not seen by the scan
+        """
+        prefix = os.path.join(search_dir , "")
+        return [file_path for file_path in self.entries if file_path.startswith(prefix) and file_path not in seen]
+
+    def remove(self , file_path:str):
+        self.entries.pop(file_path , None)
+
+    def record(self , file_path:str , file_info:dict , vector_id:int , modality:str):
+        """
+        Function to add / replace the entry of an indexed file
+        args:
+            file_path (str) : path of the file
+            file_info (dict) : {"size" , "mtime" , "hash"} as returned by diff
+            vector_id (int) : id of the file's vector in the FAISS index
+            modality (str) : "text" or "image"
+        """
+        self.entries[file_path] = {
+            "size" : file_info["size"],
+            "mtime" : file_info["mtime"],
+            "hash" : file_info["hash"],
+            "vector_id" : int(vector_id),
+            "modality" : modality
+        }
@@ -0,0 +1,202 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+# columns of a metadata row , the keys of utils.get_meta
+META_FIELDS = ("file_name" , "file_type" , "file_path" , "creation_date")
+
+# sqlite versions before 3.32 allow at most 999 "?" per statement
+_MAX_PARAMS = 900
+# creation_date of the JSON sidecars (local time) , the store keeps unix timestamps
+_SIDECAR_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class MetadataStore:
+    """
+    File metadata addressed by vector id , kept in SQLite instead of JSON sidecars.
+
+    Nothing is parsed up front: rows are read from disk (mmap'ed pages) when asked for ,
+    so a search only materializes the metadata of the k hits it returns. The file path
+    column is indexed , so looking up the live vector of a path needs no dict in memory.
+
+    Changes are kept in an open transaction and only made durable by save() , the same
+    way the FAISS index is only written by save_state. A store which was never saved
+    lives in memory and is written to disk as a whole on its first save.
+
+    row: id (vector id) , type ("text" / "image") , file_name , file_type , file_path , creation_date
+    """
+
+    def __init__(self , path:str = "index/metadata.db" , mmap_size:int = 256 << 20):
+        self.path = path
+        self.mmap_size = mmap_size
+        # the indexing writer thread and the main thread both use the connection
+        self._lock = threading.RLock()
+        self._connect(":memory:")
+
+
+    def _connect(self , database:str , read_only:bool = False):
+        self.on_disk = database != ":memory:"
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{database}?mode=ro" , uri=True , check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(database , check_same_thread=False)
+        self.conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if read_only:
+            return
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "id INTEGER PRIMARY KEY , type TEXT NOT NULL , file_name TEXT , file_type TEXT ,"
+            "file_path TEXT NOT NULL , creation_date INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_path ON files (file_path)")
+
+    def load(self , read_only:bool = False) -> bool:
+        """
+        Function to open the saved store , no rows are read yet
+        args:
+            read_only (bool) : open without write access , e.g. for query processes
+        return:
+            True if a saved store was found
+        """
+        if not os.path.exists(self.path):
+            return False
+        with self._lock:
+            self.conn.close()
+            self._connect(self.path , read_only=read_only)
+        return True
+
+    def save(self):
+        """
+        Function to make all changes durable
+        """
+        with self._lock:
+            if self.on_disk:
+                self.conn.commit()
+                return
+
+            os.makedirs(os.path.dirname(self.path) or "." , exist_ok=True)
+            temp_path = self.path + ".tmp"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            target = sqlite3.connect(temp_path)
+            self.conn.commit()
+            self.conn.backup(target)
+            target.close()
+
+            # a journal left by a crash belongs to the file which is replaced
+            if os.path.exists(self.path + "-journal"):
+                os.remove(self.path + "-journal")
+            os.replace(temp_path , self.path)
+
+            self.conn.close()
+            self._connect(self.path)
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM files")
+
+
+    def add(self , type:str , ids:Iterable[int] , metadatas:List[Dict]):
+        """
+        Function to store the metadata of new vectors
+        args:
+            type (str) : "text" or "image"
+            ids : vector ids , one per metadata
+            metadatas (list) : dicts as returned by utils.get_meta
+        """
+        rows = [(int(faiss_id) , type) + tuple(meta.get(field) for field in META_FIELDS)
+                for faiss_id , meta in zip(ids , metadatas)]
+        with self._lock:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO files (id , type , {' , '.join(META_FIELDS)}) VALUES (? , ? , ? , ? , ? , ?)",
+                rows
+            )
+
+    def get_many(self , ids:Iterable[int]) -> Dict[int , dict]:
+        """
+        Function to read the metadata of some vectors
+        returns:
+            dict : id -> metadata , ids without a row are left out
+        """
+        ids = [int(faiss_id) for faiss_id in ids]
+        found = {}
+        with self._lock:
+            for start in range(0 , len(ids) , _MAX_PARAMS):
+                part = ids[start : start + _MAX_PARAMS]
+                cursor = self.conn.execute(
+                    f"SELECT id , {' , '.join(META_FIELDS)} FROM files WHERE id IN ({' , '.join('?' * len(part))})",
+                    part
+                )
+                for row in cursor:
+                    found[row[0]] = dict(zip(META_FIELDS , row[1:]))
+        return found
+
+    def lookup(self , file_path:str):
+        """
+        returns:
+            tuple(type , id) of the live vector of a file , or None
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT type , id FROM files WHERE file_path = ?" , (file_path,)).fetchone()
+        return row
+
+    def pop_paths(self , file_paths:Iterable[str]) -> List[tuple]:
+        """
+        Function to delete the rows of some files
+        returns:
+            list of (type , id) of the deleted rows
+        """
+        file_paths = list(file_paths)
+        removed = []
+        with self._lock:
+            for start in range(0 , len(file_paths) , _MAX_PARAMS):
+                part = file_paths[start : start + _MAX_PARAMS]
+                marks = " , ".join("?" * len(part))
+                removed.extend(self.conn.execute(f"SELECT type , id FROM files WHERE file_path IN ({marks})" , part).fetchall())
+                self.conn.execute(f"DELETE FROM files WHERE file_path IN ({marks})" , part)
+        return removed
+
+    def ids(self , type:str) -> np.ndarray:
+        """
+        returns:
+            int64 array of the ids with metadata of one side
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT id FROM files WHERE type = ?" , (type,)).fetchall()
+        return np.array([row[0] for row in rows] , dtype="int64")
+
+    def count(self , type:str) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM files WHERE type = ?" , (type,)).fetchone()[0]
+
+    def import_json(self , type:str , json_path:str , id_offset:int = 0):
+        """
+        Function to move the metadata of an old JSON sidecar ({str(id) : metadata}) into the store
+        args:
+            id_offset (int) : added to the ids , see FAISSManager.load_state (indexes with positional ids)
+        """
+        with open(json_path , "r") as file:
+            metadata = json.load(file)
+        metadatas = [{**meta , "creation_date" : _timestamp(meta.get("creation_date"))} for meta in metadata.values()]
+        self.add(type , (int(k) + id_offset for k in metadata) , metadatas)
+
+
+def _timestamp(creation_date):
+    """
+    returns:
+        creation_date of a sidecar as a unix timestamp (int) , None if it cannot be read
+    """
+    if creation_date is None:
+        return None
+    if isinstance(creation_date , (int , float)):
+        return int(creation_date)
+    try:
+        return int(datetime.strptime(creation_date , _SIDECAR_DATE_FORMAT).timestamp())
+    except ValueError:
+        return None
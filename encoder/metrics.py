@@ -0,0 +1,314 @@
+"""
+Indexing instrumentation
+
+    per stage timers / counters (walk , check , get_meta , extract , embed , train_add , save ...)
+    per file extraction latency histogram by extension , the slowest files
+    bytes read from the indexed files , by kind of read (hash , extract , image)
+
+Reported as JSON (index/metrics/index_metrics.json) and in the Prometheus text format
+(index/metrics/index_metrics.prom , for node_exporter's textfile collector) at the end of
+a run and every `interval` seconds while it runs. Disabled (the default) every call
+returns right away , timer() hands out a shared no-op context and iterate() the
+iterable itself.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+
+import encoder.config as config
+
+# upper bounds (seconds) of the extraction latency histogram buckets
+LATENCY_BUCKETS = (0.001 , 0.005 , 0.01 , 0.025 , 0.05 , 0.1 , 0.25 , 0.5 , 1.0 , 2.5 , 5.0 , 10.0 , 30.0)
+PROM_PREFIX = "searchsphere_index"
+
+
+class _Timer:
+    __slots__ = ("metrics" , "stage" , "items" , "start")
+
+    def __init__(self , metrics , stage:str , items:int):
+        self.metrics = metrics
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self , exc_type , exc , tb):
+        self.metrics.add(self.stage , time.perf_counter() - self.start , items=self.items , errors=int(exc_type is not None))
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+    items = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self , exc_type , exc , tb):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Collects the indexing metrics of one process , worker processes send their snapshot()
+    to the main process which merge()s it
+    """
+
+    def __init__(self , enabled:bool = False , report_dir:str = "index/metrics" , interval:float = 30.0 , slowest:int = 20):
+        self.enabled = enabled
+        self.report_dir = report_dir
+        # seconds between periodic dumps , None / 0 = only when dump() is called
+        self.interval = interval
+        self.max_slowest = slowest
+        self._lock = threading.Lock()
+        # held while the report files are written , the writer thread of the pipeline dumps too
+        self._dump_lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        with self._lock:
+            self.start_time = time.time()
+            # stage -> [seconds , items , errors]
+            self.stages = {}
+            self.counters = {}
+            # extension -> {"count" , "seconds" , "bytes" , "buckets" (one per LATENCY_BUCKETS + inf , not cumulative)}
+            self.files = {}
+            # min heap of (seconds , path , ext , bytes)
+            self.slowest = []
+            # kind of read -> bytes read from the indexed files ("hash" , "extract" , "image")
+            self.reads = {}
+            self._last_dump = time.monotonic()
+
+    def timer(self , stage:str , items:int = 1):
+        """
+        with metrics.timer("embed_text" , items=len(batch)): ... , an exception counts as an error
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self , stage , items)
+
+    def add(self , stage:str , seconds:float , items:int = 1 , errors:int = 0):
+        if not self.enabled:
+            return
+        with self._lock:
+            values = self.stages.setdefault(stage , [0.0 , 0 , 0])
+            values[0] += seconds
+            values[1] += items
+            values[2] += errors
+        self.maybe_dump()
+
+    def count(self , name:str , value:int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name , 0) + value
+
+    def observe_file(self , path:str , ext:str , seconds:float , size:int = 0):
+        """
+        Records the extraction of one file
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.files.get(ext)
+            if entry is None:
+                entry = self.files[ext] = {"count" : 0 , "seconds" : 0.0 , "bytes" : 0 , "buckets" : [0] * (len(LATENCY_BUCKETS) + 1)}
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += size or 0
+            self.reads["extract"] = self.reads.get("extract" , 0) + (size or 0)
+            bucket = 0
+            while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+                bucket += 1
+            entry["buckets"][bucket] += 1
+            self._push_slowest((seconds , path , ext , size or 0))
+
+    def observe_read(self , kind:str , size:int):
+        """
+        Records size bytes of an indexed file read outside the text extraction
+        (kind = "hash" for the manifest / cache hash , "image" for the image decode)
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.reads[kind] = self.reads.get(kind , 0) + (size or 0)
+
+    def _push_slowest(self , item:tuple):
+        if len(self.slowest) < self.max_slowest:
+            heapq.heappush(self.slowest , item)
+        elif item[0] > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest , item)
+
+    def iterate(self , stage:str , iterable):
+        """
+        Times the time spent producing the items of iterable (e.g. the directory walk)
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(stage , iter(iterable))
+
+    def _timed_iter(self , stage:str , iterator):
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage , time.perf_counter() - start , items=0)
+                return
+            self.add(stage , time.perf_counter() - start)
+            yield item
+
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            return {
+                "elapsed_s" : elapsed,
+                "stages" : {stage : {"seconds" : seconds , "items" : items , "errors" : errors ,
+                                     "items_per_s" : items / seconds if seconds > 0 else None}
+                            for stage , (seconds , items , errors) in self.stages.items()},
+                "counters" : dict(self.counters),
+                "extract_by_ext" : {ext : {"count" : entry["count"] , "seconds" : entry["seconds"] , "bytes" : entry["bytes"],
+                                           "mean_ms" : entry["seconds"] / entry["count"] * 1000,
+                                           "buckets" : list(entry["buckets"])}
+                                    for ext , entry in self.files.items()},
+                "bytes_read" : sum(self.reads.values()),
+                "bytes_read_by_kind" : dict(self.reads),
+                "slowest_files" : [{"path" : path , "ext" : ext , "seconds" : seconds , "bytes" : size}
+                                   for seconds , path , ext , size in sorted(self.slowest , reverse=True)],
+                "bucket_bounds_s" : list(LATENCY_BUCKETS)
+            }
+
+    def merge(self , snapshot:dict):
+        """
+        Adds the snapshot() of another process (pipeline workers)
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for stage , values in snapshot["stages"].items():
+                current = self.stages.setdefault(stage , [0.0 , 0 , 0])
+                current[0] += values["seconds"]
+                current[1] += values["items"]
+                current[2] += values["errors"]
+            for name , value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name , 0) + value
+            for ext , values in snapshot["extract_by_ext"].items():
+                entry = self.files.setdefault(ext , {"count" : 0 , "seconds" : 0.0 , "bytes" : 0 , "buckets" : [0] * (len(LATENCY_BUCKETS) + 1)})
+                entry["count"] += values["count"]
+                entry["seconds"] += values["seconds"]
+                entry["bytes"] += values["bytes"]
+                entry["buckets"] = [a + b for a , b in zip(entry["buckets"] , values["buckets"])]
+            for kind , size in snapshot["bytes_read_by_kind"].items():
+                self.reads[kind] = self.reads.get(kind , 0) + size
+            for item in snapshot["slowest_files"]:
+                self._push_slowest((item["seconds"] , item["path"] , item["ext"] , item["bytes"]))
+
+    def to_prometheus(self , snapshot:dict = None) -> str:
+        """
+        returns:
+            the metrics in the Prometheus text exposition format
+        """
+        snapshot = snapshot or self.snapshot()
+        lines = []
+
+        def metric(name:str , kind:str , help:str , samples:list):
+            lines.append(f"# HELP {PROM_PREFIX}_{name} {help}")
+            lines.append(f"# TYPE {PROM_PREFIX}_{name} {kind}")
+            for labels , value in samples:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key , val in labels.items())
+                lines.append(f"{PROM_PREFIX}_{name}{{{label_text}}} {value}" if label_text else f"{PROM_PREFIX}_{name} {value}")
+
+        stages = snapshot["stages"]
+        metric("elapsed_seconds" , "gauge" , "Seconds since the run started" , [({} , snapshot["elapsed_s"])])
+        metric("stage_seconds_total" , "counter" , "Seconds spent per stage" ,
+               [({"stage" : stage} , values["seconds"]) for stage , values in stages.items()])
+        metric("stage_items_total" , "counter" , "Items done per stage" ,
+               [({"stage" : stage} , values["items"]) for stage , values in stages.items()])
+        metric("stage_errors_total" , "counter" , "Failed items per stage" ,
+               [({"stage" : stage} , values["errors"]) for stage , values in stages.items()])
+        metric("events_total" , "counter" , "Event counters" ,
+               [({"event" : name} , value) for name , value in snapshot["counters"].items()])
+        metric("bytes_read_total" , "counter" , "Bytes read from the indexed files" ,
+               [({"kind" : kind} , size) for kind , size in snapshot["bytes_read_by_kind"].items()])
+        metric("extract_bytes_total" , "counter" , "Bytes of the extracted files" ,
+               [({"ext" : ext} , values["bytes"]) for ext , values in snapshot["extract_by_ext"].items()])
+
+        name = f"{PROM_PREFIX}_extract_seconds"
+        lines.append(f"# HELP {name} Extraction latency per file")
+        lines.append(f"# TYPE {name} histogram")
+        for ext , values in snapshot["extract_by_ext"].items():
+            cumulative = 0
+            for bound , count in zip(list(LATENCY_BUCKETS) + ["+Inf"] , values["buckets"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{ext="{_escape(ext)}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{ext="{_escape(ext)}"}} {values["seconds"]}')
+            lines.append(f'{name}_count{{ext="{_escape(ext)}"}} {values["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        """
+        Function to write the JSON report and the Prometheus file (each to a temp file first)
+        """
+        if not self.enabled:
+            return
+        with self._dump_lock:
+            self._write()
+
+    def _write(self):
+        self._last_dump = time.monotonic()
+        snapshot = self.snapshot()
+        os.makedirs(self.report_dir , exist_ok=True)
+        for file_name , text in (("index_metrics.json" , json.dumps(snapshot , indent=2)),
+                                 ("index_metrics.prom" , self.to_prometheus(snapshot))):
+            path = os.path.join(self.report_dir , file_name)
+            with open(path + ".tmp" , "w+") as file:
+                file.write(text)
+            os.replace(path + ".tmp" , path)
+
+    def maybe_dump(self):
+        if not self.interval or time.monotonic() - self._last_dump < self.interval:
+            return
+        # another thread is writing the report , it is recent enough
+        if not self._dump_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_dump >= self.interval:
+                self._write()
+        finally:
+            self._dump_lock.release()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\" , "\\\\").replace('"' , '\\"').replace("\n" , "\\n")
+
+
+# the instance the indexing code reports to , see get_metrics / configure
+_metrics = None
+
+def get_metrics() -> Metrics:
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(enabled=config.METRICS_ENABLED , report_dir=config.METRICS_DIR , interval=config.METRICS_INTERVAL)
+    return _metrics
+
+def configure(enabled:bool = True , report_dir:str = None , interval:float = None) -> Metrics:
+    """
+    Function to switch the metrics of this process on / off (the instance stays the same , so
+    modules holding it see the change) , starts a new measurement
+    """
+    metrics = get_metrics()
+    metrics.enabled = enabled
+    if report_dir is not None:
+        metrics.report_dir = report_dir
+    if interval is not None:
+        metrics.interval = interval
+    metrics.reset()
+    return metrics
@@ -0,0 +1,58 @@
+import os
+from typing import Iterator, NamedTuple
+
+
+class ScannedFile(NamedTuple):
+    """
+    A supported file found by scan_files , stat values come straight from DirEntry.stat()
+    """
+    path: str
+    ext: str
+    size: int
+    mtime_ns: int
+    create_time: int # seconds , ctime on windows and mtime elsewhere (same as utils.get_meta)
+
+
+def scan_files(search_dir: str, extensions) -> Iterator[ScannedFile]:
+    """
+    Function to walk search_dir with os.scandir and yield supported files as they are found
+    Hidden files / directories are skipped and symlinked directories are not followed.
+    args:
+        search_dir (str) : directory to walk
+        extensions (set) : lower case extensions (without dot) to yield
+    yields:
+        ScannedFile
+    """
+    stack = [search_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            # unreadable / vanished directory
+            continue
+
+        subdirs = []
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+
+                    ext = entry.name.rsplit('.', 1)[-1].lower() if '.' in entry.name else ''
+                    if ext not in extensions or not entry.is_file():
+                        continue
+
+                    # cached by scandir on windows , one stat call elsewhere
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                create_time = stat.st_ctime if os.name == 'nt' else stat.st_mtime
+                yield ScannedFile(entry.path, ext, stat.st_size, stat.st_mtime_ns, int(create_time))
+
+        # visit subdirectories in listing order , like os.walk
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,131 @@
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class EmbeddingRing:
+    """
+    Zero copy transport of embeddings between processes
+
+    One shared memory block of n_chunks * chunk_size fixed size float32 slots.
+    Chunks (one per batch) circulate by id:
+        free_chunks : chunk ids a producer may fill
+        ready       : (chunk id , count , metadata tuples) for the consumer
+    A producer takes a free chunk , writes its vectors straight into chunk(chunk_id) ,
+    then publishes it. The consumer reads chunk(chunk_id)[:count] as a numpy view and
+    releases the chunk once it is done with it. Only the small metadata tuples are pickled.
+
+    Passed to spawned processes as a Process argument , they attach to the block by name.
+    """
+
+    def __init__(self , ctx , n_chunks:int = 64 , chunk_size:int = 64 , dim:int = 512):
+        self.n_chunks = n_chunks
+        self.chunk_size = chunk_size
+        self.dim = dim
+        nbytes = n_chunks * chunk_size * dim * np.dtype("float32").itemsize
+        self.shm = shared_memory.SharedMemory(create=True , size=nbytes)
+        self.owner = True
+
+        self.free_chunks = ctx.Queue()
+        self.ready = ctx.Queue(maxsize=n_chunks + 1)
+        for chunk_id in range(n_chunks):
+            self.free_chunks.put(chunk_id)
+
+        self._init_view()
+
+    def _init_view(self):
+        self.slots = np.ndarray((self.n_chunks , self.chunk_size , self.dim) , dtype="float32" , buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return {
+            "name" : self.shm.name,
+            "n_chunks" : self.n_chunks,
+            "chunk_size" : self.chunk_size,
+            "dim" : self.dim,
+            "free_chunks" : self.free_chunks,
+            "ready" : self.ready
+        }
+
+    def __setstate__(self , state):
+        self.__dict__.update({k : v for k , v in state.items() if k != "name"})
+        # spawned processes share the resource tracker of the parent , so attaching
+        # registers the same name again and the owner's unlink clears it
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self._init_view()
+
+
+    def acquire(self , stop_event , timeout:float = 0.5):
+        """
+        Function to take a free chunk , blocks while the consumer is behind (backpressure)
+        returns:
+            chunk id or None when stop_event was set
+        """
+        while not stop_event.is_set():
+            try:
+                return self.free_chunks.get(timeout=timeout)
+            except queue.Empty:
+                continue
+        return None
+
+    def chunk(self , chunk_id:int) -> np.ndarray:
+        """
+        returns:
+            (chunk_size , dim) float32 view into shared memory
+        """
+        return self.slots[chunk_id]
+
+    def publish(self , chunk_id:int , count:int , metadata:list , stop_event) -> bool:
+        """
+        Function to hand a filled chunk to the consumer
+        args:
+            chunk_id (int) : chunk from acquire
+            count (int) : number of filled slots
+            metadata (list) : one small tuple per filled slot
+        """
+        while not stop_event.is_set():
+            try:
+                self.ready.put((chunk_id , count , metadata) , timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def finish(self):
+        """
+        Function to tell the consumer there is nothing more to read
+        """
+        self.ready.put(None)
+
+    def receive(self , stop_event , timeout:float = 0.5):
+        """
+        returns:
+            (chunk_id , (count , dim) view , metadata) , or None when finished / stopped
+        """
+        while not stop_event.is_set():
+            try:
+                item = self.ready.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is None:
+                return None
+            chunk_id , count , metadata = item
+            return (chunk_id , self.slots[chunk_id][:count] , metadata)
+        return None
+
+    def release(self , chunk_id:int):
+        """
+        Function to give a chunk back once its vectors were consumed
+        """
+        self.free_chunks.put(chunk_id)
+
+    def close(self):
+        """
+        Function to detach , the creating process also frees the block
+        """
+        # drop the numpy view before closing the buffer it points into
+        self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,65 @@
+"""
+Picks the search parameter of the saved text / image indexes for a recall target and / or a
+latency budget and saves the choice with the index:
+
+    hnsw         -> efSearch (FAISSManagerHNSW.tune_ef_search) , recall against a brute force search
+    ivf / ondisk -> nprobe (FAISSManagerIVF.tune_nprobe) , recall against a search of every list
+
+A sample of the stored vectors is used as queries. For IVF --queries takes real query
+embeddings instead (.npy , (n , dim) float32) , a stored vector sits in its own list so its
+recall is optimistic. Re-run it as the index grows.
+
+usage:
+    python -m encoder.tune_index --recall 0.95
+    python -m encoder.tune_index --recall 0.95 --budget-ms 2 --out tune.json
+    python -m encoder.tune_index --recall 0.9 --queries queries.npy --types text
+"""
+import argparse
+import json
+
+import numpy as np
+
+from encoder.faiss_base import FAISSManagerIVF, make_faiss_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune efSearch / nprobe of the saved indexes")
+    parser.add_argument("--recall", type=float, help="Target recall@k")
+    parser.add_argument("--budget-ms", type=float, help="Max latency of one search (milliseconds)")
+    parser.add_argument("-k", type=int, default=10, help="k of the measured recall@k")
+    parser.add_argument("--sample", type=int, default=200, help="Stored vectors used as queries")
+    parser.add_argument("--queries", type=str, help="Query embeddings (.npy) instead of stored vectors (ivf)")
+    parser.add_argument("--types", type=str, default="text,image")
+    parser.add_argument("--dry-run", action="store_true", help="Only report , keep the saved parameters")
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+    if args.recall is None and args.budget_ms is None:
+        parser.error("give --recall and / or --budget-ms")
+
+    faiss_manager = make_faiss_manager()
+    if not faiss_manager.load_state():
+        return
+    queries = np.load(args.queries).astype("float32") if args.queries else None
+
+    report = {}
+    for type in args.types.split(","):
+        if isinstance(faiss_manager, FAISSManagerIVF):
+            report[type] = faiss_manager.tune_nprobe(type, target_recall=args.recall, latency_budget_ms=args.budget_ms,
+                                                     k=args.k, sample=args.sample, queries=queries)
+            name, key = "nprobe", "nprobe"
+        else:
+            report[type] = faiss_manager.tune_ef_search(type, target_recall=args.recall, latency_budget_ms=args.budget_ms,
+                                                        k=args.k, sample=args.sample)
+            name, key = "efSearch", "ef_search"
+        chosen = report[type]
+        print(f"{type}: {name} {chosen[key]} , recall {chosen['recall']} , {chosen['latency_ms']} ms")
+
+    if not args.dry_run:
+        faiss_manager.save_state()
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,12 @@
-import PyPDF2
 import os
-from docx import Document
-from pptx import Presentation
-import pandas as pd
+import json
 import pathlib
-from datetime import datetime
-import markdown
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 from pathlib import Path
-import cv2
+import hashlib
+
+# the libraries of the extractors (PyPDF2 , python-docx , python-pptx , pandas ,
+# markdown , bs4) are imported inside them , on the first file of that type
 
 
 def preprocess_dir(dir:os.path)-> os.path:
@@ -46,11 +43,12 @@ def prep_dir(directory):
 
 
 
-def get_meta(file_path: os.path) -> dict:
+def get_meta(file_path: os.path , create_time: int = None) -> dict:
     """
     Function to get meta data of file
     args:
         file_path: os.path
+        create_time: raw timestamp (seconds) if already known , e.g. from the scanner
     return
         dict
     """
@@ -58,22 +56,68 @@ def get_meta(file_path: os.path) -> dict:
     file_type = pathlib.Path(file_path).suffix
     folder_location = os.path.dirname(file_path)
 
-    if os.name == 'nt':#for windows
-        create_time = os.path.getctime(file_path)
-
-    else:
-        stat = os.stat(file_path)
-        create_time = stat.st_mtime
+    if create_time is None:
+        if os.name == 'nt':#for windows
+            create_time = os.path.getctime(file_path)
 
-    create_date = datetime.fromtimestamp(create_time).strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            stat = os.stat(file_path)
+            create_time = stat.st_mtime
 
     return {
         "file_name" : file_name,
         "file_type" : file_type,
         "file_path" : file_path,
-        "creation_date" : create_date
+        # raw unix timestamp , formatted only when displayed
+        "creation_date" : int(create_time)
     }
 
+def file_hash(file_path: os.path , chunk_size:int = 1 << 20) -> str:
+    """
+    Function to hash the content of a file
+    args:
+        file_path: os.path
+        chunk_size: bytes read at a time
+    return
+        hex digest (blake2b , 16 bytes)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path , 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def stored_file_hash(file_path: os.path) -> str:
+    """
+    Function to hash a large file which rarely changes (model weights) only once
+    The hash is kept in file_path + ".hash" with the size and mtime it was computed for ,
+    later calls read it from there until one of them changes.
+    args:
+        file_path: os.path
+    return
+        hex digest , the same as file_hash
+    """
+    stat = os.stat(file_path)
+    stamp = {"size" : stat.st_size , "mtime_ns" : stat.st_mtime_ns}
+    hash_path = str(file_path) + ".hash"
+    try:
+        with open(hash_path , "r") as file:
+            saved = json.load(file)
+        if {key : saved.get(key) for key in stamp} == stamp:
+            return saved["hash"]
+    except (OSError , ValueError , KeyError , AttributeError):
+        pass
+
+    digest = file_hash(file_path)
+    try:
+        with open(hash_path + ".tmp" , "w") as file:
+            json.dump({**stamp , "hash" : digest} , file)
+        os.replace(hash_path + ".tmp" , hash_path)
+    except OSError:
+        # read only directory , hashed again next time
+        pass
+    return digest
+
 def pdf_extractor(file_path: os.path) -> str:
     """
     extracts text from pdf
@@ -82,6 +126,8 @@ def pdf_extractor(file_path: os.path) -> str:
     Returns:
         text
     """ 
+    import PyPDF2
+
     with open(file_path , 'rb') as file:
         #pdf reader pointer
         reader = PyPDF2.PdfReader(file)
@@ -144,6 +190,8 @@ def text_extractor(file_path: os.path)->str:
 
 
 def docs_extractor(file_path: os.path) -> str:
+    from docx import Document
+
     doc = Document(file_path)
     txt = ''
     for para in tqdm(doc.paragraphs):
@@ -154,6 +202,8 @@ def docs_extractor(file_path: os.path) -> str:
     return txt
 
 def ppt_extractor(file_path: os.path) -> str:
+    from pptx import Presentation
+
     prs = Presentation(file_path)
 
     text = ""
@@ -166,6 +216,8 @@ def ppt_extractor(file_path: os.path) -> str:
 
 
 def excel_extractor(file_path: os.path) -> str:
+    import pandas as pd
+
     excel_file = pd.read_excel(file_path)
     
     text = ""
@@ -180,6 +232,9 @@ def excel_extractor(file_path: os.path) -> str:
   
 
 def markdown_extractor(file_path: os.path) -> str:
+    import markdown
+    from bs4 import BeautifulSoup
+
     with open(file_path ,  'r' , encoding='utf-8') as file:
         md_content = file.read()
 
@@ -193,3 +248,15 @@ def markdown_extractor(file_path: os.path) -> str:
 
 
         
+
+
+# extension -> content extractor for text based files
+content_extractor_func = {
+    "pdf" : pdf_extractor,
+    "txt" : text_extractor,
+    "docx" : docs_extractor,
+    "ppt" : ppt_extractor,
+    "xlsx" : excel_extractor,
+    "xls" : excel_extractor,
+    "md" : markdown_extractor
+}
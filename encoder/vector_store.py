@@ -0,0 +1,80 @@
+import os
+import threading
+
+import numpy as np
+
+
+class VectorStore:
+    """
+    Full precision (float32) copies of the vectors of one index , kept on disk for the
+    exact re-ranking of compressed (SQ8 / PQ) HNSW indexes.
+
+    Row n is the vector at position n of the index (the order of its id map) , rows are
+    appended as vectors are added and the file is memory mapped for reading , so a search
+    only pages in the rows of its candidates. Rows appended after the last save_state are
+    cut off by the next load (truncate) , compaction writes a new file and swaps it in ,
+    processes which still map the old one keep reading it.
+
+    file: headerless (n , dim) float32 , index/{type}_vectors.f32
+    """
+
+    def __init__(self , path:str , dim:int):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = dim * 4
+        self._lock = threading.RLock()
+        self._map = None
+
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // self.row_bytes
+
+    def append(self , vectors:np.ndarray):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or "." , exist_ok=True)
+            with open(self.path , "ab") as file:
+                file.write(np.ascontiguousarray(vectors , dtype="float32").tobytes())
+            # the map ends at the old size
+            self._map = None
+
+    def rows(self , positions:np.ndarray) -> np.ndarray:
+        """
+        returns:
+            (len(positions) , dim) float32 , the vectors at these index positions
+        """
+        with self._lock:
+            if self._map is None or len(self._map) < len(self):
+                self._map = np.memmap(self.path , dtype="float32" , mode="r").reshape(-1 , self.dim)
+            vectors = self._map
+        return vectors[positions]
+
+    def chunks(self , count:int , chunk_rows:int = 65536):
+        """
+        yields:
+            (start , (rows , dim) array) over the first count rows
+        """
+        for start in range(0 , count , chunk_rows):
+            yield start , self.rows(np.arange(start , min(start + chunk_rows , count)))
+
+    def truncate(self , count:int):
+        """
+        Function to drop the rows past count (appended after the index was saved)
+        """
+        with self._lock:
+            if len(self) > count:
+                with open(self.path , "r+b") as file:
+                    file.truncate(count * self.row_bytes)
+                self._map = None
+
+    def replace(self , vectors:np.ndarray):
+        """
+        Function to write a new file with these rows and swap it in (compaction / reset)
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or "." , exist_ok=True)
+            with open(self.path + ".tmp" , "wb") as file:
+                file.write(np.ascontiguousarray(vectors , dtype="float32").tobytes())
+            os.replace(self.path + ".tmp" , self.path)
+            self._map = None
@@ -0,0 +1,188 @@
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(query:str) -> str:
+    """
+    Function to normalize a query for cache lookups
+    Both tokenizers (MobileCLIP , uncased MobileBERT) lower case and split on whitespace ,
+    so queries differing only in case / spacing get the same type token and embedding.
+    """
+    return " ".join(query.split()).lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query -> (type_token , query_embed , image_prob)
+
+    Saves the MobileBERT + MobileCLIP passes for repeated queries. Entries are evicted
+    least recently used first once there are more than max_entries or they take more
+    than max_bytes. With a path the cache can be saved and loaded again on the next
+    start , entries written by other model versions are ignored then.
+    """
+
+    # rough per entry cost of the dict / tuple / key , on top of the embedding bytes
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self , max_entries:int = 1024 , max_bytes:int = 16 << 20 , path:str = None , model_version:str = ""):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.model_version = model_version
+
+        # normalized query -> (type_token , query_embed , image_prob)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def _size(self , query:str , entry:tuple) -> int:
+        return entry[1].nbytes + len(query) + self.ENTRY_OVERHEAD
+
+    def get(self , query:str):
+        """
+        returns:
+            tuple(type_token , query_embed , image_prob) or None , query_embed is read only
+        """
+        key = normalize_query(query)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self , query:str , type_token:str , query_embed:np.ndarray , image_prob:float = None):
+        key = normalize_query(query)
+        query_embed = np.array(query_embed , dtype="float32")
+        query_embed.flags.writeable = False
+        entry = (type_token , query_embed , image_prob)
+
+        if key in self.entries:
+            self.bytes -= self._size(key , self.entries.pop(key))
+        self.entries[key] = entry
+        self.bytes += self._size(key , entry)
+
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            old_key , old_entry = self.entries.popitem(last=False)
+            self.bytes -= self._size(old_key , old_entry)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries" : len(self.entries),
+            "bytes" : self.bytes,
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "hit_rate" : self.hits / lookups if lookups else 0.0
+        }
+
+    def save(self):
+        """
+        Function to write the cache to path (least recently used first) , written to a temp file first
+        """
+        if not self.path or not self.entries:
+            return
+        os.makedirs(os.path.dirname(self.path) or "." , exist_ok=True)
+        queries = list(self.entries)
+        temp_path = self.path + ".tmp"
+        with open(temp_path , "wb") as file:
+            np.savez(
+                file,
+                version=np.array(self.model_version),
+                queries=np.array(queries),
+                tokens=np.array([self.entries[q][0] for q in queries]),
+                # nan for entries without a router probability
+                probs=np.array([np.nan if self.entries[q][2] is None else self.entries[q][2] for q in queries] , dtype="float64"),
+                embeds=np.stack([self.entries[q][1].reshape(-1) for q in queries])
+            )
+        os.replace(temp_path , self.path)
+
+    def load(self) -> bool:
+        """
+        Function to fill the cache from path
+        returns:
+            True if entries of the current model version were loaded
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            saved = np.load(self.path)
+            if str(saved["version"]) != self.model_version:
+                return False
+            for query , token , embed , prob in zip(saved["queries"] , saved["tokens"] , saved["embeds"] , saved["probs"]):
+                self.put(str(query) , str(token) , embed.reshape(1 , -1) , None if np.isnan(prob) else float(prob))
+        except (OSError , ValueError , KeyError):
+            # unreadable / old format , start cold
+            self.clear()
+            return False
+        return True
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of whole search result lists
+
+    Keys are (normalized query , k , modality , filters). Every entry is tagged with the
+    index generation it was computed in (FAISSManager.generation) and is never served
+    for another generation , nor after ttl seconds.
+    """
+
+    def __init__(self , max_entries:int = 256 , ttl:float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # key -> (generation , expires_at , results)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def key(query:str , k:int , modality:str , filters:dict = None) -> tuple:
+        filters = tuple(sorted((name , tuple(value) if isinstance(value , (list , set , tuple)) else value)
+                               for name , value in (filters or {}).items()))
+        return (normalize_query(query) , k , modality , filters)
+
+    def get(self , key:tuple , generation:int):
+        """
+        returns:
+            copy of the cached result list , or None when missing / stale / expired
+        """
+        entry = self.entries.get(key)
+        if entry is not None and (entry[0] != generation or entry[1] < time.monotonic()):
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return [dict(result) for result in entry[2]]
+
+    def put(self , key:tuple , generation:int , results:list):
+        self.entries[key] = (generation , time.monotonic() + self.ttl , [dict(result) for result in results])
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries" : len(self.entries),
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "hit_rate" : self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,146 @@
+"""
+TEXT / IMAGE query router over the MobileCLIP query embedding.
+
+query_extractor computes the MobileCLIP text embedding of every query anyway , a
+logistic regression head on top of it replaces the MobileBERT forward pass (and keeps
+MobileBERT out of memory). Trained on the same dataset as query/fine_tune.py.
+
+train:
+    python -m query.clip_router --data query/data/multimodal_search_dataset.csv
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+
+ROUTER_PATH = "query/results/clip_router.npz"
+DATASET_PATH = "query/data/multimodal_search_dataset.csv"
+
+labeltoid = {0 : "TEXT" , 1 : "IMAGE"}
+id2label = {"TEXT" : 0 , "IMAGE" : 1}
+
+
+def load_dataset(path:str = DATASET_PATH) -> tuple:
+    """
+    Function to read the router dataset (columns: query , label)
+    returns:
+        tuple(queries:list[str] , labels:np.ndarray of 0 (TEXT) / 1 (IMAGE))
+    """
+    queries , labels = [] , []
+    with open(path , newline="" , encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            queries.append(row["query"])
+            labels.append(id2label[row["label"].strip().upper()])
+    return queries , np.array(labels , dtype="int64")
+
+def split_dataset(n:int , val_fraction:float = 0.2 , seed:int = 0) -> tuple:
+    """
+    Deterministic train / validation split , shared with query/router_compare.py
+    returns:
+        tuple(train indices , validation indices)
+    """
+    order = np.random.default_rng(seed).permutation(n)
+    n_val = int(n * val_fraction)
+    return np.sort(order[n_val:]) , np.sort(order[:n_val])
+
+
+class ClipRouter:
+    """
+    Logistic regression p(IMAGE | query embedding) = sigmoid(embedding @ weights + bias)
+    """
+
+    def __init__(self , weights:np.ndarray = None , bias:float = 0.0 , model_id:str = "" , threshold:float = 0.5):
+        self.weights = weights
+        self.bias = bias
+        # MobileCLIP weights the head was trained on , it is meaningless for other ones
+        self.model_id = model_id
+        self.threshold = threshold
+
+
+    def train(self , embeddings:np.ndarray , labels:np.ndarray , epochs:int = 500 , lr:float = 2.0 , l2:float = 1e-3):
+        """
+        Function to fit the head with full batch gradient descent
+        args:
+            embeddings (np.ndarray) : (n , dim) L2 normalized query embeddings
+            labels (np.ndarray) : n labels , 0 (TEXT) / 1 (IMAGE)
+        """
+        x = embeddings.astype("float64")
+        y = labels.astype("float64")
+        weights = np.zeros(x.shape[1])
+        bias = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+            error = p - y
+            weights -= lr * (x.T @ error / len(y) + l2 * weights)
+            bias -= lr * error.mean()
+        self.weights = weights.astype("float32")
+        self.bias = float(bias)
+        return self
+
+    def proba(self , query_embed:np.ndarray) -> np.ndarray:
+        """
+        returns:
+            p(IMAGE) per row of query_embed
+        """
+        logits = np.atleast_2d(query_embed) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def predict(self , query_embed:np.ndarray) -> str:
+        """
+        returns:
+            predicted token -> TEXT / IMAGE
+        """
+        return labeltoid[int(self.proba(query_embed)[0] >= self.threshold)]
+
+    def save(self , path:str = ROUTER_PATH):
+        os.makedirs(os.path.dirname(path) or "." , exist_ok=True)
+        np.savez(path , weights=self.weights , bias=self.bias , model_id=np.array(self.model_id) , threshold=self.threshold)
+
+    @classmethod
+    def load(cls , path:str = ROUTER_PATH):
+        """
+        returns:
+            ClipRouter , or None when no head was trained yet
+        """
+        if not os.path.exists(path):
+            return None
+        saved = np.load(path)
+        return cls(
+            weights=saved["weights"],
+            bias=float(saved["bias"]),
+            model_id=str(saved["model_id"]),
+            threshold=float(saved["threshold"])
+        )
+
+
+def embed_queries(queries:list , batch_size:int = 64) -> np.ndarray:
+    from encoder import embedding
+    return embedding.encode_texts(queries , batch_size=batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the CLIP space query router")
+    parser.add_argument("--data" , type=str , default=DATASET_PATH , help="CSV with query , label columns")
+    parser.add_argument("--out" , type=str , default=ROUTER_PATH)
+    parser.add_argument("--epochs" , type=int , default=500)
+    parser.add_argument("--lr" , type=float , default=2.0)
+    parser.add_argument("--l2" , type=float , default=1e-3)
+    parser.add_argument("--val-fraction" , type=float , default=0.2 , help="Held out for the reported accuracy")
+    args = parser.parse_args()
+
+    from encoder import embedding
+
+    queries , labels = load_dataset(args.data)
+    embeddings = embed_queries(queries)
+    train_idx , val_idx = split_dataset(len(queries) , args.val_fraction)
+
+    router = ClipRouter(model_id=embedding.model_id())
+    router.train(embeddings[train_idx] , labels[train_idx] , epochs=args.epochs , lr=args.lr , l2=args.l2)
+    if len(val_idx):
+        accuracy = ((router.proba(embeddings[val_idx]) >= router.threshold) == labels[val_idx]).mean()
+        print(f"validation accuracy: {accuracy:.4f} ({len(val_idx)} queries)")
+
+    # the validation queries stay unseen , query/router_compare.py measures on them
+    router.save(args.out)
+    print(f"router saved to {args.out}")
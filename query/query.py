@@ -23,12 +23,17 @@ os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 # Setting to -1 ensures CPU for TF operations here if any were accidentally used.
 os.environ['CUDA_VISIBLE_DEVICES'] = '-1' 
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
+logger = logging.getLogger(__name__)
 
 # Local imports
 try:
-    from encoder.embedding import text_extract # Assuming this works standalone
-    from encoder.faiss_base import FAISSManagerHNSW
+    from encoder import embedding
+    from encoder.faiss_base import make_faiss_manager
+    import encoder.config as config
     from query import utils # Assuming utils exists in query module/submodule
+    from query.cache import QueryEmbeddingCache, ResultCache
+    from query import tracing
+    from query.clip_router import ClipRouter
 except ImportError as e:
     print(f"Error importing local modules in query.py: {e}")
     # Handle case where run.py runs this vs running query.py standalone
@@ -36,8 +41,15 @@ except ImportError as e:
 # --- Globals ---
 # Use a default console, but allow passing one (from run.py)
 default_console = Console()
-faiss_manager = FAISSManagerHNSW(verbose=False) # Verbosity controlled by prints now
+faiss_manager = make_faiss_manager(verbose=False) # Verbosity controlled by prints now , HNSW or IVF-PQ (config.INDEX_BACKEND)
 faiss_init_flag = 0
+# query -> (type_token, query_embed, image_prob), created on first use by get_query_cache
+query_cache = None
+# TEXT / IMAGE head over the MobileCLIP query embedding, see get_clip_router
+clip_router = None
+clip_router_checked = False
+# (query, k, modality, filters) -> results of search_logic, tagged with faiss_manager.generation
+result_cache = ResultCache(max_entries=config.RESULT_CACHE_SIZE, ttl=config.RESULT_CACHE_TTL)
 
 # --- Initialization ---
 def faiss_init(console=default_console):
@@ -47,7 +59,8 @@ def faiss_init(console=default_console):
         console.print("[yellow]💾 Loading FAISS index and metadata...[/yellow]")
         try:
             start_time = time.time()
-            faiss_manager.load_state()
+            # memory mapped: pages fault in on demand and are shared with other query processes
+            faiss_manager.load_state(mmap=config.MMAP_INDEX)
             load_time = time.time() - start_time
             console.print(f"[green]✅ FAISS index loaded successfully in {load_time:.2f}s.[/green]")
             current_size = faiss_manager.current_size()
@@ -59,8 +72,106 @@ def faiss_init(console=default_console):
             console.print_exception(show_locals=False)
             raise # Re-raise to signal failure
 
+def warmup_models(console=default_console):
+    """
+    Loads MobileCLIP (+ MobileBERT unless the CLIP router is used) ahead of the first query (they load lazily otherwise).
+    Worth it for interactive sessions, a one-off --search just pays on first use.
+    """
+    start_time = time.time()
+    embedding.warmup()
+    # MobileBERT only stays out of memory when the CLIP router replaces it
+    if get_clip_router() is None:
+        utils.warmup()
+    get_query_cache()
+    console.print(f"[green]✅ Models loaded in {time.time() - start_time:.2f}s.[/green]")
+
+def get_clip_router():
+    """
+    Returns the CLIP space router when config.QUERY_ROUTER allows it and a head trained
+    for the loaded MobileCLIP weights exists (python -m query.clip_router), else None.
+    """
+    global clip_router, clip_router_checked
+    if not clip_router_checked:
+        clip_router_checked = True
+        if config.QUERY_ROUTER in ("clip", "auto"):
+            router = ClipRouter.load()
+            if router is not None and router.model_id == embedding.model_id():
+                clip_router = router
+            elif config.QUERY_ROUTER == "clip":
+                default_console.print("[yellow]Warning: no CLIP router trained for these weights, using MobileBERT.[/yellow]")
+    return clip_router
+
+def route_query(query: str, query_embed: np.ndarray) -> tuple:
+    """
+    Picks the index for a query: CLIP space head if available, MobileBERT otherwise.
+    Returns (type_token, p(IMAGE)).
+    """
+    router = get_clip_router()
+    if router is not None:
+        with tracing.span("classifier"):
+            image_prob = float(router.proba(query_embed)[0])
+        return ("IMAGE" if image_prob >= router.threshold else "TEXT"), image_prob
+    tensor_type, classify = utils.get_classifier()
+    with tracing.span("tokenize"):
+        inputs = utils.tokenize([query], tensor_type)
+    with tracing.span("classifier"):
+        image_prob = float(classify(inputs)[0, 1])
+    # argmax of MobileBERT's two class softmax, a tie goes to TEXT
+    return ("IMAGE" if image_prob > 0.5 else "TEXT"), image_prob
+
+def route_queries(queries: list, query_embeds: np.ndarray) -> tuple:
+    """Batched route_query: one router pass for every query. Returns (type_tokens, p(IMAGE) array)."""
+    router = get_clip_router()
+    if router is not None:
+        image_probs = router.proba(query_embeds)
+        return ["IMAGE" if p >= router.threshold else "TEXT" for p in image_probs], image_probs
+    image_probs = utils.index_probs(queries)
+    return ["IMAGE" if p > 0.5 else "TEXT" for p in image_probs], image_probs
+
+def use_fused(image_prob: float, fused: bool = None) -> bool:
+    """
+    Whether to search both indexes: when asked for (fused=True / config.FUSED_SEARCH),
+    or when the router is not confident (max(p, 1 - p) < config.FUSED_SEARCH_CONFIDENCE).
+    """
+    if fused is not None:
+        return fused
+    if config.FUSED_SEARCH:
+        return True
+    return image_prob is not None and max(image_prob, 1.0 - image_prob) < config.FUSED_SEARCH_CONFIDENCE
+
+def router_id() -> str:
+    router = get_clip_router()
+    return f"clip-{router.model_id}" if router is not None else f"mobilebert-{config.ROUTER_BACKEND}-{utils.model_id()}"
+
+def get_query_cache() -> QueryEmbeddingCache:
+    global query_cache
+    if query_cache is None:
+        path = config.QUERY_CACHE_PATH
+        # saved entries are only valid for the same MobileCLIP weights + router
+        version = f"{embedding.model_id()}|{router_id()}" if path else ""
+        query_cache = QueryEmbeddingCache(
+            max_entries=config.QUERY_CACHE_SIZE,
+            max_bytes=config.QUERY_CACHE_MAX_BYTES,
+            path=path,
+            model_version=version
+        )
+        query_cache.load()
+    return query_cache
+
+def save_query_cache():
+    """Writes the query cache to disk for the next start (no-op without QUERY_CACHE_PATH)."""
+    if query_cache is not None:
+        query_cache.save()
+
 # --- Query Processing ---
-def query_extractor(query: str, console=default_console, is_nested=False):
+def encode_query(query: str) -> np.ndarray:
+    """MobileCLIP embedding of one query, the tokenizer and the text encoder are traced separately."""
+    with tracing.span("tokenize"):
+        inputs = embedding.tokenize([query])
+    with tracing.span("text_encoder"):
+        return embedding.encode_tokens(inputs)
+
+def query_extractor(query: str, console=default_console, is_nested=False, with_prob=False):
     """
     Converts the query to embedding. Uses Rich status.
     
@@ -68,16 +179,27 @@ def query_extractor(query: str, console=default_console, is_nested=False):
         query (str): The search query.
         console (Console): Rich console instance for printing.
         is_nested (bool): If True, avoids creating a progress display when called from within another live display.
+        with_prob (bool): If True, also returns the router's p(IMAGE).
     """
+    cache = get_query_cache()
+    cached = cache.get(query)
+    hit = cached is not None and (cached[2] is not None or not with_prob)
+    tracing.cache("query_embedding", hit)
+    if hit:
+        if is_nested:
+            console.print("Query embedding taken from cache.")
+        return cached if with_prob else cached[:2]
+
+    # the embedding comes first, the CLIP router classifies it
     if is_nested:
         # Simple non-live version when being called from within another live display
-        console.print("Analyzing query type...")
-        type_token = utils.index_token(query=query)
-        console.print(f"Query type: [bold]{type_token}[/bold]")
-        
         console.print("Generating query embedding...")
-        query_embed = text_extract(query)
+        query_embed = encode_query(query)
         console.print("Query embedding generated.")
+
+        console.print("Analyzing query type...")
+        type_token, image_prob = route_query(query, query_embed)
+        console.print(f"Query type: [bold]{type_token}[/bold]")
     else:
         # Full version with rich progress for standalone use
         with Progress(
@@ -86,20 +208,50 @@ def query_extractor(query: str, console=default_console, is_nested=False):
             transient=True, # Spinner disappears after completion
             console=console
         ) as progress:
-            task = progress.add_task("Analyzing query type...", total=1)
-            # Assuming index_token is fast, no real progress needed here
-            type_token = utils.index_token(query=query) 
-            progress.update(task, completed=1, description=f"Query type: [bold]{type_token}[/bold]")
-            
             task = progress.add_task("Generating query embedding...", total=1)
-            # Assuming text_extract handles model loading internally if needed
-            query_embed = text_extract(query) 
+            # encode_query loads MobileCLIP on first use
+            query_embed = encode_query(query)
             progress.update(task, completed=1, description="Query embedding generated.")
 
+            task = progress.add_task("Analyzing query type...", total=1)
+            # Assuming the router is fast, no real progress needed here
+            type_token, image_prob = route_query(query, query_embed)
+            progress.update(task, completed=1, description=f"Query type: [bold]{type_token}[/bold]")
+
+    cache.put(query, type_token, query_embed, image_prob)
+    if with_prob:
+        return type_token, query_embed, image_prob
     return type_token, query_embed
 
+def query_extractor_batch(queries: list) -> list:
+    """
+    Batched query_extractor, NO PRINTING: cache misses are encoded in one MobileCLIP batch
+    and classified in one router pass. Returns (type_token, query_embed, image_prob) per query.
+    Inside tracing.batch_trace the tokenizers are timed as part of text_encoder / classifier.
+    """
+    cache = get_query_cache()
+    extracted = [cache.get(query) for query in queries]
+    missing = []
+    for n, entry in enumerate(extracted):
+        hit = entry is not None and entry[2] is not None
+        with tracing.query(n):
+            tracing.cache("query_embedding", hit)
+        if not hit:
+            missing.append(n)
+    if missing:
+        texts = [queries[n] for n in missing]
+        with tracing.span("text_encoder"):
+            query_embeds = embedding.encode_texts(texts, batch_size=config.TEXT_BATCH_SIZE)
+        with tracing.span("classifier"):
+            type_tokens, image_probs = route_queries(texts, query_embeds)
+        for n, type_token, query_embed, image_prob in zip(missing, type_tokens, query_embeds, image_probs):
+            query_embed = query_embed.reshape(1, -1)
+            cache.put(queries[n], type_token, query_embed, float(image_prob))
+            extracted[n] = (type_token, query_embed, float(image_prob))
+    return extracted
+
 # --- Search Execution ---
-def search(query: str, console=default_console, verbose=False, k: int = 5, is_nested=False):
+def search(query: str, console=default_console, verbose=False, k: int = config.SEARCH_K, is_nested=False, fused: bool = None):
     """
     Main function for search, using Rich for status and results.
     Args:
@@ -108,6 +260,7 @@ def search(query: str, console=default_console, verbose=False, k: int = 5, is_ne
         verbose (bool): Whether to show similarity scores.
         k (int): Number of results to retrieve.
         is_nested (bool): If True, avoids creating nested live displays.
+        fused (bool): Search both indexes and merge (None: only when the router is unsure).
     """
     global faiss_init_flag
     if faiss_init_flag == 0:
@@ -126,29 +279,36 @@ def search(query: str, console=default_console, verbose=False, k: int = 5, is_ne
     metadata = {}
     
     try:
-        # --- Get Query Embedding ---
-        # Pass the is_nested flag to avoid nested live displays
-        type_token, query_embed = query_extractor(query=query, console=console, is_nested=is_nested)
-
-        # --- Perform Search ---
-        description = f"Searching {type_token.lower()} index..."
-        search_func = None
-        if type_token == "TEXT":
-            search_func = faiss_manager.search_text
-        elif type_token == "IMAGE":
-            search_func = faiss_manager.search_image
-        else:
-             console.print(f"[bold red]Error:[/bold red] Invalid query type token '{type_token}' generated.")
-             return
+        with tracing.trace(query) as query_trace:
+            # --- Get Query Embedding ---
+            # Pass the is_nested flag to avoid nested live displays
+            type_token, query_embed, image_prob = query_extractor(query=query, console=console, is_nested=is_nested, with_prob=True)
 
-        # If we're nested, just print status rather than using a status display
-        if is_nested:
-            console.print(f"[bold yellow]{description}[/bold yellow]")
-            dist, indice, metadata = search_func(query_embed=query_embed)
-        else:
-            # We can use a status spinner if we're not nested
-            with console.status(f"[bold yellow]{description}[/bold yellow]", spinner="earth"):
+            # --- Perform Search ---
+            description = f"Searching {type_token.lower()} index..."
+            search_func = None
+            # seconds of the FAISS search / metadata reads, for the trace
+            timings = {}
+            if use_fused(image_prob, fused):
+                description = f"Searching text + image indexes (p(image) = {image_prob:.2f})..."
+                search_func = lambda query_embed: faiss_manager.search_fused(query_embed=query_embed, k=k, image_weight=image_prob, timings=timings)
+            elif type_token == "TEXT":
+                search_func = lambda query_embed: faiss_manager.search_text(query_embed=query_embed, k=k, timings=timings)
+            elif type_token == "IMAGE":
+                search_func = lambda query_embed: faiss_manager.search_image(query_embed=query_embed, k=k, timings=timings)
+            else:
+                 console.print(f"[bold red]Error:[/bold red] Invalid query type token '{type_token}' generated.")
+                 return
+
+            # If we're nested, just print status rather than using a status display
+            if is_nested:
+                console.print(f"[bold yellow]{description}[/bold yellow]")
                 dist, indice, metadata = search_func(query_embed=query_embed)
+            else:
+                # We can use a status spinner if we're not nested
+                with console.status(f"[bold yellow]{description}[/bold yellow]", spinner="earth"):
+                    dist, indice, metadata = search_func(query_embed=query_embed)
+            tracing.add_timings(timings)
             
     except Exception as e:
         console.print(f"[bold red]❌ Error during search execution:[/bold red]")
@@ -201,24 +361,124 @@ def search(query: str, console=default_console, verbose=False, k: int = 5, is_ne
 
         console.print(table)
 
+    if verbose:
+        stages = query_trace.stages
+        breakdown = " · ".join(f"{stage} {stages[stage]:.1f}ms" for stage in tracing.STAGES if stage in stages)
+        caches = ", ".join(f"{name} {outcome}" for name, outcome in query_trace.cache.items())
+        console.print(f"[dim]⏱️ {breakdown} ({caches})[/dim]")
+
+def print_query_stats(console=default_console):
+    """Prints p50/p95/p99 per stage over the recent queries (the stats command of run.py)."""
+    summary = tracing.query_stats.summary()
+    if not summary["window"]:
+        console.print("[yellow]No queries traced yet.[/yellow]")
+        return
+
+    table = Table(title=f"Query latency, last {summary['window']} of {summary['queries']} queries",
+                  show_header=True, header_style="bold magenta", border_style="blue")
+    table.add_column("Stage", style="bold")
+    for column in ("Count", "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)"):
+        table.add_column(column, justify="right")
+    for stage, values in summary["stages"].items():
+        table.add_row(stage, str(values["count"]), f"{values['mean_ms']:.2f}", f"{values['p50_ms']:.2f}",
+                      f"{values['p95_ms']:.2f}", f"{values['p99_ms']:.2f}")
+    console.print(table)
+    for name, values in summary["cache"].items():
+        console.print(f"  {name} cache: [cyan]{values['hits']}[/cyan] hits, [cyan]{values['misses']}[/cyan] misses "
+                      f"({values['hit_rate']:.0%})")
+    if summary["errors"]:
+        console.print(f"  Failed queries: [red]{summary['errors']}[/red]")
+
 
-def search_logic(query: str, k: int = 10) -> list: # Note: RETURN type
+def matches_filters(meta: dict, filters: dict) -> bool:
+    """
+    Checks the metadata of a hit against search_logic filters:
+        file_type -> extension or list of extensions (".pdf")
+        folder -> path prefix
+        created_after / created_before -> unix timestamps
+    """
+    if not filters:
+        return True
+    file_type = filters.get("file_type")
+    if file_type is not None:
+        allowed = {file_type} if isinstance(file_type, str) else set(file_type)
+        if meta.get("file_type", "").lower() not in {t.lower() for t in allowed}:
+            return False
+    folder = filters.get("folder")
+    if folder is not None and not meta.get("file_path", "").startswith(os.path.join(folder, "")):
+        return False
+    created = meta.get("creation_date")
+    if filters.get("created_after") is not None and (created is None or created < filters["created_after"]):
+        return False
+    if filters.get("created_before") is not None and (created is None or created > filters["created_before"]):
+        return False
+    return True
+
+def search_logic(query: str, k: int = 10, filters: dict = None, modality: str = None, fused: bool = None,
+                 with_trace: bool = False): # Note: RETURN type
     """
     Performs search and returns structured results. NO PRINTING.
+    Args:
+        filters (dict): optional metadata filters, see matches_filters
+        modality (str): "TEXT" / "IMAGE" to skip the intent classifier's choice
+        fused (bool): search both indexes and merge the hits, weighted by the router's p(IMAGE).
+            None fuses only when the router is unsure (see use_fused), a modality disables it.
+        with_trace (bool): return (results, trace) , trace = per stage milliseconds + cache outcomes
+            (see query/tracing.py) , every query is also added to tracing.query_stats
+    Result lists are cached until the index changes (faiss_manager.generation) or RESULT_CACHE_TTL passes.
     """
-    # ... (faiss_init check if needed) ...
-    start_time = time.time()
+    with tracing.trace(query) as query_trace:
+        results_list = _search_logic(query, k, filters, modality, fused)
+    if with_trace:
+        return results_list, query_trace.to_dict()
+    return results_list
 
-    # ... query_extractor logic ...
-    type_token, query_embed = query_extractor(query) # Assume this works
+def _search_logic(query: str, k: int, filters: dict, modality: str, fused: bool) -> list:
+    type_token, query_embed, image_prob = query_extractor(query, with_prob=True)
+    if modality:
+        type_token = modality
+    elif use_fused(image_prob, fused):
+        type_token = "FUSED"
 
-    results_list = []
-    if type_token == "TEXT":
-        distances, indices, metadata = faiss_manager.search_text(query_embed=query_embed, k=k)
+    # read before searching, results of a search racing an index change are cached as stale
+    generation = faiss_manager.generation
+    cache_key, cached = _cached_results(query, k, type_token, filters, generation)
+    if cached is not None:
+        return cached
+
+    # hits removed by the filters are replaced from a deeper search
+    search_k = k * config.FILTER_OVERFETCH if filters else k
+    timings = {}
+    if type_token == "FUSED":
+        distances, indices, metadata = faiss_manager.search_fused(query_embed=query_embed, k=search_k, image_weight=image_prob, timings=timings)
+    elif type_token == "TEXT":
+        distances, indices, metadata = faiss_manager.search_text(query_embed=query_embed, k=search_k, timings=timings)
     elif type_token == "IMAGE":
-        distances, indices, metadata = faiss_manager.search_image(query_embed=query_embed, k=k)
+        distances, indices, metadata = faiss_manager.search_image(query_embed=query_embed, k=search_k, timings=timings)
     else:
         raise ValueError(f"Invalid token type: {type_token}")
+    tracing.add_timings(timings)
+
+    results_list = build_results(distances, indices, metadata, type_token, k, filters)
+    result_cache.put(cache_key, generation, results_list)
+    return results_list
+
+def _cached_results(query: str, k: int, type_token: str, filters: dict, generation: int) -> tuple:
+    """
+    Result cache lookup of search_logic / search_logic_batch, the outcome goes to the running trace.
+    Returns (cache_key, cached result list or None).
+    """
+    cache_key = ResultCache.key(query, k, type_token, filters)
+    cached = result_cache.get(cache_key, generation)
+    tracing.cache("results", cached is not None)
+    return cache_key, cached
+
+def build_results(distances, indices, metadata: dict, type_token: str, k: int, filters: dict = None) -> list:
+    """Applies the filters to the raw hits of one query and turns the first k into search_logic result dicts."""
+    results_list = []
+    if filters and indices is not None:
+        keep = [i for i, faiss_id in enumerate(indices) if matches_filters(metadata.get(str(faiss_id), {}), filters)][:k]
+        distances, indices = distances[keep], indices[keep]
 
     # Check if indices is not None and has elements
     if indices is not None and indices.size > 0:
@@ -233,11 +493,11 @@ def search_logic(query: str, k: int = 10) -> list: # Note: RETURN type
                     "score": float(dist), # Ensure score is float
                     "name": result_meta.get("file_name", "N/A"),
                     "path": result_meta.get("file_path", "N/A"),
+                    "type": result_meta.get("type", type_token.lower()),
                     "id": int(faiss_id) # Store original ID if needed
                 })
             except Exception as e:
-                 # Log this error if possible, maybe return partial results
-                 print(f"Error processing metadata for ID {faiss_id}: {e}") # Temp print for debug
+                 logger.debug("Error processing metadata for ID %s: %s", faiss_id, e)
                  results_list.append({
                      "rank": i + 1,
                      "score": float(dist),
@@ -245,18 +505,74 @@ def search_logic(query: str, k: int = 10) -> list: # Note: RETURN type
                      "path": "N/A",
                      "id": int(faiss_id)
                  })
-
-    duration = time.time() - start_time
-    # Return the list and maybe duration/other info if needed by caller
-    # The TUI worker will handle adding the duration message
     return results_list
 
+def search_logic_batch(queries: list, k: int = 10, filters: dict = None, fused: bool = None,
+                       with_trace: bool = False) -> list:
+    """
+    Batched search_logic for scripted workloads, NO PRINTING.
+    All queries are encoded in one MobileCLIP batch and classified in one router pass, then
+    grouped by modality with one (nq, 512) index.search per index (fused queries join both).
+    Returns one result list per query, same schema (and result cache) as search_logic.
+    with_trace (bool): return (results, traces), one trace per query. Every query is added to
+        tracing.query_stats, the stages run for the whole batch count an even share per query.
+    """
+    with tracing.batch_trace(queries) as batch:
+        results = _search_logic_batch(queries, k, filters, fused)
+    if with_trace:
+        return results, [query_trace.to_dict() for query_trace in batch.traces]
+    return results
+
+def _search_logic_batch(queries: list, k: int, filters: dict, fused: bool) -> list:
+    extracted = query_extractor_batch(queries)
+    generation = faiss_manager.generation
+    search_k = k * config.FILTER_OVERFETCH if filters else k
+
+    results = [None] * len(queries)
+    type_tokens = {}
+    cache_keys = {}
+    groups = {"text": [], "image": []}
+    for n, (query, (type_token, query_embed, image_prob)) in enumerate(zip(queries, extracted)):
+        if use_fused(image_prob, fused):
+            type_token = "FUSED"
+        type_tokens[n] = type_token
+        with tracing.query(n):
+            cache_keys[n], cached = _cached_results(query, k, type_token, filters, generation)
+        if cached is not None:
+            results[n] = cached
+            continue
+        if type_token in ("TEXT", "FUSED"):
+            groups["text"].append(n)
+        if type_token in ("IMAGE", "FUSED"):
+            groups["image"].append(n)
+
+    # query position -> type -> (distance, indices, metadatas)
+    hits = {}
+    timings = {}
+    for type, members in groups.items():
+        if not members:
+            continue
+        query_embeds = np.vstack([extracted[n][1] for n in members])
+        for n, hit in zip(members, faiss_manager.search_batch(type, query_embeds, search_k, timings=timings)):
+            hits.setdefault(n, {})[type] = hit
+    tracing.add_timings(timings)
+
+    for n, by_type in hits.items():
+        type_token = type_tokens[n]
+        if type_token == "FUSED":
+            distances, indices, metadata = faiss_manager.fuse(by_type, search_k, extracted[n][2])
+        else:
+            distances, indices, metadata = by_type[type_token.lower()]
+        results[n] = build_results(distances, indices, metadata, type_token, k, filters)
+        result_cache.put(cache_keys[n], generation, results[n])
+    return results
+
 # --- Standalone Execution (for CLI use of query.py directly) ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="CLI Search Tool")
     parser.add_argument("--search", type=str, required=True, help="Your search query")
     parser.add_argument("--verbose", action="store_true", help="Show similarity scores")
-    parser.add_argument("-k", type=int, default=5, help="Number of results to return")
+    parser.add_argument("-k", type=int, default=config.SEARCH_K, help="Number of results to return")
     args = parser.parse_args()
 
     standalone_console = Console() # Use a separate console for standalone mode
@@ -264,6 +580,7 @@ if __name__ == "__main__":
     try:
         faiss_init(console=standalone_console) # Initialize FAISS
         search(args.search, console=standalone_console, verbose=args.verbose, k=args.k) # Perform search
+        save_query_cache()
     except Exception as e:
         standalone_console.print("[bold red]An error occurred during standalone execution:[/bold red]")
         standalone_console.print_exception(show_locals=False)
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Benchmark of the MobileBERT query router variants on the labelled CSV.
+
+variants:
+    fp32_padded  -> every query padded to 128 tokens (the original index_token)
+    fp32         -> dynamic padding
+    int8         -> dynamic padding + dynamic int8 quantization of the linear layers
+    onnx         -> dynamic padding + ONNX Runtime on CPU (skipped without onnxruntime)
+
+For each: accuracy on the CSV , single query latency (p50 / p99 , the interactive
+case) , batched throughput of index_tokens and the time to build the classifier.
+
+usage:
+    python -m query.router_bench --data query/data/multimodal_search_dataset.csv --out router_bench.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from query import utils
+from query.clip_router import DATASET_PATH, load_dataset
+
+VARIANTS = {
+    "fp32_padded": ("fp32", "max_length"),
+    "fp32": ("fp32", "longest"),
+    "int8": ("int8", "longest"),
+    "onnx": ("onnx", "longest"),
+}
+
+
+def percentile_ms(timings: list, q: float) -> float:
+    return float(np.percentile(timings, q) * 1000)
+
+
+def bench_variant(backend: str, padding: str, queries: list, labels: np.ndarray, limit: int, batch_size: int) -> dict:
+    start = time.perf_counter()
+    utils.get_classifier(backend)
+    build_s = time.perf_counter() - start
+
+    # warm up , the first passes allocate
+    utils.index_probs(queries[:batch_size], batch_size=batch_size, backend=backend, padding=padding)
+
+    timings = []
+    for query in queries[:limit]:
+        start = time.perf_counter()
+        utils.index_probs([query], backend=backend, padding=padding)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    probs = utils.index_probs(queries, batch_size=batch_size, backend=backend, padding=padding)
+    batched_s = time.perf_counter() - start
+
+    return {
+        "accuracy": float(np.mean((probs > 0.5).astype("int64") == labels)),
+        "build_s": build_s,
+        "single_p50_ms": percentile_ms(timings, 50),
+        "single_p99_ms": percentile_ms(timings, 99),
+        "batched_queries_per_s": len(queries) / batched_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MobileBERT router variants: accuracy and latency")
+    parser.add_argument("--data", type=str, default=DATASET_PATH, help="CSV with query , label columns")
+    parser.add_argument("--limit", type=int, default=300, help="Queries timed one by one per variant")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--variants", type=str, default=",".join(VARIANTS))
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    queries, labels = load_dataset(args.data)
+    report = {"queries": len(queries)}
+    for name in args.variants.split(","):
+        backend, padding = VARIANTS[name]
+        if backend == "onnx":
+            try:
+                import onnxruntime
+            except ImportError:
+                report[name] = "skipped (onnxruntime not installed)"
+                continue
+        report[name] = bench_variant(backend, padding, queries, labels, args.limit, args.batch_size)
+        print(name, json.dumps(report[name]))
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Accuracy + latency comparison of the two query routers:
+    MobileBERT (query.utils.index_token) vs the CLIP space head (query.clip_router)
+
+Accuracy is measured on the validation split query.clip_router held out while training
+the head. MobileBERT was fine tuned on the whole dataset , so its numbers there are an
+upper bound. Latency is per query on CPU , the MobileCLIP text embedding is timed on its
+own since search needs it with either router.
+
+usage:
+    python -m query.router_compare --data query/data/multimodal_search_dataset.csv --out router.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from query import clip_router
+
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def timed(func, inputs) -> tuple:
+    """
+    returns:
+        tuple(outputs , per input seconds)
+    """
+    outputs , timings = [] , []
+    for item in inputs:
+        start = time.perf_counter()
+        outputs.append(func(item))
+        timings.append(time.perf_counter() - start)
+    return outputs , timings
+
+
+def summarize(timings: list) -> dict:
+    ordered = sorted(timings)
+    return {
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MobileBERT vs CLIP head query routing")
+    parser.add_argument("--data", type=str, default=clip_router.DATASET_PATH)
+    parser.add_argument("--router", type=str, default=clip_router.ROUTER_PATH)
+    parser.add_argument("--val-fraction", type=float, default=0.2, help="Must match the value used for training")
+    parser.add_argument("--limit", type=int, default=500, help="Max validation queries timed")
+    parser.add_argument("--out", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    from encoder import embedding
+    from query import utils
+
+    router = clip_router.ClipRouter.load(args.router)
+    if router is None:
+        parser.error(f"no router at {args.router} , train one with python -m query.clip_router")
+
+    queries, labels = clip_router.load_dataset(args.data)
+    _, val_idx = clip_router.split_dataset(len(queries), args.val_fraction)
+    val_idx = val_idx[:args.limit]
+    val_queries = [queries[i] for i in val_idx]
+    val_labels = labels[val_idx]
+
+    # MobileCLIP is needed by search either way , load it before measuring memory
+    embedding.warmup()
+    embeds, embed_times = timed(embedding.text_extract, val_queries)
+
+    clip_tokens, clip_times = timed(router.predict, embeds)
+
+    before = rss_kb()
+    utils.warmup()
+    after = rss_kb()
+    bert_tokens, bert_times = timed(lambda query: utils.index_token(query=query), val_queries)
+
+    def accuracy(tokens):
+        return float(np.mean([clip_router.id2label[token] == label for token, label in zip(tokens, val_labels)]))
+
+    report = {
+        "queries": len(val_queries),
+        "clip_embedding": summarize(embed_times),
+        "mobilebert": {
+            "accuracy": accuracy(bert_tokens),
+            "latency": summarize(bert_times),
+            "rss_kb": after - before if before is not None and after is not None else None,
+        },
+        "clip_head": {
+            "accuracy": accuracy(clip_tokens),
+            "latency": summarize(clip_times),
+            "params": int(router.weights.size + 1),
+        },
+        # per query routing + embedding , what query_extractor pays with each router
+        "query_path_ms": {
+            "mobilebert": (statistics.mean(bert_times) + statistics.mean(embed_times)) * 1000,
+            "clip_head": (statistics.mean(clip_times) + statistics.mean(embed_times)) * 1000,
+        },
+        "agreement": float(np.mean([a == b for a, b in zip(bert_tokens, clip_tokens)])),
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w+") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
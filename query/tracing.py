@@ -0,0 +1,243 @@
+"""
+Per query tracing
+
+search / search_logic run every query inside trace(query). The stages it passes add
+their time with span(stage) (or add_timings) and the caches their outcome with cache().
+Finished traces go into a rolling window (query_stats) which reports p50 / p95 / p99
+per stage , shown by the stats command of run.py. Outside of a trace span() is a no-op.
+
+search_logic_batch runs its queries inside batch_trace(queries) instead. Stages timed for
+the whole batch (one encoder pass , one index.search for many queries) are split evenly
+over the queries , per query outcomes go to their own trace with query(n).
+
+stages (ms):
+    tokenize      -> MobileCLIP + MobileBERT tokenizers
+    text_encoder  -> MobileCLIP text encoder
+    classifier    -> TEXT / IMAGE router (MobileBERT forward pass or CLIP head)
+    faiss_search  -> index.search
+    metadata      -> metadata rows of the hits
+    total         -> the whole query , including what no stage covers
+"""
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+STAGES = ("tokenize" , "text_encoder" , "classifier" , "faiss_search" , "metadata" , "total")
+
+# trace of the query running in this thread / task , None outside of trace()
+_current = contextvars.ContextVar("query_trace" , default=None)
+
+
+class QueryTrace:
+    """
+    Stage timings and cache outcomes of one query
+    """
+
+    def __init__(self , query:str):
+        self.query = query
+        # stage -> milliseconds
+        self.stages = {}
+        # cache -> "hit" / "miss"
+        self.cache = {}
+        self.error = None
+        self.start = time.perf_counter()
+
+
+    def add(self , stage:str , seconds:float):
+        self.stages[stage] = self.stages.get(stage , 0.0) + seconds * 1000
+
+    def finish(self):
+        self.stages["total"] = (time.perf_counter() - self.start) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "query" : self.query,
+            "stages_ms" : dict(self.stages),
+            "cache" : dict(self.cache),
+            "error" : self.error
+        }
+
+
+class BatchTrace(QueryTrace):
+    """
+    Shared stage timings of a batch of queries and one QueryTrace per query (traces)
+    """
+
+    def __init__(self , queries:list):
+        super().__init__(None)
+        self.traces = [QueryTrace(query) for query in queries]
+
+
+    def finish(self):
+        """
+        Gives every query trace an even share of the batch stages and total
+        """
+        super().finish()
+        share = 1.0 / len(self.traces) if self.traces else 0.0
+        for query_trace in self.traces:
+            for stage , ms in self.stages.items():
+                query_trace.stages[stage] = query_trace.stages.get(stage , 0.0) + ms * share
+            query_trace.error = query_trace.error or self.error
+
+
+class _Span:
+    __slots__ = ("trace" , "stage" , "start")
+
+    def __init__(self , trace:QueryTrace , stage:str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self , exc_type , exc , tb):
+        self.trace.add(self.stage , time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self , exc_type , exc , tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+
+def current():
+    """
+    returns:
+        QueryTrace of the running query or None
+    """
+    return _current.get()
+
+def span(stage:str):
+    """
+    with span("classifier"): ... , adds the time to the running trace
+    """
+    trace = _current.get()
+    if trace is None:
+        return NULL_SPAN
+    return _Span(trace , stage)
+
+def add_timings(timings:dict):
+    """
+    Adds stage -> seconds measured elsewhere (e.g. by FAISSManager.search_text(timings=...))
+    """
+    trace = _current.get()
+    if trace is not None:
+        for stage , seconds in timings.items():
+            trace.add(stage , seconds)
+
+def cache(name:str , hit:bool):
+    trace = _current.get()
+    if trace is not None:
+        trace.cache[name] = "hit" if hit else "miss"
+
+@contextmanager
+def query(n:int):
+    """
+    with query(n): ... , inside batch_trace makes the trace of query n the running one (no-op outside)
+    """
+    trace = _current.get()
+    if not isinstance(trace , BatchTrace):
+        yield
+        return
+    token = _current.set(trace.traces[n])
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class QueryStats:
+    """
+    Rolling window of the last `window` query traces
+    """
+
+    def __init__(self , window:int = 1000):
+        self.traces = deque(maxlen=window)
+        self.count = 0
+
+
+    def add(self , trace:QueryTrace):
+        self.traces.append(trace.to_dict())
+        self.count += 1
+
+    def clear(self):
+        self.traces.clear()
+
+    def summary(self) -> dict:
+        """
+        returns:
+            dict(queries , window , stages -> {count , mean_ms , p50_ms , p95_ms , p99_ms} , cache -> {hits , misses , hit_rate})
+        """
+        traces = list(self.traces)
+        stages = {}
+        for stage in STAGES:
+            values = [t["stages_ms"][stage] for t in traces if stage in t["stages_ms"]]
+            if values:
+                p50 , p95 , p99 = np.percentile(values , [50 , 95 , 99])
+                stages[stage] = {"count" : len(values) , "mean_ms" : float(np.mean(values)) ,
+                                 "p50_ms" : float(p50) , "p95_ms" : float(p95) , "p99_ms" : float(p99)}
+        caches = {}
+        for t in traces:
+            for name , outcome in t["cache"].items():
+                entry = caches.setdefault(name , {"hits" : 0 , "misses" : 0})
+                entry["hits" if outcome == "hit" else "misses"] += 1
+        for entry in caches.values():
+            entry["hit_rate"] = entry["hits"] / (entry["hits"] + entry["misses"])
+        return {
+            "queries" : self.count,
+            "window" : len(traces),
+            "errors" : sum(1 for t in traces if t["error"]),
+            "stages" : stages,
+            "cache" : caches
+        }
+
+
+# traces of this process , see QueryStats
+query_stats = QueryStats()
+
+
+@contextmanager
+def trace(query:str , stats:QueryStats = None):
+    """
+    with trace(query) as query_trace: ... , records the finished trace in stats (query_stats)
+    """
+    query_trace = QueryTrace(query)
+    token = _current.set(query_trace)
+    try:
+        yield query_trace
+    except Exception as e:
+        query_trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        query_trace.finish()
+        (stats if stats is not None else query_stats).add(query_trace)
+
+@contextmanager
+def batch_trace(queries:list , stats:QueryStats = None):
+    """
+    with batch_trace(queries) as batch: ... , like trace , records one trace per query in stats (query_stats)
+    """
+    batch = BatchTrace(queries)
+    token = _current.set(batch)
+    try:
+        yield batch
+    except Exception as e:
+        batch.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        batch.finish()
+        for query_trace in batch.traces:
+            (stats if stats is not None else query_stats).add(query_trace)
@@ -1,16 +1,195 @@
-from transformers import AutoTokenizer , MobileBertForSequenceClassification
-import torch
+import numpy as np
 from tqdm import tqdm
 import threading
 import time
+import os
+
+import encoder.config as config
+from encoder.utils import stored_file_hash
 
 save_directory = "query/results/saved_model"
-# Load the saved model and tokenizer
-model = MobileBertForSequenceClassification.from_pretrained(save_directory)
-tokenizer = AutoTokenizer.from_pretrained(save_directory)
-model.eval()
+onnx_path = "query/results/onnx/mobilebert.onnx"
+# the saved model and tokenizer , loaded on first use by get_model / get_tokenizer
+model = None
+tokenizer = None
+# backend -> (tensor type , classify function) , built on first use by get_classifier
+_classifiers = {}
+_model_lock = threading.RLock()
 
 labeltoid = {0 : "TEXT" , 1 : "IMAGE"}
+_model_id = None
+
+BACKENDS = ("fp32" , "int8" , "onnx")
+
+
+def get_tokenizer():
+    global tokenizer
+    if tokenizer is None:
+        with _model_lock:
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(save_directory)
+    return tokenizer
+
+def get_model():
+    """
+    Function to load the fine tuned MobileBERT (once , on first use)
+    returns:
+        tuple(model , tokenizer)
+    """
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                from transformers import MobileBertForSequenceClassification
+                loaded = MobileBertForSequenceClassification.from_pretrained(save_directory)
+                loaded.eval()
+                model = loaded
+    return (model , get_tokenizer())
+
+def export_onnx(path:str = onnx_path) -> str:
+    """
+    Function to export the classifier to ONNX (once) , batch and sequence length stay dynamic
+    returns:
+        path of the .onnx file
+    """
+    if os.path.exists(path):
+        return path
+    import torch
+    model , tokenizer = get_model()
+    os.makedirs(os.path.dirname(path) , exist_ok=True)
+    sample = tokenizer(["export sample"] , return_tensors="pt")
+    names = ["input_ids" , "attention_mask" , "token_type_ids"]
+    dynamic_axes = {name : {0 : "batch" , 1 : "sequence"} for name in names}
+    dynamic_axes["logits"] = {0 : "batch"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            path,
+            input_names=names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    return path
+
+def _build_classifier(backend:str):
+    if backend == "onnx":
+        try:
+            import onnxruntime
+        except ImportError:
+            print("onnxruntime is not installed , using the fp32 MobileBERT router instead")
+            return get_classifier("fp32")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = onnxruntime.InferenceSession(export_onnx() , options , providers=["CPUExecutionProvider"])
+        input_names = [i.name for i in session.get_inputs()]
+
+        def classify(inputs) -> np.ndarray:
+            logits = session.run(["logits"] , {name : inputs[name].astype("int64") for name in input_names})[0]
+            logits = logits - logits.max(axis=-1 , keepdims=True)
+            probs = np.exp(logits)
+            return probs / probs.sum(axis=-1 , keepdims=True)
+        return ("np" , classify)
+
+    import torch
+    classifier , _ = get_model()
+    if backend == "int8":
+        # weights of the linear layers in int8 , activations quantized on the fly
+        classifier = torch.ao.quantization.quantize_dynamic(classifier , {torch.nn.Linear} , dtype=torch.qint8)
+    elif backend != "fp32":
+        raise ValueError(f"Unknown router backend {backend} , expected one of {BACKENDS}")
+
+    def classify(inputs) -> np.ndarray:
+        with torch.no_grad():
+            return torch.nn.functional.softmax(classifier(**inputs).logits , dim=-1).numpy()
+    return ("pt" , classify)
+
+def get_classifier(backend:str = None):
+    """
+    Function to build the MobileBERT classifier of a backend (once , on first use)
+    args:
+        backend (str) : "fp32" , "int8" (dynamic quantization of the linear layers) or
+            "onnx" (ONNX Runtime on CPU) , config.ROUTER_BACKEND by default
+    returns:
+        tuple(tensor type for the tokenizer , classify(inputs) -> (n , 2) probabilities)
+    """
+    backend = backend or config.ROUTER_BACKEND
+    if backend not in _classifiers:
+        with _model_lock:
+            if backend not in _classifiers:
+                _classifiers[backend] = _build_classifier(backend)
+    return _classifiers[backend]
+
+def model_id() -> str:
+    """
+    Function to identify the saved model (hash of its files , stored next to each one , see
+    stored_file_hash) , e.g. for caches of its predictions
+    """
+    global _model_id
+    if _model_id is None:
+        names = sorted(os.listdir(save_directory))
+        # the .hash files written by stored_file_hash are not part of the model
+        _model_id = "-".join(stored_file_hash(os.path.join(save_directory , name))[:8] for name in names
+                             if os.path.isfile(os.path.join(save_directory , name)) and not name.endswith((".hash" , ".tmp")))
+    return _model_id
+
+def warmup():
+    """
+    Function to load the model and classify one query , so the first search does not pay for it
+    """
+    index_token(query="warmup")
+
+def index_probs(queries:list , batch_size:int = 32 , backend:str = None , padding:str = "longest") -> np.ndarray:
+    """
+    Function to get p(IMAGE) of many queries
+    Queries are sorted by length and padded per batch only up to its longest query
+    (most queries are a few tokens , padding all of them to 128 wastes most of the pass).
+
+    args:
+        queries (list) => user queries in normal format
+        batch_size (int) => queries per forward pass
+        backend (str) => see get_classifier
+        padding (str) => "longest" (dynamic) or "max_length" (pad to 128 , the old behaviour)
+    returns:
+        np.ndarray of p(IMAGE) , in the order of queries
+    """
+    tensor_type , classify = get_classifier(backend)
+
+    order = sorted(range(len(queries)) , key=lambda i: len(queries[i]))
+    probs = np.empty(len(queries) , dtype="float32")
+    for start in range(0 , len(order) , batch_size):
+        batch = order[start : start + batch_size]
+        inputs = tokenize([queries[i] for i in batch] , tensor_type , padding=padding)
+        probs[batch] = classify(inputs)[: , 1]
+    return probs
+
+def tokenize(queries:list , tensor_type:str , padding:str = "longest"):
+    """
+    Function to run the MobileBERT tokenizer on a batch of queries
+    args:
+        tensor_type (str) => first item of get_classifier()
+    """
+    return get_tokenizer()(queries ,
+                           truncation=True ,
+                           padding=padding ,
+                           max_length=128 ,
+                           return_tensors=tensor_type
+                           )
+
+def index_tokens(queries:list , batch_size:int = 32 , backend:str = None) -> list:
+    """
+    Batched index_token
+
+    args:
+        queries (list) => user queries in normal format
+    returns:
+        list of predicted tokens -> TEXT / IMAGE
+    """
+    # argmax of the two class softmax , a tie goes to TEXT
+    return [labeltoid[int(p > 0.5)] for p in index_probs(queries , batch_size=batch_size , backend=backend)]
 
 def index_token(query:str):
     """
@@ -22,22 +201,7 @@ def index_token(query:str):
     returns:
         predicted token -> TEXT / IMAGE
     """
-
-    inp = tokenizer(text=query,
-                    truncation=True , 
-                    padding="max_length" , 
-                    max_length=128 , 
-                    return_tensors="pt"
-                    )
-    
-    with torch.no_grad():
-        out = model(**inp)
-
-    logits = out.logits
-    probs = torch.nn.functional.softmax(logits, dim=-1)
-    predicted_label = torch.argmax(probs, dim=1).item()
-
-    return labeltoid[predicted_label]
+    return index_tokens([query])[0]
 
 
 def progress_bar(func , *args , **kwargs):
@@ -279,7 +279,7 @@ def generate_embeddings(search_dir: str) -> Tuple[float, Tuple[int, int]]:
             
             # Save state with visual indicator
             progress.update(embedding_task, description="Saving index state...")
-            faiss_manager.save_state()
+            encoder.main_seq.save_state()
             progress.update(embedding_task, completed=100)
             time.sleep(0.3)  # Small delay for visual effect
             
@@ -336,6 +336,10 @@ def run_query_loop() -> None:
             console.print(f"\n[bold {ERROR_COLOR}]❌ Failed to initialize search index:[/bold {ERROR_COLOR}]")
             console.print_exception(show_locals=False)
             exit(1)
+
+    # the models load lazily , take the hit here instead of on the first query
+    with console.status("[bold blue]Loading models...", spinner="dots"):
+        query.warmup_models(console=console)
     
     # Query interface panel
     query_panel = Panel(
@@ -371,6 +375,7 @@ def run_query_loop() -> None:
             login_text.append("Enter", style=Style(color=GRADIENT_END, bold=True))
             login_text.append(" to continue", style="blue")
             console.print(login_text)
+            query.save_query_cache()
             break
         
         elif q.lower() == 'help':
@@ -381,11 +386,16 @@ def run_query_loop() -> None:
             help_table.add_row("exit", "Exit the Search Sphere application")
             help_table.add_row("help", "Display this help message")
             help_table.add_row("clear", "Clear the terminal screen")
+            help_table.add_row("stats", "Show p50/p95/p99 latency per query stage and cache hit rates")
             help_table.add_row("<query>", "Any other text will perform a semantic search")
             
             console.print(help_table)
             continue
             
+        elif q.lower() == 'stats':
+            query.print_query_stats(console=console)
+            continue
+
         elif q.lower() == 'clear':
             clear_screen()
             print_logo()
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # the managers keep their files under index/ of the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def random_vectors(count: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def metadatas(count: int, prefix: str = "file", start: int = 0) -> list:
+    return [{"file_name": f"{prefix}{i}.txt", "file_type": ".txt", "file_path": f"/corpus/{prefix}{i}.txt",
+             "creation_date": 0} for i in range(start, start + count)]
@@ -0,0 +1,66 @@
+import numpy as np
+
+from conftest import random_vectors
+from encoder.embedding_cache import EmbeddingCache
+
+DIM = 16
+
+
+def fill(cache, count, seed=0):
+    vectors = random_vectors(count, DIM, seed)
+    keys = [cache.key(f"hash{i}", "text") for i in range(count)]
+    for key, vector in zip(keys, vectors):
+        cache.put(key, vector)
+    return keys, vectors
+
+
+def test_round_trip_survives_reopen():
+    cache = EmbeddingCache("index/cache", model_id="m1", dim=DIM)
+    keys, vectors = fill(cache, 20)
+    cache.save()
+
+    reopened = EmbeddingCache("index/cache", model_id="m1", dim=DIM)
+    for key, vector in zip(keys, vectors):
+        assert np.allclose(reopened.get(key)[0], vector, atol=1e-3)
+    assert reopened.get(reopened.key("unknown", "text")) is None
+    assert (reopened.hits, reopened.misses) == (20, 1)
+
+
+def test_keys_depend_on_modality_and_model():
+    cache = EmbeddingCache("index/cache", model_id="m1", dim=DIM)
+    other = EmbeddingCache("index/other", model_id="m2", dim=DIM)
+    assert cache.key("h", "text") != cache.key("h", "image")
+    assert cache.key("h", "text") != other.key("h", "text")
+
+
+def test_eviction_keeps_recently_used_entries():
+    row_bytes = DIM * 2
+    cache = EmbeddingCache("index/cache", model_id="m1", dim=DIM, max_bytes=100 * row_bytes)
+    keys, vectors = fill(cache, 100)
+    # touch the first ten so they are the most recently used
+    for key in keys[:10]:
+        cache.get(key)
+    extra = cache.key("overflow", "text")
+    cache.put(extra, random_vectors(1, DIM, 9)[0])
+
+    assert cache.used == 80
+    assert len(cache.rows) == 80
+    assert cache.get(extra) is not None
+    for key, vector in zip(keys[:10], vectors[:10]):
+        assert np.allclose(cache.get(key)[0], vector, atol=1e-3)
+    # the least recently used ones went first
+    assert all(cache.get(key) is None for key in keys[10:31])
+
+
+def test_invalidate_and_model_change_empty_the_cache():
+    cache = EmbeddingCache("index/cache", model_id="m1", dim=DIM)
+    keys, _ = fill(cache, 5)
+    cache.invalidate()
+    assert cache.used == 0 and cache.get(keys[0]) is None
+
+    keys, _ = fill(cache, 5)
+    cache.save()
+    changed = EmbeddingCache("index/cache", model_id="m2", dim=DIM)
+    assert changed.used == 0 and changed.rows == {}
+    # the same model id still finds nothing after the other one wiped it
+    assert EmbeddingCache("index/cache", model_id="m1", dim=DIM).get(keys[0]) is None
@@ -0,0 +1,82 @@
+import numpy as np
+
+from conftest import metadatas, random_vectors
+from encoder.faiss_base import FAISSManagerHNSW
+
+
+def make_manager(count=300, dim=32):
+    manager = FAISSManagerHNSW(embedding_dim=dim)
+    vectors = random_vectors(count, dim)
+    manager.store_batch("text", vectors, metadatas(count))
+    manager.train_add()
+    return manager, vectors
+
+
+def top_id(manager, vector):
+    _, indices, _ = manager.search_text(vector, k=1)
+    return int(indices[0]) if len(indices) else None
+
+
+def test_ids_are_monotonic_across_types():
+    manager, _ = make_manager(100)
+    manager.store_batch("image", random_vectors(10, seed=1), metadatas(10, "img"))
+    manager.train_add()
+    assert manager.path_id("/corpus/file0.txt") == ("text", 0)
+    assert manager.path_id("/corpus/img0.txt") == ("image", 100)
+    assert manager.next_id == 110
+
+
+def test_remove_tombstones_and_hides_vectors():
+    manager, vectors = make_manager(100)
+    manager.compaction_threshold = 1.0
+    assert manager.remove_paths(["/corpus/file3.txt", "/corpus/missing.txt"]) == 1
+    assert manager.text_tombstones == {3}
+    assert manager.path_id("/corpus/file3.txt") is None
+    assert top_id(manager, vectors[3]) != 3
+    assert manager.current_size() == (99, 0)
+
+
+def test_compaction_keeps_ids_stable():
+    manager, vectors = make_manager(300)
+    manager.compaction_threshold = 1.0
+    removed = [f"/corpus/file{i}.txt" for i in range(0, 300, 2)]
+    manager.remove_paths(removed)
+    manager.compact("text", background=False)
+
+    assert manager.text_tombstones == set()
+    assert manager.text_index.ntotal == 150
+    for i in range(1, 300, 2):
+        assert top_id(manager, vectors[i]) == i
+    # new vectors continue the counter instead of reusing freed ids
+    manager.store_batch("text", random_vectors(1, seed=5), metadatas(1, "new"))
+    manager.train_add()
+    assert manager.path_id("/corpus/new0.txt") == ("text", 300)
+
+
+def test_background_compaction_replays_concurrent_adds():
+    manager, vectors = make_manager(300)
+    manager.compaction_threshold = 1.0
+    manager.remove_paths([f"/corpus/file{i}.txt" for i in range(100)])
+    manager.compact("text", background=True)
+    extra = random_vectors(50, seed=7)
+    manager.store_batch("text", extra, metadatas(50, "late"))
+    manager.train_add()
+    manager.remove_paths(["/corpus/file150.txt"])
+    manager.wait_for_compaction()
+
+    assert manager.current_size() == (249, 0)
+    for n in range(50):
+        assert top_id(manager, extra[n]) == 300 + n
+    assert top_id(manager, vectors[200]) == 200
+    assert top_id(manager, vectors[150]) != 150
+
+
+def test_update_path_replaces_the_vector():
+    manager, vectors = make_manager(50)
+    replacement = random_vectors(1, seed=9)
+    manager.update_path("/corpus/file7.txt", "text", replacement[0], metadatas(1, "file", 7)[0])
+    manager.train_add()
+    _, faiss_id = manager.path_id("/corpus/file7.txt")
+    assert faiss_id == 50 and 7 in manager.text_tombstones
+    assert top_id(manager, replacement[0]) == 50
+    assert np.isclose(manager.tombstone_ratio("text"), 1 / 51)
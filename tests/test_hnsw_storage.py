@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from conftest import metadatas, random_vectors
+from encoder.faiss_base import FAISSManagerHNSW
+
+DIM = 32
+
+
+def compressed_manager(storage, rerank):
+    manager = FAISSManagerHNSW(embedding_dim=DIM, storage=storage, subvector_count=8, nbit=4, rerank=rerank, ef_search=64)
+    vectors = random_vectors(500, DIM)
+    manager.store_batch("text", vectors, metadatas(500))
+    manager.train_add()
+    return manager, vectors
+
+
+def near_queries(vectors, count=20):
+    # stored vectors plus a little noise , the exact top-1 is well separated from the rest
+    rng = np.random.default_rng(7)
+    picked = rng.choice(len(vectors), count, replace=False)
+    queries = vectors[picked] + 0.05 * rng.standard_normal((count, DIM)).astype("float32")
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("storage", ["sq8", "pq"])
+def test_rerank_restores_the_exact_top1(storage):
+    manager, vectors = compressed_manager(storage, rerank=8)
+    queries = near_queries(vectors)
+    exact = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+
+    for query, row in zip(queries, exact):
+        dist, indices, meta = manager.search_text(query, k=5)
+        assert indices[0] == row.argmin()
+        # re-ranked distances come from the float32 vectors , not the codes
+        assert np.allclose(dist, row[indices], atol=1e-5)
+        assert list(dist) == sorted(dist)
+        assert meta[str(indices[0])]["file_path"] == f"/corpus/file{indices[0]}.txt"
+
+
+@pytest.mark.parametrize("storage", ["sq8", "pq"])
+def test_without_rerank_distances_are_approximate(storage):
+    manager, vectors = compressed_manager(storage, rerank=0)
+    queries = near_queries(vectors)
+    exact = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+
+    errors = []
+    for query, row in zip(queries, exact):
+        dist, indices, _ = manager.search_text(query, k=5)
+        errors.append(np.abs(dist - row[indices]).max())
+    assert max(errors) > 1e-4
+
+
+def test_rerank_skips_tombstoned_vectors():
+    manager, vectors = compressed_manager("pq", rerank=8)
+    queries = near_queries(vectors, 5)
+    nearest = [manager.search_text(query, k=1)[1][0] for query in queries]
+    manager.remove_paths([f"/corpus/file{i}.txt" for i in nearest])
+
+    for query, removed in zip(queries, nearest):
+        _, indices, _ = manager.search_text(query, k=5)
+        assert removed not in indices
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import encoder.main_seq as main_seq
+from conftest import random_vectors
+from encoder.faiss_base import FAISSManagerHNSW
+
+
+@pytest.fixture
+def indexer(workdir, monkeypatch):
+    encoded = []
+
+    def encode_texts(texts, batch_size=32):
+        encoded.extend(texts)
+        return random_vectors(len(texts), 512, seed=len(encoded))
+
+    monkeypatch.setattr(main_seq.embedding, "encode_texts", encode_texts)
+    monkeypatch.setattr(main_seq.embedding, "model_id", lambda: "test-model")
+    monkeypatch.setattr(main_seq, "faiss_manager", FAISSManagerHNSW(embedding_dim=512))
+    monkeypatch.setattr(main_seq, "embedding_cache", None)
+    return encoded
+
+
+def write_corpus(root):
+    # one text copied into three folders , and another one
+    paths = []
+    for folder in ("a", "b", "c"):
+        (root / folder).mkdir()
+        paths.append(root / folder / "report.txt")
+        paths[-1].write_text("quarterly report")
+    paths.append(root / "notes.txt")
+    paths[-1].write_text("meeting notes")
+    return [str(path) for path in paths]
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_copies_are_embedded_once(workdir, indexer, monkeypatch, use_cache):
+    monkeypatch.setattr(main_seq.config, "USE_EMBEDDING_CACHE", use_cache)
+    paths = write_corpus(workdir)
+    pending = main_seq.new_pending()
+    for path in paths:
+        main_seq.index_file(path, pending, file_info={"hash": main_seq.utils.file_hash(path), "create_time": 0})
+    main_seq.flush_pending(pending)
+
+    assert sorted(indexer) == ["meeting notes", "quarterly report"]
+    manager = main_seq.faiss_manager
+    stored = {meta["file_path"]: vector for meta, vector in zip(manager.text_temp_metadata, np.vstack(manager.text_temp))}
+    assert sorted(stored) == sorted(paths)
+    # every copy gets the vector of the one which was embedded
+    assert np.array_equal(stored[paths[0]], stored[paths[1]]) and np.array_equal(stored[paths[0]], stored[paths[2]])
+    assert not np.array_equal(stored[paths[0]], stored[paths[3]])
+    assert pending == main_seq.new_pending()
@@ -0,0 +1,88 @@
+import json
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from conftest import metadatas, random_vectors
+from encoder.faiss_base import FAISSManagerHNSW
+
+
+def saved_manager():
+    manager = FAISSManagerHNSW(embedding_dim=32)
+    manager.store_batch("text", random_vectors(200), metadatas(200))
+    manager.store_batch("image", random_vectors(40, seed=1), metadatas(40, "img"))
+    manager.train_add()
+    manager.remove_paths(["/corpus/file5.txt"])
+    manager.save_state()
+    return manager
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_loaded_index_returns_the_same_results(mmap):
+    manager = saved_manager()
+    queries = random_vectors(20, seed=3)
+    expected = [manager.search_text(query, k=5) for query in queries]
+
+    loaded = FAISSManagerHNSW(embedding_dim=32)
+    assert loaded.load_state(mmap=mmap)
+    assert loaded.read_only == mmap
+    assert loaded.current_size() == manager.current_size() == (199, 40)
+    assert loaded.next_id == 240 and loaded.text_tombstones == {5}
+    for query, (dist, indices, meta) in zip(queries, expected):
+        got_dist, got_indices, got_meta = loaded.search_text(query, k=5)
+        assert got_indices.tolist() == indices.tolist()
+        assert np.allclose(got_dist, dist)
+        assert got_meta == meta
+
+
+def test_mmap_loaded_index_is_read_only():
+    saved_manager()
+    loaded = FAISSManagerHNSW(embedding_dim=32)
+    loaded.load_state(mmap=True)
+    for change in (lambda: loaded.store_batch("text", random_vectors(1), metadatas(1, "new")),
+                   lambda: loaded.remove_paths(["/corpus/file1.txt"]),
+                   loaded.save_state):
+        with pytest.raises(Exception, match="read only"):
+            change()
+    assert loaded.path_id("/corpus/file1.txt") == ("text", 1)
+
+
+def test_load_without_saved_index():
+    assert not FAISSManagerHNSW(embedding_dim=32).load_state()
+
+
+def write_legacy_state(text_vectors, image_vectors):
+    # plain HNSW graphs (ids = positions , both from 0) with JSON sidecars , as saved before ids were explicit
+    os.makedirs("index")
+    for type, vectors in (("text", text_vectors), ("image", image_vectors)):
+        index = faiss.IndexHNSWFlat(vectors.shape[1], 32)
+        index.add(vectors)
+        faiss.write_index(index, f"index/{type}_index.index")
+        sidecar = {str(i): {**meta, "creation_date": "2024-01-02 03:04:05"}
+                   for i, meta in enumerate(metadatas(len(vectors), type))}
+        with open(f"index/{type}_meta.json", "w") as file:
+            json.dump(sidecar, file)
+
+
+def test_legacy_index_keeps_every_file_of_both_sides():
+    text_vectors, image_vectors = random_vectors(3), random_vectors(2, seed=1)
+    write_legacy_state(text_vectors, image_vectors)
+
+    loaded = FAISSManagerHNSW(embedding_dim=32)
+    assert loaded.load_state()
+    assert loaded.current_size() == (3, 2)
+    assert loaded.text_tombstones == set() and loaded.image_tombstones == set()
+    assert loaded.next_id == 5
+    # image ids follow the text ones
+    for i in range(3):
+        assert loaded.path_id(f"/corpus/text{i}.txt") == ("text", i)
+    for i in range(2):
+        assert loaded.path_id(f"/corpus/image{i}.txt") == ("image", 3 + i)
+        _, indices, meta = loaded.search_image(image_vectors[i], k=1)
+        assert indices[0] == 3 + i and meta[str(3 + i)]["file_path"] == f"/corpus/image{i}.txt"
+    _, indices, meta = loaded.search_text(text_vectors[2], k=1)
+    assert indices[0] == 2 and meta["2"]["file_path"] == "/corpus/text2.txt"
+    # sidecar dates are stored as timestamps , like the ones of new files
+    assert isinstance(meta["2"]["creation_date"], int)
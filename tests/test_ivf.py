@@ -0,0 +1,107 @@
+import faiss
+import numpy as np
+import pytest
+
+from conftest import metadatas, random_vectors
+from encoder.faiss_base import FAISSManagerHNSW, FAISSManagerIVF
+
+DIM = 32
+
+
+def ivf_manager(**kwargs):
+    kwargs = {"embedding_dim": DIM, "sub_vector_count": 8, "nbit": 4, "n_cluster": 16, "train_size": 1000,
+              "train_sample": 500, **kwargs}
+    return FAISSManagerIVF(**kwargs)
+
+
+def ivf_of(manager, type="text"):
+    return faiss.downcast_index(faiss.extract_index_ivf(manager._parts(type)[0]))
+
+
+def test_new_indexes_skip_polysemous_training():
+    manager = ivf_manager()
+    assert not ivf_of(manager).do_polysemous_training
+    manager.store_batch("text", random_vectors(1000), metadatas(1000))
+    assert not ivf_of(manager).do_polysemous_training
+
+
+def test_trains_on_the_first_vectors_then_streams_adds():
+    manager = ivf_manager()
+    vectors = random_vectors(2200)
+    manager.store_batch("text", vectors[:400], metadatas(400))
+    manager.store_batch("text", vectors[400:800], metadatas(400, start=400))
+    # buffered until train_size vectors arrived
+    assert not manager.text_index.is_trained and manager.text_index.ntotal == 0
+
+    manager.store_batch("text", vectors[800:1200], metadatas(400, start=800))
+    ivf = ivf_of(manager)
+    assert ivf.is_trained and ivf.ntotal == 1200
+    assert manager.trained_on["text"] == 500
+    # 39 training points per list
+    assert ivf.nlist == 500 // 39
+    centroids = ivf.quantizer.reconstruct_n(0, ivf.nlist)
+    codebooks = faiss.vector_to_array(ivf.pq.centroids)
+
+    manager.store_batch("text", vectors[1200:], metadatas(1000, start=1200))
+    ivf = ivf_of(manager)
+    assert ivf.ntotal == 2200 and manager.trained_on["text"] == 500
+    assert np.array_equal(ivf.quantizer.reconstruct_n(0, ivf.nlist), centroids)
+    assert np.array_equal(faiss.vector_to_array(ivf.pq.centroids), codebooks)
+
+    # streamed vectors are searchable , every list visited
+    for i in (1300, 2100):
+        _, indices, meta = manager.search_text(vectors[i], k=10, nprobe=ivf.nlist)
+        assert i in indices
+        assert meta[str(i)]["file_path"] == f"/corpus/file{i}.txt"
+
+
+def test_training_sample_is_drawn_from_the_whole_buffer():
+    manager = ivf_manager()
+    # the first and the second half of the buffer lie in opposite corners
+    vectors = random_vectors(1000) * 0.1
+    vectors[:500, 0] += 1
+    vectors[500:, 0] -= 1
+    manager.store_batch("text", vectors, metadatas(1000))
+    assert manager.trained_on["text"] == 500
+
+    ivf = ivf_of(manager)
+    centroids = ivf.quantizer.reconstruct_n(0, ivf.nlist)
+    assert (centroids[:, 0] > 0.5).any() and (centroids[:, 0] < -0.5).any()
+
+
+def test_small_corpus_is_trained_by_train_add():
+    manager = ivf_manager()
+    manager.store_batch("text", random_vectors(100), metadatas(100))
+    manager.train_add()
+    assert manager.text_index.is_trained and manager.text_index.ntotal == 100
+    assert ivf_of(manager).nlist == 100 // 39
+
+
+@pytest.mark.parametrize("replaced", ["text", "image"])
+def test_load_state_rejects_either_foreign_index(replaced):
+    manager = ivf_manager()
+    manager.store_batch("text", random_vectors(200), metadatas(200))
+    manager.store_batch("image", random_vectors(200, seed=1), metadatas(200, "img"))
+    manager.train_add()
+    manager.save_state()
+    assert ivf_manager().load_state()
+
+    hnsw = FAISSManagerHNSW(embedding_dim=DIM)
+    faiss.write_index(hnsw._parts(replaced)[0], f"index/{replaced}_index.index")
+    assert not ivf_manager().load_state()
+
+
+def test_too_few_vectors_stay_buffered_until_the_codebooks_can_be_trained():
+    # 2^4 points per PQ codebook
+    manager = ivf_manager()
+    vectors = random_vectors(20)
+    manager.store_batch("text", vectors[:10], metadatas(10))
+    manager.train_add()
+    assert not manager.text_index.is_trained and manager.text_index.ntotal == 0
+    assert len(manager.text_temp_metadata) == 10 and manager.path_id("/corpus/file0.txt") is None
+
+    manager.store_batch("text", vectors[10:], metadatas(10, start=10))
+    manager.train_add()
+    assert manager.text_index.is_trained and manager.text_index.ntotal == 20
+    assert manager.trained_on["text"] == 20 and manager.text_temp_metadata == []
+    assert manager.path_id("/corpus/file0.txt") == ("text", 0)
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from conftest import metadatas
+from encoder.metadata_store import MetadataStore
+
+
+def filled_store(count=5):
+    store = MetadataStore()
+    store.add("text", range(count), metadatas(count))
+    store.add("image", [100], metadatas(1, "img"))
+    return store
+
+
+def test_add_get_lookup():
+    store = filled_store()
+    found = store.get_many([0, 4, 100, 999])
+    assert set(found) == {0, 4, 100}
+    assert found[4] == metadatas(5)[4]
+    assert store.lookup("/corpus/file2.txt") == ("text", 2)
+    assert store.lookup("/corpus/nope.txt") is None
+    assert store.ids("text").tolist() == [0, 1, 2, 3, 4]
+    assert store.count("image") == 1
+
+
+def test_get_many_beyond_the_parameter_limit():
+    store = MetadataStore()
+    store.add("text", range(2500), metadatas(2500))
+    assert len(store.get_many(range(2500))) == 2500
+
+
+def test_pop_paths_returns_removed_ids():
+    store = filled_store()
+    removed = store.pop_paths(["/corpus/file1.txt", "/corpus/img0.txt", "/corpus/nope.txt"])
+    assert sorted(removed) == [("image", 100), ("text", 1)]
+    assert store.get_many([1, 100]) == {}
+
+
+def test_only_saved_changes_survive():
+    store = filled_store()
+    store.save()
+    store.add("text", [5], metadatas(1, "file", 5))
+
+    reopened = MetadataStore()
+    assert reopened.load()
+    assert reopened.count("text") == 5
+    store.save()
+    assert reopened.count("text") == 6
+
+
+def test_read_only_store_rejects_writes():
+    filled_store().save()
+    store = MetadataStore()
+    assert store.load(read_only=True)
+    assert store.get_many([0])[0]["file_name"] == "file0.txt"
+    with pytest.raises(sqlite3.OperationalError):
+        store.add("text", [7], metadatas(1))
+
+
+def test_load_without_a_saved_store():
+    assert not MetadataStore().load()
+
+
+def test_import_json(workdir):
+    path = workdir / "text_meta.json"
+    path.write_text(json.dumps({"3": metadatas(1)[0], "8": metadatas(1, "x")[0]}))
+    store = MetadataStore()
+    store.import_json("text", str(path))
+    assert store.lookup("/corpus/x0.txt") == ("text", 8)
+
+
+def test_import_json_converts_sidecar_dates(workdir):
+    path = workdir / "image_meta.json"
+    old = [{**meta, "creation_date": date} for meta, date in
+           zip(metadatas(3), ["2024-01-02 03:04:05", "not a date", None])]
+    path.write_text(json.dumps({str(i): meta for i, meta in enumerate(old)}))
+    store = MetadataStore()
+    store.import_json("image", str(path))
+    dates = [meta["creation_date"] for _, meta in sorted(store.get_many([0, 1, 2]).items())]
+    assert dates == [int(datetime(2024, 1, 2, 3, 4, 5).timestamp()), None, None]
@@ -0,0 +1,40 @@
+import json
+import os
+import threading
+
+from encoder.metrics import Metrics
+
+
+def test_threads_reporting_together_dump_one_at_a_time():
+    # the writer thread and the main thread of the pipeline both report , every add is due for a dump
+    metrics = Metrics(enabled=True, interval=1e-9)
+    errors = []
+
+    def report(stage):
+        try:
+            for _ in range(200):
+                metrics.add(stage, 0.001)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=report, args=(stage,)) for stage in ("write", "embed_text", "extract")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    metrics.dump()
+    assert sorted(os.listdir("index/metrics")) == ["index_metrics.json", "index_metrics.prom"]
+    with open("index/metrics/index_metrics.json") as file:
+        stages = json.load(file)["stages"]
+    assert {stage: values["items"] for stage, values in stages.items()} == {"write": 200, "embed_text": 200, "extract": 200}
+
+
+def test_maybe_dump_skips_while_another_thread_dumps():
+    metrics = Metrics(enabled=True, interval=1e-9)
+    with metrics._dump_lock:
+        metrics.add("write", 0.001)
+    assert not os.path.exists("index/metrics")
+    metrics.add("write", 0.001)
+    assert os.path.exists("index/metrics/index_metrics.json")
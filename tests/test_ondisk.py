@@ -0,0 +1,92 @@
+import glob
+
+import faiss
+import numpy as np
+
+from conftest import metadatas, random_vectors
+from encoder.faiss_base import FAISSManagerOnDisk
+
+DIM = 32
+
+
+def ondisk_manager(**kwargs):
+    kwargs = {"embedding_dim": DIM, "sub_vector_count": 8, "nbit": 4, "n_cluster": 16, "train_size": 1000,
+              "train_sample": 500, "shard_size": 300, **kwargs}
+    return FAISSManagerOnDisk(**kwargs)
+
+
+def files():
+    return sorted(glob.glob("index/*.ivfdata") + glob.glob("index/shards/*.index"))
+
+
+def fill(manager, vectors):
+    manager.store_batch("text", vectors[:1000], metadatas(1000))
+    manager.store_batch("text", vectors[1000:], metadatas(len(vectors) - 1000, start=1000))
+    manager.store_batch("image", random_vectors(100, DIM, seed=1), metadatas(100, "img"))
+    manager.train_add()
+
+
+def test_shards_are_written_and_merged_on_save():
+    manager = ondisk_manager()
+    vectors = random_vectors(1400, DIM)
+    fill(manager, vectors)
+    assert not faiss.downcast_index(faiss.extract_index_ivf(manager.text_index)).do_polysemous_training
+    # one shard per add , written once it holds shard_size vectors
+    assert files() == ["index/shards/text_1.index", "index/shards/text_2.index"]
+    nlist = faiss.extract_index_ivf(manager.text_index).nlist
+    before = [manager.search_text(vectors[i], k=10, nprobe=nlist) for i in (5, 1200)]
+
+    manager.save_state()
+    assert files() == ["index/image_lists.1.ivfdata", "index/text_lists.1.ivfdata"]
+    assert manager.shards["text"] == [] and manager.current_size() == (1400, 100)
+    for i, (dist, indices, _) in zip((5, 1200), before):
+        got_dist, got_indices, _ = manager.search_text(vectors[i], k=10, nprobe=nlist)
+        assert np.array_equal(got_indices, indices)
+        assert np.allclose(got_dist, dist)
+
+
+def test_merge_drops_tombstones_and_deletes_the_old_lists():
+    manager = ondisk_manager()
+    vectors = random_vectors(1400, DIM)
+    fill(manager, vectors)
+    manager.save_state()
+
+    manager.store_batch("text", random_vectors(400, DIM, seed=2), metadatas(400, "new"))
+    manager.train_add()
+    manager.remove_paths([f"/corpus/file{i}.txt" for i in range(50)])
+    assert "index/shards/text_3.index" in files()
+    manager.save_state()
+
+    # the merge wrote text_lists.2 , the old lists file and the shard are gone
+    assert files() == ["index/image_lists.1.ivfdata", "index/text_lists.2.ivfdata"]
+    assert manager.text_tombstones == set() and manager.text_index.ntotal == 1750
+    nlist = faiss.extract_index_ivf(manager.text_index).nlist
+    _, indices, _ = manager.search_text(vectors[3], k=20, nprobe=nlist)
+    assert not set(indices.tolist()) & set(range(50))
+
+    loaded = ondisk_manager()
+    assert loaded.load_state()
+    assert loaded.current_size() == (1750, 100)
+    assert np.array_equal(loaded.search_text(vectors[3], k=20, nprobe=nlist)[1], indices)
+
+
+def test_files_of_an_unsaved_run_are_deleted():
+    manager = ondisk_manager()
+    fill(manager, random_vectors(1400, DIM))
+    manager.save_state()
+
+    # shards written by a run which never saved
+    abandoned = ondisk_manager()
+    assert abandoned.load_state()
+    abandoned.store_batch("text", random_vectors(400, DIM, seed=3), metadatas(400, "lost"))
+    abandoned.train_add()
+    assert len(glob.glob("index/shards/*.index")) == 1
+    # the process dies , its uncommitted metadata is rolled back
+    abandoned.metadata.conn.close()
+
+    resumed = ondisk_manager()
+    assert resumed.load_state()
+    resumed.remove_paths(["/corpus/file7.txt"])
+    resumed.save_state()
+    assert glob.glob("index/shards/*.index") == []
+    assert resumed.current_size() == (1399, 100)
@@ -0,0 +1,36 @@
+import pytest
+
+from query import tracing
+
+
+def test_batch_stages_are_shared_evenly():
+    stats = tracing.QueryStats()
+    with tracing.batch_trace(["a", "b", "c", "d"], stats) as batch:
+        tracing.add_timings({"text_encoder": 0.004, "faiss_search": 0.002})
+        for n in range(4):
+            with tracing.query(n):
+                tracing.cache("results", n % 2 == 0)
+
+    assert [t["query"] for t in stats.traces] == ["a", "b", "c", "d"]
+    for n, query_trace in enumerate(stats.traces):
+        assert query_trace["stages_ms"]["text_encoder"] == pytest.approx(1.0)
+        assert query_trace["stages_ms"]["faiss_search"] == pytest.approx(0.5)
+        assert query_trace["stages_ms"]["total"] == pytest.approx(batch.stages["total"] / 4)
+        assert query_trace["cache"] == {"results": "hit" if n % 2 == 0 else "miss"}
+    assert stats.summary()["cache"]["results"]["hit_rate"] == 0.5
+
+
+def test_batch_error_is_recorded_for_every_query():
+    stats = tracing.QueryStats()
+    with pytest.raises(ValueError):
+        with tracing.batch_trace(["a", "b"], stats):
+            raise ValueError("boom")
+    assert [t["error"] for t in stats.traces] == ["ValueError: boom"] * 2
+
+
+def test_query_is_a_no_op_outside_of_a_batch():
+    with tracing.query(3):
+        assert tracing.current() is None
+    with tracing.trace("single", tracing.QueryStats()) as query_trace:
+        with tracing.query(0):
+            assert tracing.current() is query_trace
@@ -0,0 +1,30 @@
+import os
+
+from encoder import utils
+
+
+def test_stored_file_hash_reads_the_file_once(workdir, monkeypatch):
+    path = workdir / "weights.pt"
+    path.write_bytes(b"weights" * 1000)
+    expected = utils.file_hash(path)
+
+    calls = []
+    real_hash = utils.file_hash
+    monkeypatch.setattr(utils, "file_hash", lambda file_path: calls.append(file_path) or real_hash(file_path))
+    assert utils.stored_file_hash(path) == expected
+    assert utils.stored_file_hash(path) == expected
+    assert len(calls) == 1
+
+    # new content (size / mtime change) is hashed again
+    path.write_bytes(b"other weights")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert utils.stored_file_hash(path) == real_hash(path) != expected
+    assert len(calls) == 2
+
+
+def test_stored_file_hash_ignores_a_broken_hash_file(workdir):
+    path = workdir / "weights.pt"
+    path.write_bytes(b"weights")
+    (workdir / "weights.pt.hash").write_text("not json")
+    assert utils.stored_file_hash(path) == utils.file_hash(path)